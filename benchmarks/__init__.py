@@ -0,0 +1 @@
+"""Offline benchmarks, see `python -m benchmarks.run --help`"""
@@ -0,0 +1,281 @@
+"""Offline stand-ins for Spotify, YouTube Music and yt-dlp, built on recorded responses"""
+
+import base64
+import copy
+import hashlib
+import json
+import os
+import pathlib
+import re
+import sys
+import time
+import types
+from functools import cache
+
+RECORDED = pathlib.Path(__file__).parent / "recorded"
+
+# The recorded YouTube Music results were searched for this track
+RECORDED_TITLE = "Espresso"
+RECORDED_ARTIST = "Sabrina Carpenter"
+RECORDED_DURATION_SECONDS = 176
+
+
+@cache
+def recorded(name: str) -> dict:
+    """
+    Load a recorded response file
+
+    Args:
+        name (str): The file name, without extension
+
+    Returns:
+        dict: The recorded responses
+    """
+    with open(RECORDED / f"{name}.json", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def playlist_item(position: int) -> dict:
+    """
+    Build an item of a playlist of any size from the recorded page
+
+    Every position gets a distinct title ending in the position, so no track
+    is dropped as a duplicate and searches can be mapped back to the track.
+
+    Args:
+        position (int): The position of the item in the playlist
+
+    Returns:
+        dict: The playlist item
+    """
+    sample = recorded("spotify")["playlist_items"]["items"]
+    item = copy.deepcopy(sample[position % len(sample)])
+    item["track"]["name"] = f"{item['track']['name']} {position}"
+    item["added_at"] = (
+        f"2024-03-01T{position // 3600 % 24:02d}:"
+        f"{position // 60 % 60:02d}:{position % 60:02d}Z"
+    )
+    return item
+
+
+def playlist_items(total: int, offset: int = 0) -> list[dict]:
+    """
+    Build consecutive items of a playlist
+
+    Args:
+        total (int): The number of items
+        offset (int): The position of the first item
+
+    Returns:
+        list[dict]: The playlist items
+    """
+    return [playlist_item(position) for position in range(offset, offset + total)]
+
+
+def video_id(recorded_id: str, title: str) -> str:
+    """
+    Derive an 11-character video ID for a track from a recorded one
+    """
+    digest = hashlib.blake2b(f"{recorded_id} {title}".encode(), digest_size=8)
+    return base64.urlsafe_b64encode(digest.digest()).decode()[:11]
+
+
+def search_results(
+    artist: str, title: str, duration_ms: int | None, kind: str = "songs"
+) -> list[dict]:
+    """
+    Build YouTube Music search results for a track from the recorded ones
+
+    The recorded results keep their shape, spelling variants and duration
+    offsets, with the recorded track replaced by the given one. Video IDs are
+    derived from the title, so every track has videos of its own.
+
+    Args:
+        artist (str): The artist of the track
+        title (str): The title of the track
+        duration_ms (int | None): The duration of the track
+        kind (str): "songs" or "top_result"
+
+    Returns:
+        list[dict]: The search results
+    """
+    seconds = (duration_ms or RECORDED_DURATION_SECONDS * 1000) // 1000
+    results = copy.deepcopy(recorded("ytmusic")[kind])
+    for result in results:
+        result["title"] = result["title"].replace(RECORDED_TITLE, title)
+        result["videoId"] = video_id(result["videoId"], title)
+        for result_artist in result["artists"]:
+            if result_artist["name"] == RECORDED_ARTIST:
+                result_artist["name"] = artist.split(", ")[0]
+        offset = result["duration_seconds"] - RECORDED_DURATION_SECONDS
+        result["duration_seconds"] = seconds + offset
+        result["duration"] = f"{(seconds + offset) // 60}:{(seconds + offset) % 60:02d}"
+    return results
+
+
+def track_for_query(query: str) -> tuple[str, str, int] | None:
+    """
+    Find the generated playlist track a search query was built from
+
+    Both the downloader's "artist title" query and its lowercase title query
+    end with the position of the track in the generated playlist.
+
+    Args:
+        query (str): The search query
+
+    Returns:
+        tuple[str, str, int] | None: The artist, title and duration of the track
+    """
+    match = re.search(r"(\d+)$", query.strip())
+    if match is None:
+        return None
+    track = playlist_item(int(match.group(1)))["track"]
+    if track["name"].lower() not in query.lower():
+        return None
+    artist = ", ".join(artist["name"] for artist in track["artists"])
+    return artist, track["name"], track["duration_ms"]
+
+
+class FakeSpotify:
+    """
+    Serves the Spotify endpoints used by `SpotifyHandler` from recorded responses
+    """
+
+    def __init__(self, playlist_size: int = 10000, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self._items = playlist_items(playlist_size)
+
+    def _respond(self, response):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return copy.deepcopy(response)
+
+    def artist(self, link):
+        return self._respond(recorded("spotify")["artist"])
+
+    def artist_top_tracks(self, link):
+        return self._respond({"tracks": [recorded("spotify")["track"]]})
+
+    def artist_albums(self, link, include_groups=None, limit=20, offset=0):
+        return self._respond(recorded("spotify")["artist_albums"])
+
+    def album(self, album_id):
+        return self._respond(recorded("spotify")["album"])
+
+    def album_tracks(self, album_id):
+        return self._respond(recorded("spotify")["album_tracks"])
+
+    def track(self, link):
+        return self._respond(recorded("spotify")["track"])
+
+    def playlist(self, link):
+        playlist = dict(recorded("spotify")["playlist"])
+        playlist["tracks"] = {"total": len(self._items)}
+        return self._respond(playlist)
+
+    def playlist_items(self, link, fields=None, limit=100, offset=0):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return {"items": self._items[offset : offset + limit]}
+
+
+class FakeYTMusic:
+    """
+    Answers YouTube Music searches for known tracks from recorded results
+
+    Unknown queries get the recorded results unchanged, which match nothing.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self._catalog: dict[tuple[str, str | None], list[dict]] = {}
+
+    def register(self, artist: str, title: str, duration_ms: int | None = None):
+        """
+        Make a track findable, with both the song and top result queries
+        """
+        self._catalog[(f"{artist} {title}", "songs")] = search_results(
+            artist, title, duration_ms
+        )
+        self._catalog[(title.lower(), None)] = search_results(
+            artist, title, duration_ms, "top_result"
+        )
+
+    def search(self, query, filter=None, limit=20, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        results = self._catalog.get((query, filter))
+        if results is None:
+            results = recorded("ytmusic")["songs" if filter else "top_result"]
+        return results[:limit]
+
+
+class StubYoutubeDL:
+    """
+    Stands in for `yt_dlp.YoutubeDL`, writing a synthetic file per download
+
+    Progress and post-processor hooks are called like yt-dlp does, so the
+    downloader's metrics and tracing run as in production.
+    """
+
+    size = 256 * 1024
+    transfer_seconds = 0.0
+    progress_steps = 1
+
+    def __init__(self, params: dict):
+        self.params = params
+
+    def download(self, urls: list[str]):
+        for _ in urls:
+            for step in range(1, self.progress_steps + 1):
+                for hook in self.params.get("progress_hooks", []):
+                    hook(
+                        {
+                            "status": "downloading",
+                            "_percent_str": f"{100 * step / (self.progress_steps + 1):.1f}%",
+                            "_total_bytes_str": f"{self.size}B",
+                            "_speed_str": "1MiB/s",
+                        }
+                    )
+                if self.transfer_seconds:
+                    time.sleep(self.transfer_seconds / self.progress_steps)
+            path = os.path.join(
+                self.params["paths"]["home"], self.params["outtmpl"] % {"ext": "mp3"}
+            )
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"\0" * self.size)
+            for hook in self.params.get("progress_hooks", []):
+                hook(
+                    {
+                        "status": "finished",
+                        "elapsed": self.transfer_seconds or 1e-3,
+                        "total_bytes": self.size,
+                    }
+                )
+            for postprocessor in ("ExtractAudio", "EmbedThumbnail", "Metadata"):
+                for hook in self.params.get("postprocessor_hooks", []):
+                    hook({"status": "started", "postprocessor": postprocessor})
+                    hook({"status": "finished", "postprocessor": postprocessor})
+        return 0
+
+
+def install(ytmusic: FakeYTMusic | None = None):
+    """
+    Replace `yt_dlp`, and `ytmusicapi` if a fake is given, for this process
+
+    Args:
+        ytmusic (FakeYTMusic | None): The YouTube Music fake every `YTMusic()` returns
+    """
+    yt_dlp = types.ModuleType("yt_dlp")
+    yt_dlp.YoutubeDL = StubYoutubeDL  # type: ignore[attr-defined]
+    sys.modules["yt_dlp"] = yt_dlp
+    if ytmusic is not None:
+        ytmusicapi = types.ModuleType("ytmusicapi")
+        ytmusicapi.YTMusic = lambda *args, **kwargs: ytmusic  # type: ignore[attr-defined]
+        sys.modules["ytmusicapi"] = ytmusicapi
@@ -0,0 +1,41 @@
+"""
+SpotTube with the stub yt-dlp, as the server of socket.io load tests
+
+Downloads write synthetic files and report progress in steps, so the
+broadcast path sees the same updates as real downloads, without network.
+Set STANDIN_URL to resolve tracks against the stand-in server.
+
+Examples:
+    $ gunicorn benchmarks.loadapp:app -c gunicorn_config.py
+    $ python -m benchmarks.loadapp --port 5050
+"""
+
+if __name__ == "__main__":
+    from gevent import monkey  # type: ignore
+
+    monkey.patch_all()
+
+import argparse
+import os
+
+from benchmarks import fakes
+
+fakes.StubYoutubeDL.transfer_seconds = float(
+    os.environ.get("LOADTEST_TRANSFER_SECONDS", 2.0)
+)
+fakes.StubYoutubeDL.progress_steps = int(os.environ.get("LOADTEST_PROGRESS_STEPS", 10))
+fakes.install()
+
+from src.SpotTube import app, socketio  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run SpotTube with the stub yt-dlp")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5050)
+    args = parser.parse_args()
+    socketio.run(app, host=args.host, port=args.port, allow_unsafe_werkzeug=True)
+
+
+if __name__ == "__main__":
+    main()
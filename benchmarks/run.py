@@ -0,0 +1,422 @@
+"""
+Offline benchmarks of extraction, matching, broadcasting and the download pipeline
+
+Spotify, YouTube Music and yt-dlp are replaced by the fakes in
+`benchmarks.fakes`, so runs need no network and no credentials.
+
+Examples:
+    $ python -m benchmarks.run --output bench.json
+    $ python -m benchmarks.run --quick --baseline bench.json
+"""
+
+import argparse
+import contextlib
+import json
+import pathlib
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+
+from loguru import logger
+
+import src
+from benchmarks import fakes
+from src import db
+from src.aliases import Aliases
+from src.config import get_config
+from src.data import DataHandler
+from src.downloader import Downloader
+from src.resolver import ResolutionEngine
+from src.spotify import SpotifyHandler, Track
+from src.status import DownloadStatus
+from src.utils import contains_ignored_keywords, string_cleaner
+
+BENCHMARKS: dict[str, Callable[[argparse.Namespace], list[dict]]] = {}
+
+
+def benchmark(fn: Callable[[argparse.Namespace], list[dict]]):
+    """
+    Register a benchmark
+    """
+    BENCHMARKS[fn.__name__.removeprefix("bench_")] = fn
+    return fn
+
+
+def measure(name: str, fn: Callable[[], object], ops: int, repeat: int = 3, **extra):
+    """
+    Time a function, keeping the best of a few runs
+
+    Args:
+        name (str): The name of the result
+        fn (Callable[[], object]): Runs `ops` operations
+        ops (int): The number of operations in one call of `fn`
+        repeat (int): The number of runs
+        **extra: Additional fields of the result
+
+    Returns:
+        dict: The result
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    result = {
+        "name": name,
+        "ops": ops,
+        "seconds": best,
+        "us_per_op": best / ops * 1e6,
+        "ops_per_second": ops / best if best else None,
+        **extra,
+    }
+    logger.info(f"{name}: {result['us_per_op']:.1f} us/op ({ops} ops in {best:.3f}s)")
+    return result
+
+
+def make_tracks(count: int, folder: str = "Bench") -> list[Track]:
+    """
+    Build queued tracks from the recorded playlist
+    """
+    return [
+        Track(
+            artist=", ".join(a["name"] for a in item["track"]["artists"]),
+            title=item["track"]["name"],
+            folder=folder,
+            status=DownloadStatus.QUEUED,
+            album=item["track"]["album"]["name"],
+            duration_ms=item["track"]["duration_ms"],
+        )
+        for item in fakes.playlist_items(count)
+    ]
+
+
+def make_aliases() -> Aliases:
+    """
+    Get aliases backed by a throwaway database
+    """
+    database = tempfile.NamedTemporaryFile(suffix=".sqlite", delete=False)
+    db.configure(database.name)
+    with open(pathlib.Path(src.__file__).parent / "schema.sql", encoding="utf-8") as f:
+        schema = f.read()
+    with db.get_pool().transaction() as conn:
+        conn.executescript(schema)
+    return Aliases()
+
+
+@benchmark
+def bench_extraction(args: argparse.Namespace) -> list[dict]:
+    """
+    Throughput of `spotify_extractor` on a large playlist
+    """
+    results = []
+    for latency in (0.0, 0.02):
+        spotify = fakes.FakeSpotify(args.playlist_size, latency=latency)
+
+        def extract():
+            handler = SpotifyHandler(ResolutionEngine(get_config().resolve_concurrency))
+            handler._sp = spotify
+            handler._sp_credentials = (
+                handler.config.spotify_client_id,
+                handler.config.spotify_client_secret,
+            )
+            tracks = handler.spotify_extractor(
+                "https://open.spotify.com/playlist/bench"
+            )
+            assert len(tracks) == args.playlist_size
+
+        results.append(
+            measure(
+                f"extract_playlist_latency_{int(latency * 1000)}ms",
+                extract,
+                args.playlist_size,
+                repeat=1 if latency else 3,
+                unit="track",
+            )
+        )
+    return results
+
+
+@benchmark
+def bench_matching(args: argparse.Namespace) -> list[dict]:
+    """
+    Per-call cost of the matcher functions
+    """
+    downloader = Downloader(make_aliases())
+    downloader.search_cache.max_entries = 0
+    tracks = make_tracks(args.iterations)
+    candidates = [
+        fakes.search_results(t.artist, t.title, t.duration_ms) for t in tracks
+    ]
+    top_results = [
+        fakes.search_results(t.artist, t.title, t.duration_ms, "top_result")[0]
+        for t in tracks
+    ]
+    cleaned = [
+        (downloader._clean_artist_name(t.artist), string_cleaner(t.title).lower())
+        for t in tracks
+    ]
+    ytmusic = fakes.FakeYTMusic()
+    for track in tracks:
+        ytmusic.register(track.artist, track.title, track.duration_ms)
+    fakes.install(ytmusic)
+
+    def rank():
+        for results, (artist, title), track in zip(candidates, cleaned, tracks):
+            downloader._rank_candidates(results, artist, title, track.duration_ms)
+
+    def evaluate_top():
+        for result, (artist, title), track in zip(top_results, cleaned, tracks):
+            downloader._evaluate_top_result(result, artist, title, track.duration_ms)
+
+    def find_link():
+        for track in tracks:
+            assert downloader._find_youtube_link(track)
+
+    return [
+        measure("rank_candidates", rank, len(tracks), unit="track"),
+        measure("evaluate_top_result", evaluate_top, len(tracks), unit="track"),
+        measure("find_youtube_link", find_link, len(tracks), unit="track"),
+    ]
+
+
+@benchmark
+def bench_strings(args: argparse.Namespace) -> list[dict]:
+    """
+    Per-call cost of `string_cleaner` and `contains_ignored_keywords`
+    """
+    titles = [t.title for t in make_tracks(args.iterations)]
+
+    def clean_cold():
+        string_cleaner.cache_clear()
+        for title in titles:
+            string_cleaner(title)
+
+    def clean_warm():
+        for title in titles:
+            string_cleaner(title)
+
+    results = [
+        measure("string_cleaner_cold", clean_cold, len(titles), unit="call"),
+        measure("string_cleaner_warm", clean_warm, len(titles), unit="call"),
+    ]
+
+    config = get_config()
+    keywords = config.ignored_keywords
+    config.ignored_keywords = ["BGM", "純音樂", "純音樂伴奏", "配樂", "Karaoke"]
+    try:
+        contains_ignored_keywords(titles[0])
+    except ImportError as e:
+        results.append({"name": "contains_ignored_keywords", "skipped": str(e)})
+    else:
+
+        def ignored():
+            for title in titles:
+                contains_ignored_keywords(title)
+
+        results.append(
+            measure("contains_ignored_keywords", ignored, len(titles), unit="call")
+        )
+    finally:
+        config.ignored_keywords = keywords
+    return results
+
+
+@benchmark
+def bench_broadcast(args: argparse.Namespace) -> list[dict]:
+    """
+    Cost of building and serializing the progress payloads of `DataHandler.monitor`
+    """
+    results = []
+    for size in args.queue_sizes:
+        downloader = Downloader(make_aliases())
+        downloader.download_list = make_tracks(size)
+        with contextlib.redirect_stdout(sys.stderr):
+            data_handler = DataHandler(downloader)
+        rooms = [(offset, 100, None) for offset in range(0, size, size // args.rooms)][
+            : args.rooms
+        ]
+        payload_bytes: list[int] = []
+
+        def snapshots():
+            payload_bytes.clear()
+            for offset, limit, status_filter in rooms:
+                payload = data_handler.snapshot(offset, limit, status_filter)
+                payload_bytes.append(len(json.dumps(payload)))
+
+        result = measure(f"snapshot_{size}", snapshots, len(rooms), unit="room")
+        result["bytes_per_payload"] = sum(payload_bytes) / len(payload_bytes)
+        results.append(result)
+
+        since = downloader.version
+        for track in downloader.download_list[::50]:
+            track.percent_downloaded = 50.0
+
+        def deltas():
+            payload_bytes.clear()
+            for offset, limit, _ in rooms:
+                payload = data_handler.delta(since, offset, limit)
+                payload_bytes.append(len(json.dumps(payload)))
+
+        result = measure(f"delta_{size}", deltas, len(rooms), unit="room")
+        result["bytes_per_payload"] = sum(payload_bytes) / len(payload_bytes)
+        results.append(result)
+
+        def filtered():
+            data_handler.snapshot(0, 100, DownloadStatus.QUEUED.value)
+
+        results.append(measure(f"filtered_snapshot_{size}", filtered, 1, unit="room"))
+    return results
+
+
+@benchmark
+def bench_pipeline(args: argparse.Namespace) -> list[dict]:
+    """
+    End-to-end `master_queue` throughput across worker counts
+    """
+    results = []
+    config = get_config()
+    fakes.StubYoutubeDL.transfer_seconds = args.transfer_seconds
+    for thread_limit in args.thread_limits:
+        with tempfile.TemporaryDirectory() as download_folder:
+            config.download_folder = download_folder
+            config.sleep_interval = 0
+            config.thread_limit = thread_limit
+            tracks = make_tracks(args.pipeline_tracks)
+            ytmusic = fakes.FakeYTMusic(latency=args.search_latency)
+            for track in tracks:
+                ytmusic.register(track.artist, track.title, track.duration_ms)
+            fakes.install(ytmusic)
+            downloader = Downloader(make_aliases())
+            downloader.download_list = tracks
+
+            def run():
+                downloader.master_queue()
+
+            result = measure(
+                f"master_queue_{thread_limit}_workers",
+                run,
+                len(tracks),
+                repeat=1,
+                unit="track",
+                searches=ytmusic.calls,
+            )
+            result["completed"] = sum(
+                t.status == DownloadStatus.PROCESSING_COMPLETE for t in tracks
+            )
+            p99 = downloader.resolution_latency.percentile(0.99)
+            result["resolution_p99_ms"] = round(p99 * 1000, 3) if p99 else None
+            results.append(result)
+    return results
+
+
+def git_revision() -> str | None:
+    """
+    Get the commit the benchmarks ran on
+    """
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list[dict], baseline_path: str, tolerance: float) -> list[str]:
+    """
+    Find the results that are slower than a baseline run
+
+    Args:
+        results (list[dict]): The results of this run
+        baseline_path (str): The JSON output of a previous run
+        tolerance (float): The allowed slowdown, e.g. 0.2 for 20%
+
+    Returns:
+        list[str]: A description of every regression
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"] if "us_per_op" in r}
+    regressions = []
+    for result in results:
+        before = baseline.get(result["name"])
+        if before is None or "us_per_op" not in result:
+            continue
+        ratio = result["us_per_op"] / before["us_per_op"]
+        result["baseline_ratio"] = ratio
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"{result['name']}: {before['us_per_op']:.1f} -> "
+                f"{result['us_per_op']:.1f} us/op ({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS))
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--baseline", help="Compare against a previous JSON output")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--quick", action="store_true", help="Use small sizes")
+    parser.add_argument("--playlist-size", type=int, default=10000)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--queue-sizes", type=int, nargs="*", default=[10000, 100000])
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--thread-limits", type=int, nargs="*", default=[1, 2, 4, 8])
+    parser.add_argument("--pipeline-tracks", type=int, default=400)
+    parser.add_argument("--transfer-seconds", type=float, default=0.02)
+    parser.add_argument("--search-latency", type=float, default=0.01)
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.playlist_size = 1000
+        args.iterations = 200
+        args.queue_sizes = [1000, 10000]
+        args.pipeline_tracks = 50
+    return args
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    logger.remove()
+    logger.add(sys.stderr, level="INFO", filter=lambda r: r["name"] == __name__)
+
+    results: list[dict] = []
+    # The extraction path prints every track it sees
+    with contextlib.redirect_stdout(sys.stderr):
+        for name in args.only or BENCHMARKS:
+            logger.info(f"Running {name}")
+            for result in BENCHMARKS[name](args):
+                results.append({"benchmark": name, **result})
+
+    regressions = (
+        compare(results, args.baseline, args.tolerance) if args.baseline else []
+    )
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.time(),
+            "quick": args.quick,
+        },
+        "results": results,
+        "regressions": regressions,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    for regression in regressions:
+        logger.error(f"Regression: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,382 @@
+"""
+Load test of the socket.io broadcast path with many simulated dashboards
+
+Starts SpotTube with the stub yt-dlp (`benchmarks.loadapp`) against the
+stand-in server, fills the queue, then connects N socket.io clients and
+measures, for each queue size and N:
+
+- connect latency: from connecting to the first `progress_status` snapshot
+- resync latency: from a `progress_resync` request to the snapshot it triggers
+- fan-out skew: how much later each client receives an update than the first
+- payload bytes and payloads received per client per second
+- server CPU (share of one core) and peak resident memory
+
+Examples:
+    $ python -m benchmarks.socketio_load --clients 1 10 50 --queue-sizes 100 1000
+    $ python -m benchmarks.socketio_load --server embedded --output socketio.json
+"""
+
+from gevent import monkey  # type: ignore
+
+monkey.patch_all()
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import platform  # noqa: E402
+import socket  # noqa: E402
+import statistics  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+import tempfile  # noqa: E402
+import time  # noqa: E402
+from collections import defaultdict  # noqa: E402
+
+import gevent  # type: ignore # noqa: E402
+import gevent.event  # type: ignore # noqa: E402
+import requests  # noqa: E402
+import socketio  # type: ignore # noqa: E402
+
+from benchmarks import standin  # noqa: E402
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+class ProcessStats:
+    """
+    CPU time and memory of a process and its children, from /proc
+
+    psutil is used instead when it is installed.
+    """
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        try:
+            import psutil  # type: ignore
+
+            self._process = psutil.Process(pid)
+        except ImportError:
+            self._process = None
+
+    def _pids(self) -> list[int]:
+        pids = [self.pid]
+        for pid in pids:
+            try:
+                for task in os.listdir(f"/proc/{pid}/task"):
+                    with open(f"/proc/{pid}/task/{task}/children") as f:
+                        pids.extend(int(child) for child in f.read().split())
+            except OSError:
+                continue
+        return pids
+
+    def sample(self) -> tuple[float, int]:
+        """
+        Get the CPU seconds used so far and the resident memory in bytes
+        """
+        if self._process is not None:
+            processes = [self._process, *self._process.children(recursive=True)]
+            cpu = sum(sum(p.cpu_times()[:2]) for p in processes)
+            rss = sum(p.memory_info().rss for p in processes)
+            return cpu, rss
+        cpu, rss = 0.0, 0
+        for pid in self._pids():
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            rss += int(line.split()[1]) * 1024
+            except (OSError, IndexError, ValueError):
+                continue
+        return cpu, rss
+
+
+class DashboardClient:
+    """
+    A simulated dashboard, recording the progress payloads it receives
+    """
+
+    def __init__(self, url: str, transports: list[str]):
+        self.url = url
+        self.transports = transports
+        self.client = socketio.Client(reconnection=False)
+        self.received: list[tuple[float, int, dict]] = []
+        self.first_snapshot = gevent.event.Event()
+        self.snapshot_waiters: list[gevent.event.Event] = []
+        self.client.on("progress_status", self._on_progress)
+
+    def _on_progress(self, payload: dict):
+        now = time.perf_counter()
+        self.received.append((now, len(json.dumps(payload)), payload))
+        if payload.get("type") == "snapshot":
+            self.first_snapshot.set()
+            for waiter in self.snapshot_waiters:
+                waiter.set()
+            self.snapshot_waiters = []
+
+    def connect(self, timeout: float) -> float | None:
+        """
+        Connect, returning the seconds until the first snapshot arrived
+        """
+        start = time.perf_counter()
+        self.client.connect(self.url, transports=self.transports, wait_timeout=timeout)
+        if not self.first_snapshot.wait(timeout):
+            return None
+        return time.perf_counter() - start
+
+    def resync(self, timeout: float) -> float | None:
+        """
+        Ask for a fresh snapshot, returning the seconds until it arrived
+        """
+        waiter = gevent.event.Event()
+        self.snapshot_waiters.append(waiter)
+        start = time.perf_counter()
+        self.client.emit("progress_resync")
+        if not waiter.wait(timeout):
+            return None
+        return time.perf_counter() - start
+
+    def disconnect(self):
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(values: list[float]) -> dict:
+    """
+    Summarize latencies in milliseconds
+    """
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def pick(q: float) -> float:
+        return values[min(int(q * len(values)), len(values) - 1)] * 1000
+
+    return {
+        "count": len(values),
+        "mean_ms": statistics.fmean(values) * 1000,
+        "p50_ms": pick(0.5),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": values[-1] * 1000,
+    }
+
+
+def start_server(args: argparse.Namespace, port: int, env: dict) -> subprocess.Popen:
+    """
+    Start SpotTube with the stub yt-dlp, under gunicorn or the embedded server
+    """
+    if args.server == "gunicorn":
+        command = [
+            "gunicorn",
+            "benchmarks.loadapp:app",
+            "-c",
+            "gunicorn_config.py",
+            "--bind",
+            f"127.0.0.1:{port}",
+        ]
+    else:
+        command = [sys.executable, "-m", "benchmarks.loadapp", "--port", str(port)]
+    return subprocess.Popen(
+        command,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL if not args.verbose else None,
+    )
+
+
+def wait_until(check, timeout: float, interval: float = 0.2) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(interval)
+    return False
+
+
+def run_scenario(
+    url: str, stats: ProcessStats, clients: int, args: argparse.Namespace
+) -> dict:
+    """
+    Connect a number of dashboards and measure the broadcast path
+    """
+    dashboards = [DashboardClient(url, args.transports) for _ in range(clients)]
+    connects = gevent.joinall(
+        [gevent.spawn(d.connect, args.timeout) for d in dashboards], raise_error=False
+    )
+    connect_latencies = [g.value for g in connects if g.value is not None]
+
+    cpu_before, _ = stats.sample()
+    peak_rss = 0
+    start = time.perf_counter()
+    received_before = {id(d): len(d.received) for d in dashboards}
+    resyncs = []
+    while time.perf_counter() - start < args.duration:
+        _, rss = stats.sample()
+        peak_rss = max(peak_rss, rss)
+        # A few clients resync each second, like dashboards being reloaded
+        for dashboard in dashboards[: max(1, clients // 10)]:
+            resyncs.append(gevent.spawn(dashboard.resync, args.timeout))
+        gevent.sleep(1.0)
+    elapsed = time.perf_counter() - start
+    cpu_after, rss = stats.sample()
+    peak_rss = max(peak_rss, rss)
+    gevent.joinall(resyncs, timeout=args.timeout)
+
+    first_seen: dict[tuple, float] = {}
+    arrivals: dict[tuple, list[float]] = defaultdict(list)
+    payload_sizes = []
+    payloads = 0
+    for dashboard in dashboards:
+        window = dashboard.received[received_before[id(dashboard)] :]
+        payloads += len(window)
+        for received_at, size, payload in window:
+            payload_sizes.append(size)
+            key = (payload.get("type"), payload.get("base"), payload.get("version"))
+            arrivals[key].append(received_at)
+            first_seen[key] = min(first_seen.get(key, received_at), received_at)
+    skews = [
+        at - first_seen[key]
+        for key, times in arrivals.items()
+        if len(times) > 1
+        for at in times
+    ]
+    for dashboard in dashboards:
+        dashboard.disconnect()
+
+    return {
+        "clients": clients,
+        "connected": len(connect_latencies),
+        "connect_latency": percentiles(connect_latencies),
+        "resync_latency": percentiles(
+            [g.value for g in resyncs if g.value is not None]
+        ),
+        "fanout_skew": percentiles(skews),
+        "payloads_per_client_per_second": payloads / max(clients, 1) / elapsed,
+        "payload_bytes": {
+            "mean": statistics.fmean(payload_sizes) if payload_sizes else 0,
+            "max": max(payload_sizes, default=0),
+            "total_per_second": sum(payload_sizes) / elapsed,
+        },
+        "server_cpu_percent": (cpu_after - cpu_before) / elapsed * 100,
+        "server_peak_rss_bytes": peak_rss,
+    }
+
+
+def run_queue_size(queue_size: int, args: argparse.Namespace, stub_url: str) -> list:
+    """
+    Start a fresh server, fill its queue and run every client count against it
+    """
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as download_folder:
+        env = {
+            **os.environ,
+            "STANDIN_URL": stub_url,
+            "DOWNLOAD_FOLDER": download_folder,
+            "THREAD_LIMIT": str(args.workers),
+            "LOADTEST_TRANSFER_SECONDS": str(args.transfer_seconds),
+        }
+        server = start_server(args, port, env)
+        try:
+            if not wait_until(lambda: requests.get(url, timeout=1).ok, args.timeout):
+                raise RuntimeError(f"Server did not start on {url}")
+            stats = ProcessStats(server.pid)
+            _, idle_rss = stats.sample()
+            requests.post(
+                f"{url}/api/jobs",
+                json={"links": [f"https://open.spotify.com/playlist/load{queue_size}"]},
+                timeout=10,
+            )
+            wait_until(
+                lambda: requests.get(f"{url}/api/tracks?limit=1", timeout=5).json()[
+                    "total"
+                ]
+                >= queue_size,
+                args.timeout,
+            )
+            results = []
+            for clients in args.clients:
+                result = run_scenario(url, stats, clients, args)
+                result["queue_size"] = queue_size
+                result["server_idle_rss_bytes"] = idle_rss
+                print(
+                    f"queue={queue_size} clients={clients}: "
+                    f"connect p95 {result['connect_latency'].get('p95_ms', 0):.0f} ms, "
+                    f"skew p95 {result['fanout_skew'].get('p95_ms', 0):.0f} ms, "
+                    f"{result['payload_bytes']['total_per_second'] / 1024:.0f} KiB/s, "
+                    f"cpu {result['server_cpu_percent']:.0f}%",
+                    file=sys.stderr,
+                )
+                results.append(result)
+            return results
+        finally:
+            server.terminate()
+            try:
+                server.wait(10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--clients", type=int, nargs="*", default=[1, 10, 50, 100])
+    parser.add_argument(
+        "--queue-sizes", type=int, nargs="*", default=[100, 1000, 10000]
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per run")
+    parser.add_argument(
+        "--server", choices=["gunicorn", "embedded"], default="gunicorn"
+    )
+    parser.add_argument("--transports", nargs="*", default=["websocket", "polling"])
+    parser.add_argument("--workers", type=int, default=4, help="Download workers")
+    parser.add_argument("--transfer-seconds", type=float, default=2.0)
+    parser.add_argument("--search-latency", type=float, default=0.02)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show server logs")
+    args = parser.parse_args(argv)
+
+    stub = standin.serve(faults=standin.Faults(latency=args.search_latency))
+    results = []
+    try:
+        for queue_size in args.queue_sizes:
+            results.extend(run_queue_size(queue_size, args, stub.url))
+    finally:
+        stub.shutdown()
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.time(),
+            "server": args.server,
+            "transports": args.transports,
+            "duration": args.duration,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+"""
+Local stand-in for the Spotify Web API and YouTube Music search
+
+Serves the endpoints `SpotifyHandler` and the downloader use, built from the
+recorded responses, with injectable latency, server errors and 429 throttling.
+Point the app at it with `STANDIN_URL=http://127.0.0.1:8765`.
+
+A playlist ID ending in digits has that many tracks, e.g.
+https://open.spotify.com/playlist/bench100000 has 100k tracks.
+
+Examples:
+    $ python -m benchmarks.standin --port 8765 --latency 0.05 --throttle-rate 0.02
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks import fakes
+
+DEFAULT_PLAYLIST_SIZE = 1000
+
+SPOTIFY_ROUTES = [
+    (re.compile(r"^artists/(?P<id>\w+)$"), "artist"),
+    (re.compile(r"^artists/(?P<id>\w+)/albums$"), "artist_albums"),
+    (re.compile(r"^artists/(?P<id>\w+)/top-tracks$"), "artist_top_tracks"),
+    (re.compile(r"^albums/(?P<id>\w+)$"), "album"),
+    (re.compile(r"^albums/(?P<id>\w+)/tracks$"), "album_tracks"),
+    (re.compile(r"^tracks/(?P<id>\w+)$"), "track"),
+    (re.compile(r"^playlists/(?P<id>\w+)$"), "playlist"),
+    (re.compile(r"^playlists/(?P<id>\w+)/(tracks|items)$"), "playlist_items"),
+]
+
+
+class Faults:
+    """
+    Latency and failures injected into every response
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: int = 1,
+        seed: int | None = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self) -> tuple[float, int | None]:
+        """
+        Draw the delay and the injected status of a response
+
+        Returns:
+            tuple[float, int | None]: The delay in seconds, and 429, 500 or None
+        """
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            roll = self._random.random()
+        if roll < self.throttle_rate:
+            return delay, 429
+        if roll < self.throttle_rate + self.error_rate:
+            return delay, 500
+        return delay, None
+
+
+def playlist_size(playlist_id: str) -> int:
+    """
+    Get the number of tracks of a playlist from the digits its ID ends with
+    """
+    match = re.search(r"(\d+)$", playlist_id)
+    return int(match.group(1)) if match else DEFAULT_PLAYLIST_SIZE
+
+
+def spotify_response(route: str, playlist_id: str, query: dict) -> dict:
+    """
+    Build the response of a Spotify endpoint
+    """
+    spotify = fakes.recorded("spotify")
+    if route == "playlist":
+        return {
+            **spotify["playlist"],
+            "id": playlist_id,
+            "tracks": {"total": playlist_size(playlist_id)},
+        }
+    if route == "playlist_items":
+        offset = int(query.get("offset", 0))
+        limit = min(int(query.get("limit", 100)), 100)
+        total = playlist_size(playlist_id)
+        items = fakes.playlist_items(max(min(limit, total - offset), 0), offset)
+        return {
+            "items": items,
+            "limit": limit,
+            "offset": offset,
+            "total": total,
+            "next": None,
+        }
+    if route == "artist_top_tracks":
+        return {"tracks": [spotify["track"]]}
+    return spotify[route]
+
+
+def ytmusic_response(query: str, filter: str | None, limit: int) -> list[dict]:
+    """
+    Build the results of a YouTube Music search
+    """
+    track = fakes.track_for_query(query)
+    kind = "songs" if filter else "top_result"
+    if track is None:
+        return fakes.recorded("ytmusic")[kind][:limit]
+    return fakes.search_results(*track, kind=kind)[:limit]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Routes `/spotify/v1/...` and `/ytmusic/search` requests
+    """
+
+    server: "StandInServer"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path == "/stats":
+            self._send(200, self.server.stats())
+            return
+
+        route, response = self._route(url.path, query)
+        if route is None:
+            self._send(404, {"error": {"status": 404, "message": "Not found"}})
+            return
+
+        delay, fault = self.server.faults.draw()
+        if delay:
+            time.sleep(delay)
+        if fault == 429:
+            self.server.count(route, 429)
+            self._send(
+                429,
+                {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                {"Retry-After": str(self.server.faults.retry_after)},
+            )
+        elif fault == 500:
+            self.server.count(route, 500)
+            self._send(500, {"error": {"status": 500, "message": "Server error"}})
+        else:
+            self.server.count(route, 200)
+            self._send(200, response())
+
+    def _route(self, path: str, query: dict):
+        """
+        Find the endpoint of a path, and a function building its response
+        """
+        if path == "/ytmusic/search":
+            return "ytmusic_search", lambda: ytmusic_response(
+                query.get("query", ""), query.get("filter"), int(query.get("limit", 20))
+            )
+        if path.startswith("/spotify/v1/"):
+            resource = path.removeprefix("/spotify/v1/").rstrip("/")
+            for pattern, route in SPOTIFY_ROUTES:
+                match = pattern.match(resource)
+                if match:
+                    return f"spotify_{route}", lambda: spotify_response(
+                        route, match.group("id"), query
+                    )
+        return None, None
+
+    def _send(self, status: int, body, headers: dict[str, str] | None = None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server counting requests by endpoint and status
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], faults: Faults):
+        super().__init__(address, StandInHandler)
+        self.faults = faults
+        self._counts: Counter[tuple[str, int]] = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, route: str, status: int):
+        with self._lock:
+            self._counts[(route, status)] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = list(self._counts.items())
+        stats: dict[str, dict[str, int]] = {}
+        for (route, status), count in counts:
+            stats.setdefault(route, {})[str(status)] = count
+        return stats
+
+
+def serve(
+    host: str = "127.0.0.1", port: int = 0, faults: Faults | None = None
+) -> StandInServer:
+    """
+    Start a stand-in server on a background thread
+
+    Examples:
+        >>> server = serve(faults=Faults(latency=0.05, throttle_rate=0.01))
+        >>> os.environ["STANDIN_URL"] = server.url
+
+    Args:
+        host (str): The address to listen on
+        port (int): The port to listen on, 0 for any free port
+        faults (Faults | None): The latency and failures to inject
+
+    Returns:
+        StandInServer: The running server, stopped with `shutdown()`
+    """
+    server = StandInServer((host, port), faults or Faults())
+    threading.Thread(target=server.serve_forever, name="standin", daemon=True).start()
+    return server
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1, help="Seconds")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+    faults = Faults(
+        args.latency,
+        args.jitter,
+        args.error_rate,
+        args.throttle_rate,
+        args.retry_after,
+        args.seed,
+    )
+    server = StandInServer((args.host, args.port), faults)
+    print(f"Stand-in serving on {server.url}, set STANDIN_URL={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,26 @@
+import json
 import os
 import pathlib
 import sys
-import threading
 
+import click
 from dotenv import load_dotenv
-from flask import Flask, render_template
-from flask_socketio import SocketIO  # type: ignore
+from flask import Flask, Response, jsonify, render_template, request
+from flask_socketio import SocketIO, join_room, leave_room  # type: ignore
 from loguru import logger
 
-from src import db
+from src import db, history
 from src.aliases import Aliases
-from src.config import Config
-from src.data import DataHandler
+from src.cli import exit_code, read_links, run_sync
+from src.config import get_config
+from src.data import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, DataHandler
 from src.downloader import Downloader
+from src.jobs import Job, JobManager
+from src.metrics import QUEUE_DEPTH, REGISTRY, RESOLUTION_P99_SECONDS
+from src.resolver import ResolutionEngine
 from src.spotify import SpotifyHandler
-from src.status import DownloadStatus
+from src.startup import startup_timer
+from src.status import JobStatus
 
 app = Flask(__name__, instance_relative_config=True)
 app.config.from_mapping(
@@ -31,18 +37,50 @@ try:
 except OSError:
     pass
 
-# Initialize everything within app context
+startup_timer.mark_imports()
+
+# Initialize everything within app context. Heavy dependencies (yt-dlp,
+# ytmusicapi, spotipy, thefuzz, stringpod) and the Spotify clients are only
+# loaded on first use.
 with app.app_context():
-    db.init_app(app)
-    db.init_db()
-    aliases = Aliases()
-    aliases.import_from_file(pathlib.Path("config/aliases.yaml"))
-    print(aliases.aliases)
+    with startup_timer.phase("database"):
+        db.init_app(app)
+        db.ensure_db()
+    with startup_timer.phase("aliases"):
+        aliases = Aliases()
+        aliases.import_from_file(pathlib.Path("config/aliases.yaml"))
+
+    with startup_timer.phase("components"):
+        config = get_config()
+        # Spotify extraction and YouTube Music searches share one bounded engine
+        engine = ResolutionEngine(config.resolve_concurrency)
+        spotify_handler = SpotifyHandler(engine)
+        downloader = Downloader(aliases, engine)
+        data_handler = DataHandler(downloader)
+        jobs = JobManager(spotify_handler, downloader, config.job_concurrency)
+        QUEUE_DEPTH.set_function(lambda: downloader.queue_depth)
+        RESOLUTION_P99_SECONDS.set_function(
+            lambda: downloader.resolution_latency.percentile(0.99) or 0.0
+        )
+
+startup_timer.finish()
+
+
+def current_sid() -> str:
+    """
+    Get the socket.io session ID of the client that sent the current event
+    """
+    return request.sid  # type: ignore[attr-defined]
 
-    spotify_handler = SpotifyHandler()
-    downloader = Downloader(aliases)
-    data_handler = DataHandler(downloader)
-    config = Config()
+
+def window_arg(data: dict, key: str, default: int) -> int:
+    """
+    Read a whole number sent by a client, or the default if it isn't one
+    """
+    try:
+        return int(data.get(key, default))
+    except (TypeError, ValueError, OverflowError):
+        return default
 
 
 @app.route("/")
@@ -57,53 +95,233 @@ def home():
 def download(data):
     """
     Downloads the data from the Spotify link
+
+    Extraction runs in the background, the reply is sent once the tracks are
+    queued.
     """
+    sid = current_sid()
+
+    def reply(job: Job):
+        if job.status == JobStatus.FAILED:
+            ret = {"Status": "Error", "Data": job.error}
+        else:
+            ret = {"Status": "Success"}
+        socketio.emit("download", ret, to=sid)
+
     try:
         logger.warning(f"Download Request: {data}")
-        downloader.stop_downloading_event.clear()
-        if not data_handler.monitor_active_flag:
-            logger.debug(f"Monitor Active Flag: {data_handler.monitor_active_flag}")
-            data_handler.stop_monitoring_event.clear()
-            thread = threading.Thread(target=data_handler.monitor, args=(socketio,))
-            thread.daemon = True
-            thread.start()
-            data_handler.monitor_active_flag = True
-
-        link = data["Link"]
-        ret = spotify_handler.spotify_extractor(link)
-        if downloader.status == DownloadStatus.COMPLETE:
-            downloader.download_list = []
-        downloader.download_list.extend(ret)
-        logger.debug(f"Download List: {downloader.download_list}")
-        logger.debug(f"Status: {downloader.status}")
-
-        if downloader.status != DownloadStatus.RUNNING:
-            logger.debug("Resetting Downloader")
-            downloader.index = 0
-            downloader.status = DownloadStatus.RUNNING
-            thread = threading.Thread(target=downloader.master_queue)
-            thread.daemon = True
-            thread.start()
-
-        ret = {"Status": "Success"}
+        jobs.submit(data["Link"], on_done=reply)
 
     except Exception as e:
         logger.error(f"Error Handling Download Request from UI: {str(e)}")
-        ret = {"Status": "Error", "Data": str(e)}
+        socketio.emit("download", {"Status": "Error", "Data": str(e)}, to=sid)
+
+
+@app.route("/api/jobs", methods=["POST"])
+def submit_jobs():
+    """
+    Submits Spotify links for download, one job per link
+
+    The body is `{"links": [...]}`. Job IDs are returned immediately, the links
+    are extracted in the background.
+    """
+    body = request.get_json(silent=True) or {}
+    links = body.get("links")
+    if not isinstance(links, list) or not all(isinstance(x, str) for x in links):
+        return jsonify({"Status": "Error", "Data": "Expected a list of links"}), 400
+    submitted = [jobs.submit(link) for link in links]
+    return jsonify({"jobs": [jobs.summary(job) for job in submitted]}), 202
+
+
+@app.route("/api/jobs")
+def list_jobs():
+    """
+    Returns the status of recent jobs
+    """
+    return jsonify({"jobs": [jobs.summary(job) for job in jobs.list()]})
+
 
-    finally:
-        socketio.emit("download", ret)
+@app.route("/api/jobs/<job_id>")
+def job_status(job_id: str):
+    """
+    Returns the status of a job
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"Status": "Error", "Data": "Job not found"}), 404
+    return jsonify(jobs.summary(job))
+
+
+@app.route("/api/jobs/<job_id>/result")
+def job_result(job_id: str):
+    """
+    Returns the tracks extracted by a job
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"Status": "Error", "Data": "Job not found"}), 404
+    return jsonify(
+        {
+            **jobs.summary(job),
+            "tracks": [track.model_dump() for track in jobs.tracks(job)],
+        }
+    )
+
+
+@app.route("/metrics")
+def metrics():
+    """
+    Returns the pipeline metrics in the Prometheus text format
+    """
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/api/startup")
+def startup_report():
+    """
+    Returns the startup timing report
+    """
+    return jsonify(startup_timer.as_dict())
+
+
+@app.route("/api/workers")
+def worker_status():
+    """
+    Returns the size and load of the download worker pool
+    """
+    return jsonify(
+        {
+            "thread_limit": downloader.workers.size,
+            "workers": downloader.workers.workers,
+            "busy": downloader.workers.busy,
+            "pending": downloader.workers.pending,
+        }
+    )
+
+
+@app.route("/api/workers", methods=["PUT"])
+def resize_workers():
+    """
+    Changes the number of download workers while downloads are running
+
+    Expects a JSON body `{"thread_limit": 4}`
+    """
+    body = request.get_json(silent=True) or {}
+    try:
+        thread_limit = int(body["thread_limit"])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"Status": "Error", "Data": "Expected a thread_limit"}), 400
+    if thread_limit < 1:
+        return (
+            jsonify({"Status": "Error", "Data": "thread_limit must be at least 1"}),
+            400,
+        )
+    downloader.resize_workers(thread_limit)
+    return worker_status()
+
+
+@app.route("/api/cookies")
+def cookie_status():
+    """
+    Returns the cookie accounts with their error and throttle rates
+    """
+    return jsonify(
+        {"policy": downloader.cookies.policy, "accounts": downloader.cookies.stats()}
+    )
+
+
+@app.route("/api/tracks")
+def list_tracks():
+    """
+    Returns a page of the download list
+
+    Query parameters are `offset`, `limit` and an optional `status` filter
+    """
+    offset = request.args.get("offset", 0, type=int)
+    limit = min(request.args.get("limit", 100, type=int), MAX_PAGE_SIZE)
+    status = request.args.get("status") or None
+    total, tracks = downloader.query_tracks(offset, limit, status)
+    return jsonify(
+        {
+            "offset": offset,
+            "total": total,
+            "data": [track.model_dump() for track in tracks],
+        }
+    )
+
+
+@app.route("/api/history")
+def list_history():
+    """
+    Returns a page of finished tracks moved out of memory, most recent first
+
+    Query parameters are `offset`, `limit` and an optional `status` filter
+    """
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", 100, type=int), 0), MAX_PAGE_SIZE)
+    status = request.args.get("status") or None
+    total, tracks = history.recent(offset, limit, status)
+    return jsonify(
+        {
+            "offset": offset,
+            "total": total,
+            "data": [track.model_dump() for track in tracks],
+        }
+    )
+
+
+@app.route("/api/tracks/<track_id>", methods=["DELETE"])
+def delete_track(track_id: str):
+    """
+    Removes a track from the download list
+    """
+    if downloader.remove_track(track_id) is None:
+        return jsonify({"Status": "Error", "Data": "Track not found"}), 404
+    return jsonify({"Status": "Success"})
+
+
+@app.route("/api/tracks/<track_id>/trace")
+def track_trace(track_id: str):
+    """
+    Returns the stage timings recorded for a track
+    """
+    spans = downloader.tracer.get_spans(track_id)
+    if not spans:
+        return jsonify({"Status": "Error", "Data": "No trace for track"}), 404
+    return jsonify({"track_id": track_id, "spans": [span.to_dict() for span in spans]})
 
 
 @socketio.on("remove_track")
-def remove_track(index: int):
+def remove_track(track_id: str):
     """
     Remove a track from the download list
     """
-    logger.warning(f"Remove Track Request: {index}")
-    downloader.download_list.pop(index)
-    ret = {"Status": "Success"}
-    socketio.emit("remove_track", ret)
+    logger.warning(f"Remove Track Request: {track_id}")
+    if downloader.remove_track(track_id) is None:
+        ret = {"Status": "Error", "Data": "Track not found"}
+    else:
+        ret = {"Status": "Success"}
+    socketio.emit("remove_track", ret, to=current_sid())
+
+
+@socketio.on("set_window")
+def set_window(data):
+    """
+    Sets the page of the download list the client receives updates for
+    """
+    if not isinstance(data, dict):
+        data = {}
+    status = data.get("status")
+    previous = data_handler.clients.get(current_sid())
+    room = data_handler.set_window(
+        current_sid(),
+        window_arg(data, "offset", 0),
+        window_arg(data, "limit", DEFAULT_PAGE_SIZE),
+        status if isinstance(status, str) else None,
+    )
+    if previous is not None and previous.name != room.name:
+        leave_room(previous.name)
+    join_room(room.name)
 
 
 @socketio.on("connect")
@@ -111,13 +329,17 @@ def connection():
     """
     Connects the client to the server
     """
-    with app.app_context():
-        if not data_handler.monitor_active_flag:
-            data_handler.stop_monitoring_event.clear()
-            thread = threading.Thread(target=data_handler.monitor, args=(socketio,))
-            thread.daemon = True
-            thread.start()
-            data_handler.monitor_active_flag = True
+    data_handler.start_monitoring(socketio)
+    room = data_handler.add_client(current_sid())
+    join_room(room.name)
+
+
+@socketio.on("progress_resync")
+def progress_resync():
+    """
+    Sends a full snapshot of the download list to the client
+    """
+    data_handler.request_resync(current_sid())
 
 
 @socketio.on("loadSettings")
@@ -129,6 +351,7 @@ def load_settings():
         "spotify_client_id": config.spotify_client_id,
         "spotify_client_secret": config.spotify_client_secret,
         "sleep_interval": config.sleep_interval,
+        "thread_limit": config.thread_limit,
         "ignored_keywords": config.ignored_keywords,
     }
     socketio.emit("settingsLoaded", data)
@@ -142,6 +365,8 @@ def update_settings(data):
     config.spotify_client_id = data["spotify_client_id"]
     config.spotify_client_secret = data["spotify_client_secret"]
     config.sleep_interval = int(data["sleep_interval"])
+    if data.get("thread_limit"):
+        downloader.resize_workers(int(data["thread_limit"]))
     config.ignored_keywords = data["ignored_keywords"]
     logger.debug(f"Updated Settings: {config.__dict__}")
 
@@ -151,8 +376,7 @@ def disconnect():
     """
     Disconnects the client from the server
     """
-    data_handler.stop_monitoring_event.set()
-    data_handler.monitor_active_flag = False
+    data_handler.remove_client(current_sid())
 
 
 @socketio.on("clear")
@@ -162,6 +386,8 @@ def clear():
     """
     logger.warning("Clear List Request")
     downloader.stop_downloading_event.set()
+    downloader.staging.wake()
+    downloader.retries.clear()
     for future in downloader.futures:
         if not future.done():
             future.cancel()
@@ -170,6 +396,31 @@ def clear():
         downloader.futures = []
 
 
+@app.cli.command("sync")
+@click.argument("links_file", type=click.File("r", encoding="utf-8"))
+@click.option("--thread-limit", type=click.IntRange(min=1), help="Download workers")
+@click.option(
+    "--output", type=click.Path(dir_okay=False), help="Also write the summary here"
+)
+def sync_command(links_file, thread_limit: int | None, output: str | None):
+    """Download the Spotify links in LINKS_FILE without the web UI.
+
+    Prints a JSON summary as the last line and exits with 0 if every track was
+    downloaded or already existed, 1 if anything failed, 130 if interrupted.
+    """
+    links = read_links(links_file)
+    if not links:
+        raise click.UsageError(f"No links in {links_file.name}")
+    if thread_limit:
+        downloader.resize_workers(thread_limit)
+    summary = run_sync(jobs, downloader, links)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    click.echo(json.dumps(summary))
+    sys.exit(exit_code(summary))
+
+
 def is_debug():
     """
     Returns True if the application is running in debug mode
@@ -1,3 +1,8 @@
 """
 SpotTube
 """
+
+import time
+
+# Reference point of the startup timing report
+STARTED = time.perf_counter()
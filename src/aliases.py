@@ -6,23 +6,36 @@ import pathlib
 from dataclasses import dataclass, field
 
 import yaml
-from flask import current_app
+from loguru import logger
 
-from src.db import exec_db, query_db
+from src.db import exec_db, exec_many, query_db
+from src.utils import normalize_name, string_cleaner
+
+# Separator of the artists of a collaboration in `Track.artist`
+ARTIST_SEPARATOR = ", "
+# Bound on the memoized cleaned names, which are dropped wholesale when reached
+MAX_CLEANED_NAMES = 16384
 
 
 @dataclass
 class Aliases:
     """
     Aliases for artists
+
+    Lookups go through an index keyed on normalized (NFKC, casefolded) names,
+    so each artist of a collaboration such as "A, B, C" resolves on its own
+    in O(1). The cleaned form of every artist is computed once and memoized.
     """
 
     _aliases: dict[str, str] = field(default_factory=dict)
+    _index: dict[str, str] = field(default_factory=dict)
+    _cleaned: dict[str, str] = field(default_factory=dict)
 
     def __init__(self):
         self._aliases = {}
-        with current_app.app_context():
-            self.refresh()
+        self._index = {}
+        self._cleaned = {}
+        self.refresh()
 
     def refresh(self):
         """
@@ -44,9 +57,19 @@ class Aliases:
         Set the aliases
         """
         self._aliases = value
+        self._reindex()
         # Update the database
         # self._save_aliases(value)
 
+    def _reindex(self):
+        """
+        Rebuild the normalized index and drop the memoized cleaned names
+        """
+        self._index = {
+            normalize_name(alias): artist for alias, artist in self._aliases.items()
+        }
+        self._cleaned = {}
+
     def import_from_file(self, file_path: pathlib.Path):
         """
         Import aliases from a file
@@ -57,17 +80,20 @@ class Aliases:
         Args:
             file_path (pathlib.Path): The path to the file containing the aliases
         """
+        if not file_path.exists():
+            logger.debug(f"No aliases file at {file_path}")
+            return
         with open(file_path, "r", encoding="utf-8") as f:
             try:
-                aliases = yaml.safe_load(f)
-                print(aliases)
+                aliases = yaml.safe_load(f) or {}
+                logger.debug(f"Loaded aliases for {len(aliases)} artists from file")
                 self._save_aliases(aliases)
             except yaml.YAMLError as exc:
-                print(exc)
+                logger.error(f"Error parsing aliases file {file_path}: {exc}")
 
     def _save_aliases(self, file_aliases: dict[str, list[str]]):
         """
-        Save the aliases to the database
+        Save the aliases to the database, in a single transaction
 
         Examples:
             >>> _save_aliases({"artist1": ["alias1", "alias2"], "artist2": ["alias3"]})
@@ -75,12 +101,23 @@ class Aliases:
         Args:
             file_aliases (dict[str, list[str]]): The aliases to save
         """
-        for artist, artist_aliases in file_aliases.items():
-            for alias in artist_aliases:
-                exec_db(
-                    "INSERT OR REPLACE INTO aliases (alias, artist) VALUES (?, ?)",
-                    (alias, artist),
-                )
+        # Rows already in the database are skipped, so restarts with an
+        # unchanged file do not write anything
+        rows = {
+            alias: artist
+            for artist, artist_aliases in file_aliases.items()
+            for alias in artist_aliases
+            if self._aliases.get(alias) != artist
+        }
+        if not rows:
+            return
+        if exec_many(
+            "INSERT OR REPLACE INTO aliases (alias, artist) VALUES (?, ?)",
+            list(rows.items()),
+        ):
+            self._aliases.update(rows)
+            self._reindex()
+            logger.debug(f"Saved {len(rows)} aliases")
 
     def load_from_db(self) -> bool:
         """
@@ -96,7 +133,7 @@ class Aliases:
         res = query_db(
             "SELECT name FROM sqlite_master WHERE type='table' AND name='aliases'"
         )
-        if res is None:
+        if not res:
             return False
 
         res = query_db("SELECT alias, artist FROM aliases")
@@ -107,8 +144,12 @@ class Aliases:
         """
         Get the artist for an alias
 
+        A comma-separated list of artists is resolved artist by artist, unless
+        the whole string is an alias itself.
+
         Examples:
             >>> Aliases().get_name("alias1")
+            >>> Aliases().get_name("alias1, alias2")
 
         Args:
             alias (str): The alias to get the artist for
@@ -116,9 +157,40 @@ class Aliases:
         Returns:
             str: The artist for the alias (if it exists) or the alias itself
         """
-        return self._aliases.get(alias, alias)
+        artist = self._index.get(normalize_name(alias))
+        if artist is not None:
+            return artist
+        if ARTIST_SEPARATOR not in alias:
+            return alias
+        names: list[str] = []
+        for name in alias.split(ARTIST_SEPARATOR):
+            name = self._index.get(normalize_name(name), name)
+            if name not in names:
+                names.append(name)
+        return ARTIST_SEPARATOR.join(names)
 
-    def add_aliases(self, aliases: dict[str, str]):
+    def clean_name(self, alias: str) -> str:
+        """
+        Get the cleaned, lowercase artist for an alias, as used for matching
+
+        Examples:
+            >>> Aliases().clean_name("Alias1, Alias2")
+
+        Args:
+            alias (str): The alias to get the artist for
+
+        Returns:
+            str: The cleaned artist name
+        """
+        cleaned = self._cleaned.get(alias)
+        if cleaned is None:
+            cleaned = string_cleaner(self.get_name(alias)).lower()
+            if len(self._cleaned) >= MAX_CLEANED_NAMES:
+                self._cleaned = {}
+            self._cleaned[alias] = cleaned
+        return cleaned
+
+    def add_aliases(self, aliases: dict[str, str]) -> bool:
         """
         Batch add aliases for artists
 
@@ -129,15 +201,17 @@ class Aliases:
         Args:
             aliases (dict[str, str]): The aliases to add
 
-        Raises:
-            sqlite3.Error: If the query fails
+        Returns:
+            bool: True if the aliases were saved, False otherwise
         """
-        for alias, artist in aliases.items():
-            self._aliases[alias] = artist
-            exec_db(
-                "INSERT INTO aliases (alias, artist) VALUES (?, ?)", (alias, artist)
-            )
-        self.refresh()
+        if not exec_many(
+            "INSERT OR REPLACE INTO aliases (alias, artist) VALUES (?, ?)",
+            list(aliases.items()),
+        ):
+            return False
+        self._aliases.update(aliases)
+        self._reindex()
+        return True
 
     def add_alias(self, alias: str, artist: str):
         """
@@ -151,9 +225,11 @@ class Aliases:
             alias (str): The alias to add
             artist (str): The artist to add the alias to
         """
-        exec_db("INSERT INTO aliases (alias, artist) VALUES (?, ?)", (alias, artist))
-        self._aliases[alias] = artist
-        self.refresh()
+        if exec_db(
+            "INSERT INTO aliases (alias, artist) VALUES (?, ?)", (alias, artist)
+        ):
+            self._aliases[alias] = artist
+            self._reindex()
 
     def remove_alias(self, alias: str):
         """
@@ -166,6 +242,6 @@ class Aliases:
         Args:
             alias (str): The alias to remove
         """
-        self.aliases.pop(alias)
-        exec_db("DELETE FROM aliases WHERE alias = ?", (alias,))
-        self.refresh()
+        if exec_db("DELETE FROM aliases WHERE alias = ?", (alias,)):
+            self._aliases.pop(alias, None)
+            self._reindex()
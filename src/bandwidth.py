@@ -0,0 +1,207 @@
+"""Bandwidth budget shared by every download, with a daily schedule"""
+
+import re
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from datetime import time as day_time
+
+from src.metrics import BANDWIDTH_LIMIT
+
+# How often running downloads are rebalanced at most, from progress hooks
+REBALANCE_SECONDS = 0.5
+# A download using less than this share of its allowance is limited by the
+# server, and gets its measured speed plus headroom instead of a full share
+SATURATED_RATIO = 0.8
+HEADROOM_RATIO = 1.25
+
+UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
+RATE_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*([KMG]?)I?B?(?:/S)?")
+WINDOW_PATTERN = re.compile(r"(\d{1,2}:\d{2})\s*-\s*(\d{1,2}:\d{2})\s*=\s*(.+)")
+
+
+def parse_rate(value: str) -> int | None:
+    """
+    Parse a rate in bytes per second, with an optional K, M or G suffix
+
+    Examples:
+        >>> parse_rate("2M")
+        2097152
+        >>> parse_rate("unlimited") is None
+        True
+
+    Args:
+        value (str): The rate, "0", "" or "unlimited" for no limit
+
+    Returns:
+        int | None: The rate in bytes per second, None for no limit
+    """
+    value = value.strip().upper()
+    if value in ("", "0", "UNLIMITED"):
+        return None
+    match = RATE_PATTERN.fullmatch(value)
+    if match is None:
+        raise ValueError(f"Invalid rate: {value!r}")
+    return int(float(match.group(1)) * UNITS[match.group(2)]) or None
+
+
+@dataclass
+class ScheduleWindow:
+    """
+    Rate limit applied between two times of day
+    """
+
+    start: day_time
+    end: day_time
+    rate: int | None
+
+    def contains(self, now: day_time) -> bool:
+        """
+        Check if a time of day is in the window, which may wrap past midnight
+        """
+        if self.start <= self.end:
+            return self.start <= now < self.end
+        return now >= self.start or now < self.end
+
+
+def parse_schedule(value: str) -> list[ScheduleWindow]:
+    """
+    Parse a schedule of comma-separated `HH:MM-HH:MM=rate` windows
+
+    Examples:
+        >>> parse_schedule("07:00-23:00=2M, 23:00-07:00=unlimited")
+
+    Args:
+        value (str): The schedule
+
+    Returns:
+        list[ScheduleWindow]: The windows, in the given order
+    """
+    windows = []
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        match = WINDOW_PATTERN.fullmatch(entry)
+        if match is None:
+            raise ValueError(f"Invalid schedule window: {entry!r}")
+        start, end, rate = match.groups()
+        windows.append(
+            ScheduleWindow(
+                day_time.fromisoformat(start.zfill(5)),
+                day_time.fromisoformat(end.zfill(5)),
+                parse_rate(rate),
+            )
+        )
+    return windows
+
+
+class BandwidthBudget:
+    """
+    Splits a global rate limit between the downloads in progress
+
+    Each download's yt-dlp `ratelimit` is set to its share, and changed while
+    it runs: yt-dlp reads it again for every block. Shares are rebalanced
+    when a download starts or finishes, and as measured speeds come in, so a
+    download held back by the server leaves its unused share to the others.
+    """
+
+    def __init__(
+        self, limit: int | None = None, schedule: list[ScheduleWindow] | None = None
+    ):
+        self.limit = limit
+        self.schedule = schedule or []
+        self._downloads: dict[str, dict] = {}
+        self._speeds: dict[str, float] = {}
+        self._current: int | None = None
+        self._rebalanced = 0.0
+        self._lock = threading.Lock()
+
+    def current_limit(self, now: datetime | None = None) -> int | None:
+        """
+        Get the limit in force, from the first schedule window containing now
+
+        Args:
+            now (datetime | None): The time, defaults to the local time
+
+        Returns:
+            int | None: The rate in bytes per second, None for no limit
+        """
+        moment = (now or datetime.now()).time()
+        for window in self.schedule:
+            if window.contains(moment):
+                return window.rate
+        return self.limit
+
+    @contextmanager
+    def share(self, key: str, params: dict) -> Iterator[None]:
+        """
+        Give a download a share of the budget while it runs
+
+        Examples:
+            >>> ydl = YoutubeDL(options)
+            >>> with budget.share(song.id, ydl.params):
+            ...     ydl.download([link])
+
+        Args:
+            key (str): Identifies the download in `report`
+            params (dict): The yt-dlp parameters, whose `ratelimit` is managed
+        """
+        with self._lock:
+            self._downloads[key] = params
+            self._rebalance()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._downloads.pop(key, None)
+                self._speeds.pop(key, None)
+                self._rebalance()
+
+    def report(self, key: str, speed: float | None):
+        """
+        Record the measured speed of a download, rebalancing now and then
+
+        Args:
+            key (str): The download
+            speed (float | None): Its speed in bytes per second
+        """
+        with self._lock:
+            if key not in self._downloads:
+                return
+            if speed:
+                self._speeds[key] = speed
+            if time.monotonic() - self._rebalanced >= REBALANCE_SECONDS:
+                self._rebalance()
+
+    def _rebalance(self):
+        """
+        Set the rate limit of every download, with the lock held
+
+        Downloads slower than their allowance get their speed plus headroom;
+        what they leave is split evenly between the others (max-min fairness).
+        """
+        self._rebalanced = time.monotonic()
+        limit = self.current_limit()
+        if limit != self._current:
+            self._current = limit
+            BANDWIDTH_LIMIT.set(limit or 0)
+        if limit is None:
+            for params in self._downloads.values():
+                params.pop("ratelimit", None)
+            return
+
+        remaining = float(limit)
+        pending = sorted(
+            self._downloads, key=lambda key: self._speeds.get(key, float("inf"))
+        )
+        while pending:
+            fair_share = remaining / len(pending)
+            key = pending.pop(0)
+            speed = self._speeds.get(key)
+            if speed is not None and speed < fair_share * SATURATED_RATIO:
+                allowance = min(speed * HEADROOM_RATIO, fair_share)
+            else:
+                allowance = fair_share
+            self._downloads[key]["ratelimit"] = max(int(allowance), 1)
+            remaining -= allowance
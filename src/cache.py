@@ -0,0 +1,102 @@
+"""In-process cache of YouTube Music search results"""
+
+import concurrent.futures
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+from src.metrics import SEARCH_CACHE_TOTAL
+
+
+class SearchCache:
+    """
+    Thread-safe LRU cache with a time-to-live
+
+    Concurrent lookups of a key that is not cached yet share a single load, so
+    a burst of duplicate searches costs one network call.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl: float = 3600.0):
+        self.max_entries = max(max_entries, 0)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._loading: dict[Hashable, concurrent.futures.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_load(self, key: Hashable, load: Callable[[], Any]) -> tuple[Any, bool]:
+        """
+        Get a cached value, loading it on a miss
+
+        Examples:
+            >>> results, hit = cache.get_or_load(
+            ...     ("Artist Title", "songs", 5),
+            ...     lambda: ytmusic.search("Artist Title", filter="songs", limit=5),
+            ... )
+
+        Args:
+            key (Hashable): The cache key
+            load (Callable[[], Any]): Loads the value on a miss; errors are not cached
+
+        Returns:
+            tuple[Any, bool]: The value, and whether it was served without a load
+        """
+        if self.max_entries == 0:
+            return load(), False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._count(hit=True)
+                return entry[1], True
+            future = self._loading.get(key)
+            if future is not None:
+                # Another thread is already loading this key
+                self._count(hit=True)
+                waiting = True
+            else:
+                future = concurrent.futures.Future()
+                self._loading[key] = future
+                self._count(hit=False)
+                waiting = False
+        if waiting:
+            return future.result(), True
+
+        try:
+            value = load()
+        except BaseException as e:
+            with self._lock:
+                self._loading.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._loading.pop(key, None)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        future.set_result(value)
+        return value, False
+
+    def clear(self):
+        """
+        Drop every cached value
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def _count(self, hit: bool):
+        """
+        Count a lookup, with the lock held
+        """
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        SEARCH_CACHE_TOTAL.inc(result="hit" if hit else "miss")
@@ -0,0 +1,140 @@
+"""Headless batch sync, for cron and scripts"""
+
+import time
+from collections import Counter
+from collections.abc import Iterable
+
+from loguru import logger
+
+from src.downloader import Downloader
+from src.jobs import Job, JobManager
+from src.status import DownloadStatus, JobStatus
+
+# Track statuses a sync counts as done, anything else makes it fail
+SUCCESS_STATUSES = {
+    DownloadStatus.PROCESSING_COMPLETE,
+    DownloadStatus.FILE_ALREADY_EXISTS,
+}
+
+EXIT_OK = 0
+EXIT_FAILURES = 1
+EXIT_INTERRUPTED = 130
+
+
+def read_links(lines: Iterable[str]) -> list[str]:
+    """
+    Read Spotify links, one per line, skipping blank lines and # comments
+
+    Args:
+        lines (Iterable[str]): The lines of a links file
+
+    Returns:
+        list[str]: The links, in order and without duplicates
+    """
+    links = (line.split("#", 1)[0].strip() for line in lines)
+    return list(dict.fromkeys(link for link in links if link))
+
+
+def run_sync(
+    jobs: JobManager,
+    downloader: Downloader,
+    links: list[str],
+    poll_interval: float = 0.5,
+) -> dict:
+    """
+    Extract and download Spotify links, and wait until every track is done
+
+    Examples:
+        >>> summary = run_sync(jobs, downloader, ["https://open.spotify.com/album/..."])
+        >>> summary["status"]
+        {'Processing Complete': 12, 'File Already Exists': 3}
+
+    Args:
+        jobs (JobManager): Extracts the links
+        downloader (Downloader): Downloads the tracks with its worker pool
+        links (list[str]): The Spotify links
+        poll_interval (float): Seconds between progress checks
+
+    Returns:
+        dict: The summary, see `summarize`
+    """
+    started = time.monotonic()
+    submitted = [jobs.submit(link) for link in links]
+    try:
+        while not _finished(submitted, downloader):
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        logger.warning("Sync interrupted, stopping downloads")
+        downloader.stop_downloading_event.set()
+        downloader.staging.wake()
+        summary = summarize(jobs, submitted, time.monotonic() - started)
+        summary["interrupted"] = True
+        return summary
+    return summarize(jobs, submitted, time.monotonic() - started)
+
+
+def _finished(submitted: list[Job], downloader: Downloader) -> bool:
+    """
+    Check if every job is extracted, the download queue has run dry and no
+    retry is left
+    """
+    if any(job.finished is None for job in submitted):
+        return False
+    if downloader.status == DownloadStatus.RUNNING:
+        return False
+    return not downloader.retries.pending
+
+
+def summarize(jobs: JobManager, submitted: list[Job], seconds: float) -> dict:
+    """
+    Build the machine-readable summary of a sync
+
+    A link without any track counts as failed, as unknown links extract to
+    nothing rather than raising.
+
+    Args:
+        jobs (JobManager): The job manager the jobs were submitted to
+        submitted (list[Job]): The jobs of the sync
+        seconds (float): The duration of the sync
+
+    Returns:
+        dict: Per-status track counts, failed links, throughput and the 99th
+            percentile of link resolution times
+    """
+    status: Counter[str] = Counter()
+    for job in submitted:
+        status += jobs.downloader.job_status_counts(job.id)
+    tracks = sum(status.values())
+    downloaded = status[DownloadStatus.PROCESSING_COMPLETE.value]
+    p99 = jobs.downloader.resolution_latency.percentile(0.99)
+    return {
+        "links": len(submitted),
+        "failed_links": {
+            job.link: job.error or "No tracks found"
+            for job in submitted
+            if job.status == JobStatus.FAILED or not job.track_count
+        },
+        "tracks": tracks,
+        "status": dict(status),
+        "seconds": round(seconds, 3),
+        "tracks_per_second": round(tracks / seconds, 3) if seconds else 0.0,
+        "downloads_per_minute": round(60 * downloaded / seconds, 3) if seconds else 0.0,
+        "resolution_p99_seconds": round(p99, 3) if p99 is not None else None,
+        "interrupted": False,
+    }
+
+
+def exit_code(summary: dict) -> int:
+    """
+    Get the exit code of a sync
+
+    Returns:
+        int: 0 if every link and track succeeded, 1 if any failed, 130 if interrupted
+    """
+    if summary["interrupted"]:
+        return EXIT_INTERRUPTED
+    status = summary["status"]
+    succeeded = sum(status.get(success.value, 0) for success in SUCCESS_STATUSES)
+    if summary["failed_links"] or succeeded < summary["tracks"]:
+        return EXIT_FAILURES
+    return EXIT_OK
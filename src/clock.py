@@ -0,0 +1,76 @@
+"""Monotonic version clock for tracking changes to the download state"""
+
+import threading
+
+
+class VersionClock:
+    """
+    Thread-safe monotonic counter
+
+    Every change to the download state takes a new version from the clock, so
+    clients can ask for "everything that changed after version N".
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._version = 0
+        self._woken = False
+
+    @property
+    def current(self) -> int:
+        """
+        Get the latest version handed out
+        """
+        return self._version
+
+    def tick(self) -> int:
+        """
+        Advance the clock
+
+        Examples:
+            >>> clock = VersionClock()
+            >>> clock.tick()
+            1
+
+        Returns:
+            int: The new version
+        """
+        with self._lock:
+            self._version += 1
+            self._changed.notify_all()
+            return self._version
+
+    def wake(self):
+        """
+        Wake up a waiter without advancing the clock
+
+        A wake-up with nobody waiting is kept until the next call to `wait`.
+        """
+        with self._lock:
+            self._woken = True
+            self._changed.notify_all()
+
+    def wait(self, since: int, timeout: float | None = None) -> int:
+        """
+        Block until the clock moves past a version, or a waiter is woken up
+
+        Examples:
+            >>> version = state_clock.wait(version)
+
+        Args:
+            since (int): The version the caller has already seen
+            timeout (float | None): The maximum number of seconds to wait
+
+        Returns:
+            int: The current version
+        """
+        with self._lock:
+            self._changed.wait_for(
+                lambda: self._version > since or self._woken, timeout
+            )
+            self._woken = False
+            return self._version
+
+
+state_clock = VersionClock()
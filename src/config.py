@@ -2,8 +2,11 @@
 
 import logging
 import os
+import threading
 from dataclasses import dataclass, field
 
+MIB = 1024 * 1024
+
 
 @dataclass
 class Config:
@@ -15,13 +18,60 @@ class Config:
     paths: dict[str, str]
     _sleep_interval: int = 0
     thread_limit: int = 1
+    resolve_concurrency: int = 16
+    job_concurrency: int = 4
+    search_cache_size: int = 4096
+    search_cache_ttl: int = 3600
+    hedge_searches: str = "off"
+    hedge_percentile: float = 0.95
+    prefetch_lookahead: int = 64
+    standin_url: str = ""
+    min_free_bytes: int = 512 * MIB
+    max_staging_bytes: int = 2048 * MIB
+    staging_estimate_bytes: int = 32 * MIB
+    bandwidth_limit: str = ""
+    bandwidth_schedule: str = ""
+    cookie_policy: str = "round_robin"
+    history_window: int = 1000
+    retry_attempts: int = 5
+    retry_base_delay: float = 60.0
+    retry_max_delay: float = 3600.0
     artist_track_selection: str = "all"
     ignored_keywords: list[str] = field(default_factory=list)
     logger: logging.Logger = logging.getLogger(__name__)
 
     def __init__(self):
         self._sleep_interval = os.environ.get("SLEEP_INTERVAL", 0)
-        self.thread_limit = os.environ.get("THREAD_LIMIT", 1)
+        self.thread_limit = int(os.environ.get("THREAD_LIMIT", 1))
+        self.resolve_concurrency = int(os.environ.get("RESOLVE_CONCURRENCY", 16))
+        self.job_concurrency = int(os.environ.get("JOB_CONCURRENCY", 4))
+        self.search_cache_size = int(os.environ.get("SEARCH_CACHE_SIZE", 4096))
+        self.search_cache_ttl = int(os.environ.get("SEARCH_CACHE_TTL", 3600))
+        # Send the unfiltered search with the filtered one ("parallel"), or
+        # once the filtered one is slower than a latency percentile ("deadline")
+        self.hedge_searches = os.environ.get("HEDGE_SEARCHES", "off")
+        self.hedge_percentile = float(os.environ.get("HEDGE_PERCENTILE", 0.95))
+        # Most tracks resolved ahead of the download workers
+        self.prefetch_lookahead = int(os.environ.get("PREFETCH_LOOKAHEAD", 64))
+        # Local stand-in for Spotify and YouTube Music, for load testing
+        self.standin_url = os.environ.get("STANDIN_URL", "").rstrip("/")
+        # Admission control of the staging folder, in MiB
+        self.min_free_bytes = int(os.environ.get("MIN_FREE_SPACE_MB", 512)) * MIB
+        self.max_staging_bytes = int(os.environ.get("MAX_STAGING_MB", 2048)) * MIB
+        self.staging_estimate_bytes = (
+            int(os.environ.get("STAGING_ESTIMATE_MB", 32)) * MIB
+        )
+        # Rate limit shared by all downloads, e.g. "2M", and daily windows
+        # overriding it, e.g. "07:00-23:00=2M,23:00-07:00=unlimited"
+        self.bandwidth_limit = os.environ.get("BANDWIDTH_LIMIT", "")
+        self.bandwidth_schedule = os.environ.get("BANDWIDTH_SCHEDULE", "")
+        self.cookie_policy = os.environ.get("COOKIE_POLICY", "round_robin")
+        # Finished tracks kept in memory, older ones are moved to the database
+        self.history_window = int(os.environ.get("HISTORY_WINDOW", 1000))
+        # Retries of transient failures, with exponential backoff in seconds
+        self.retry_attempts = int(os.environ.get("RETRY_ATTEMPTS", 5))
+        self.retry_base_delay = float(os.environ.get("RETRY_BASE_DELAY", 60))
+        self.retry_max_delay = float(os.environ.get("RETRY_MAX_DELAY", 3600))
         self.artist_track_selection = os.environ.get("ARTIST_TRACK_SELECTION", "all")
         self.logger = logging.getLogger(__name__)
         self.credentials = {
@@ -31,8 +81,10 @@ class Config:
         self.paths = {
             "download_folder": os.environ.get("DOWNLOAD_FOLDER", "downloads"),
             "config_folder": os.environ.get("CONFIG_FOLDER", "config"),
+            "staging_folder": os.environ.get("STAGING_FOLDER", ""),
             "cookies_path": os.environ.get("COOKIES_PATH", "cookies.txt"),
             "ffmpeg_path": os.environ.get("FFMPEG_PATH", "/usr/bin/ffmpeg"),
+            "trace_path": os.environ.get("TRACE_PATH", ""),
         }
 
         self.ignored_keywords = []
@@ -67,6 +119,22 @@ class Config:
     def config_folder(self, value: str):
         self.paths["config_folder"] = value
 
+    @property
+    def staging_folder(self) -> str:
+        """
+        Returns the folder downloads are written to before they are finished
+
+        It defaults to a hidden folder in the download folder, so finishing a
+        download is a rename on the same filesystem.
+        """
+        return self.paths["staging_folder"] or os.path.join(
+            self.download_folder, ".staging"
+        )
+
+    @staging_folder.setter
+    def staging_folder(self, value: str):
+        self.paths["staging_folder"] = value
+
     @property
     def cookies_path(self) -> str:
         """
@@ -89,6 +157,17 @@ class Config:
     def ffmpeg_path(self, value: str):
         self.paths["ffmpeg_path"] = value
 
+    @property
+    def trace_path(self) -> str:
+        """
+        Returns the file traces are exported to, empty if export is disabled
+        """
+        return self.paths["trace_path"]
+
+    @trace_path.setter
+    def trace_path(self, value: str):
+        self.paths["trace_path"] = value
+
     @property
     def sleep_interval(self) -> int:
         """
@@ -121,3 +200,25 @@ class Config:
     @spotify_client_secret.setter
     def spotify_client_secret(self, value: str):
         self.credentials["spotify_client_secret"] = value
+
+
+_config: Config | None = None
+_config_lock = threading.Lock()
+
+
+def get_config() -> Config:
+    """
+    Get the configuration shared by the whole application
+
+    The configuration is read from the environment on first use, so settings
+    changed at runtime are seen by every module.
+
+    Returns:
+        Config: The configuration
+    """
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                _config = Config()
+    return _config
@@ -0,0 +1,208 @@
+"""Pool of YouTube accounts, as cookie files, shared by the download workers"""
+
+import glob
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from loguru import logger
+
+from src.metrics import COOKIE_DOWNLOADS_TOTAL
+
+# yt-dlp error messages of a YouTube rate limit or bot challenge
+THROTTLE_MARKERS = (
+    "http error 429",
+    "too many requests",
+    "confirm you're not a bot",
+    "confirm you’re not a bot",
+    "rate-limited",
+    "this content isn't available, try again later",
+)
+# Bench time of an account after its first challenge in a row, doubled for
+# every further one
+BENCH_SECONDS = 15 * 60
+MAX_BENCH_SECONDS = 24 * 60 * 60
+
+POLICIES = ("round_robin", "least_throttled")
+
+
+def is_throttled(error: BaseException) -> bool:
+    """
+    Check if a download error is YouTube limiting or challenging the account
+
+    Args:
+        error (BaseException): The error
+
+    Returns:
+        bool: True if the account was throttled
+    """
+    message = str(error).lower()
+    return any(marker in message for marker in THROTTLE_MARKERS)
+
+
+@dataclass
+class CookieAccount:
+    """
+    A YouTube account, and how its downloads went
+    """
+
+    path: str
+    downloads: int = 0
+    errors: int = 0
+    throttles: int = 0
+    in_use: int = 0
+    consecutive_throttles: int = 0
+    last_throttled: float = 0.0
+    benched_until: float = 0.0
+
+    @property
+    def name(self) -> str:
+        """
+        Get the name of the account, from its cookie file
+        """
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    @property
+    def benched(self) -> bool:
+        """
+        Check if the account is resting after being throttled
+        """
+        return self.benched_until > time.time()
+
+    def to_dict(self) -> dict:
+        """
+        Get the account and its rates, without the cookies
+        """
+        attempts = self.downloads + self.errors + self.throttles
+        return {
+            "name": self.name,
+            "downloads": self.downloads,
+            "errors": self.errors,
+            "throttles": self.throttles,
+            "in_use": self.in_use,
+            "error_rate": self.errors / attempts if attempts else 0.0,
+            "throttle_rate": self.throttles / attempts if attempts else 0.0,
+            "benched_until": self.benched_until if self.benched else None,
+        }
+
+
+class CookiePool:
+    """
+    Hands out cookie files to downloads, resting accounts YouTube challenges
+
+    Accounts are read from `cookies.txt` and `cookies/*.txt` in the config
+    folder. With the `round_robin` policy they take turns; with
+    `least_throttled` the account throttled longest ago is picked, then the
+    least busy one. A throttled account is benched for `BENCH_SECONDS`,
+    doubled for each throttle in a row. When every account is benched,
+    downloads run without cookies.
+    """
+
+    def __init__(self, config_folder: str, policy: str = "round_robin"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown cookie policy {policy!r}, expected {POLICIES}")
+        self.config_folder = config_folder
+        self.policy = policy
+        self._accounts: list[CookieAccount] = []
+        self._next = 0
+        self._lock = threading.Lock()
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._accounts)
+
+    @property
+    def accounts(self) -> list[CookieAccount]:
+        """
+        Get the accounts of the pool
+        """
+        return list(self._accounts)
+
+    def load(self):
+        """
+        Find the cookie files in the config folder, keeping known accounts' stats
+        """
+        paths = [os.path.join(self.config_folder, "cookies.txt")]
+        paths += sorted(glob.glob(os.path.join(self.config_folder, "cookies", "*.txt")))
+        with self._lock:
+            known = {account.path: account for account in self._accounts}
+            self._accounts = [
+                known.get(path) or CookieAccount(path)
+                for path in paths
+                if os.path.isfile(path)
+            ]
+        if self._accounts and len(self._accounts) != len(known):
+            logger.info(f"Cookie pool: {len(self._accounts)} accounts, {self.policy}")
+
+    def acquire(self) -> CookieAccount | None:
+        """
+        Pick an account for a download
+
+        Returns:
+            CookieAccount | None: The account, None if none is available
+        """
+        with self._lock:
+            available = [account for account in self._accounts if not account.benched]
+            if not available:
+                return None
+            if self.policy == "least_throttled":
+                account = min(available, key=lambda a: (a.last_throttled, a.in_use))
+            else:
+                account = available[self._next % len(available)]
+                self._next += 1
+            account.in_use += 1
+            return account
+
+    def release(
+        self, account: CookieAccount | None, error: BaseException | None = None
+    ):
+        """
+        Record how a download with an account went
+
+        Args:
+            account (CookieAccount | None): The account from `acquire`
+            error (BaseException | None): The error the download failed with
+        """
+        if account is None:
+            return
+        with self._lock:
+            account.in_use -= 1
+            if error is None:
+                account.downloads += 1
+                account.consecutive_throttles = 0
+                outcome = "ok"
+            elif is_throttled(error):
+                account.throttles += 1
+                account.consecutive_throttles += 1
+                account.last_throttled = time.time()
+                bench = min(
+                    BENCH_SECONDS * 2 ** (account.consecutive_throttles - 1),
+                    MAX_BENCH_SECONDS,
+                )
+                account.benched_until = account.last_throttled + bench
+                outcome = "throttled"
+                logger.warning(f"Cookie account {account.name} benched for {bench}s")
+            else:
+                account.errors += 1
+                outcome = "error"
+        COOKIE_DOWNLOADS_TOTAL.inc(account=account.name, outcome=outcome)
+
+    def cancel(self, account: CookieAccount | None):
+        """
+        Give back an account whose download was stopped, without counting it
+
+        Args:
+            account (CookieAccount | None): The account from `acquire`
+        """
+        if account is None:
+            return
+        with self._lock:
+            account.in_use -= 1
+
+    def stats(self) -> list[dict]:
+        """
+        Get every account and its error and throttle rates
+        """
+        with self._lock:
+            return [account.to_dict() for account in self._accounts]
@@ -1,14 +1,40 @@
 import os
 import threading
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from flask_socketio import SocketIO  # type: ignore
 from loguru import logger
 
-from src.config import Config
+from src.clock import state_clock
 from src.downloader import Downloader
 from src.status import DownloadStatus
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+@dataclass
+class Room:
+    """
+    Clients showing the same page of the download list
+
+    Every member receives the same payloads, so each update is built once per
+    room and fanned out by socket.io.
+    """
+
+    window: tuple[int, int, str | None]
+    sent: int = 0
+    members: set[str] = field(default_factory=set)
+    progress: tuple | None = None
+
+    @property
+    def name(self) -> str:
+        """
+        Get the socket.io room name
+        """
+        offset, limit, status_filter = self.window
+        return f"progress:{offset}:{limit}:{status_filter or ''}"
+
 
 @dataclass
 class DataHandler:
@@ -17,12 +43,15 @@ class DataHandler:
     """
 
     _stop_monitoring_event: threading.Event
-    monitor_active_flag: bool
     downloader: Downloader
+    clients: dict[str, Room]
+    rooms: dict[tuple[int, int, str | None], Room]
+    coalesce_interval: float = 0.05
 
-    def __init__(self, downloader: Downloader):
+    def __init__(self, downloader: Downloader, coalesce_interval: float = 0.05):
         super().__init__()
         self.downloader = downloader
+        self.coalesce_interval = coalesce_interval
 
         app_name_text = os.environ.get("APP_NAME", "SpotTube")
         release_version = os.environ.get("RELEASE_VERSION", "unknown")
@@ -33,13 +62,13 @@ class DataHandler:
 
         self._stop_monitoring_event = threading.Event()
         self._stop_monitoring_event.clear()
+        self._clients_lock = threading.Lock()
+        self._broadcaster_lock = threading.Lock()
+        self._broadcaster_started = False
+        self.clients = {}
+        self.rooms = {}
+        self._pending_snapshots: dict[str, Room] = {}
 
-        config = Config()
-
-        full_cookies_path = os.path.join(config.config_folder, "cookies.txt")
-        self.cookies_path = (
-            full_cookies_path if os.path.exists(full_cookies_path) else None
-        )
         self.reset()
 
     @property
@@ -80,31 +109,260 @@ class DataHandler:
         Resets the data handler
         """
         self.downloader.stop_downloading_event.clear()
-        self.stop_monitoring_event.clear()
-        self.monitor_active_flag = False
         self.downloader.reset()
 
-    def monitor(self, socketio: SocketIO):
+    def start_monitoring(self, socketio: SocketIO):
         """
-        Monitors the progress of the download
+        Start the broadcaster shared by all clients, if it is not running yet
 
         Args:
             socketio (SocketIO): The socketio object
         """
+        with self._broadcaster_lock:
+            if self._broadcaster_started:
+                return
+            self._broadcaster_started = True
+            self.stop_monitoring_event.clear()
+        socketio.start_background_task(self.monitor, socketio)
+
+    def stop_monitoring(self):
+        """
+        Stop the broadcaster
+        """
+        self.stop_monitoring_event.set()
+        state_clock.wake()
+
+    def add_client(self, sid: str) -> Room:
+        """
+        Register a client on the first page, it will receive a full snapshot
+
+        Args:
+            sid (str): The socket.io session ID of the client
 
+        Returns:
+            Room: The room the client has to join
+        """
+        return self.set_window(sid, 0, DEFAULT_PAGE_SIZE)
+
+    def remove_client(self, sid: str):
+        """
+        Forget a disconnected client
+
+        Args:
+            sid (str): The socket.io session ID of the client
+        """
+        with self._clients_lock:
+            self._pending_snapshots.pop(sid, None)
+            room = self.clients.pop(sid, None)
+            if room is not None:
+                self._leave(sid, room)
+
+    def request_resync(self, sid: str):
+        """
+        Send a full snapshot to the client on the next update
+
+        Args:
+            sid (str): The socket.io session ID of the client
+        """
+        with self._clients_lock:
+            room = self.clients.get(sid)
+            if room is not None:
+                self._pending_snapshots[sid] = room
+        state_clock.wake()
+
+    def set_window(
+        self, sid: str, offset: int, limit: int, status_filter: str | None = None
+    ) -> Room:
+        """
+        Change the page of the download list a client receives updates for
+
+        Args:
+            sid (str): The socket.io session ID of the client
+            offset (int): The position of the first visible track
+            limit (int): The number of visible tracks, from 1 to `MAX_PAGE_SIZE`
+            status_filter (str | None): Only show tracks with this status
+
+        Returns:
+            Room: The room the client has to join
+        """
+        window = (
+            max(offset, 0),
+            min(max(limit, 1), MAX_PAGE_SIZE),
+            status_filter or None,
+        )
+        with self._clients_lock:
+            previous = self.clients.get(sid)
+            if previous is not None:
+                self._leave(sid, previous)
+            room = self.rooms.get(window)
+            if room is None:
+                room = self.rooms[window] = Room(window, sent=state_clock.current)
+            room.members.add(sid)
+            self.clients[sid] = room
+            self._pending_snapshots[sid] = room
+        state_clock.wake()
+        return room
+
+    def _leave(self, sid: str, room: Room):
+        """
+        Remove a client from a room, dropping the room once it is empty
+        """
+        room.members.discard(sid)
+        if not room.members:
+            self.rooms.pop(room.window, None)
+
+    def _progress(self, version: int) -> dict:
+        """
+        Get the overall progress of the download
+
+        Args:
+            version (int): The version the progress belongs to
+
+        Returns:
+            dict: The status, completion percentage and version
+        """
+        total = self.downloader.total
+        percent_completion = 100 * (self.index / total) if total else 0
+        return {
+            "version": version,
+            "status": self.status.value,
+            "percent_completion": percent_completion,
+        }
+
+    def snapshot(
+        self, offset: int = 0, limit: int = 100, status_filter: str | None = None
+    ) -> dict:
+        """
+        Get a page of the download list
+
+        Args:
+            offset (int): The position of the first track
+            limit (int): The maximum number of tracks
+            status_filter (str | None): Only include tracks with this status
+
+        Returns:
+            dict: The snapshot payload
+        """
+        with self.downloader.lock:
+            version = state_clock.current
+            total, tracks = self.downloader.query_tracks(offset, limit, status_filter)
+            data = [track.model_dump() for track in tracks]
+        return {
+            "type": "snapshot",
+            "offset": offset,
+            "total": total,
+            "data": data,
+            **self._progress(version),
+        }
+
+    def delta(
+        self,
+        since: int,
+        offset: int = 0,
+        limit: int = 100,
+        status_filter: str | None = None,
+    ) -> dict | None:
+        """
+        Get the tracks of a page changed after a version
+
+        Args:
+            since (int): The version the client already has
+            offset (int): The position of the first track
+            limit (int): The maximum number of tracks
+            status_filter (str | None): Only include tracks with this status
+
+        Returns:
+            dict | None: The delta payload, or None if a snapshot is required
+        """
+        with self.downloader.lock:
+            # A filtered page changes membership with every status change, and
+            # inserts or removals shift every position
+            if status_filter or since < self.downloader.structure_version:
+                return None
+            version = state_clock.current
+            total, tracks = self.downloader.query_tracks(offset, limit)
+            data = [track.model_dump() for track in tracks if track.version > since]
+        return {
+            "type": "delta",
+            "base": since,
+            "offset": offset,
+            "total": total,
+            "data": data,
+            **self._progress(version),
+        }
+
+    def monitor(self, socketio: SocketIO):
+        """
+        Broadcasts the progress of the download to every client
+
+        Sleeps until the downloader changes state, then waits a short interval
+        to coalesce bursts of changes before broadcasting.
+
+        Args:
+            socketio (SocketIO): The socketio object
+        """
+        version = state_clock.current
         while not self.stop_monitoring_event.is_set():
-            index = self.index
-            status = self.status
-            download_list = self.downloader.download_list
-            percent_completion = (
-                100 * (index / len(download_list)) if download_list else 0
-            )
-            download_list_dump = [track.model_dump() for track in download_list]
-            custom_data = {
-                "data": download_list_dump,
-                "status": status.value,
-                "percent_completion": percent_completion,
-            }
-            logger.debug(f"Emitted update progress status: {custom_data}")
-            socketio.emit("progress_status", custom_data)
-            self.stop_monitoring_event.wait(1)
+            state_clock.wait(version)
+            if self.coalesce_interval:
+                self.stop_monitoring_event.wait(self.coalesce_interval)
+            version = state_clock.current
+            self.broadcast(socketio, version)
+
+    def broadcast(self, socketio: SocketIO, version: int):
+        """
+        Send every room the tracks of its page changed since its last update
+
+        New and out-of-sync clients receive a snapshot of their page. A room
+        whose page and progress didn't change gets nothing, as changes to
+        other pages tick the version too.
+
+        Args:
+            socketio (SocketIO): The socketio object
+            version (int): The current version of the downloader state
+        """
+        with self._clients_lock:
+            snapshots = self._pending_snapshots
+            self._pending_snapshots = {}
+            rooms = [room for room in self.rooms.values() if room.sent < version]
+
+        payloads: dict[tuple, dict] = {}
+        for sid, room in snapshots.items():
+            if room.window not in payloads:
+                payloads[room.window] = self.snapshot(*room.window)
+            if room.progress is None:
+                room.progress = self._progress_key(payloads[room.window])
+            self._emit(socketio, payloads[room.window], sid)
+
+        for room in rooms:
+            payload = self.delta(room.sent, *room.window)
+            if payload is None:
+                payload = payloads.get(room.window) or self.snapshot(*room.window)
+            progress = self._progress_key(payload)
+            if (
+                payload["type"] == "delta"
+                and not payload["data"]
+                and progress == room.progress
+            ):
+                # The next delta is based on the version the clients have
+                continue
+            room.sent = payload["version"]
+            room.progress = progress
+            self._emit(socketio, payload, room.name)
+
+    @staticmethod
+    def _progress_key(payload: dict) -> tuple:
+        """
+        Get the parts of a payload shown outside of the track rows
+        """
+        return payload["total"], payload["status"], payload["percent_completion"]
+
+    def _emit(self, socketio: SocketIO, payload: dict, to: str):
+        """
+        Emit a progress payload to a client or room
+        """
+        logger.debug(
+            f"Emitted {payload['type']} progress status v{payload['version']} "
+            f"to {to}: {len(payload['data'])} tracks"
+        )
+        socketio.emit("progress_status", payload, to=to)
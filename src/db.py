@@ -1,14 +1,191 @@
+import queue
+import re
 import sqlite3
+import threading
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
 from datetime import datetime
 
 import click
 from flask import Flask, current_app, g
 from flask.cli import with_appcontext
+from loguru import logger
+
+# The table a statement of schema.sql creates, or creates an index on
+CREATED_TABLE = re.compile(r"^CREATE\s+(?:TABLE|INDEX\s+\w+\s+ON)\s+(\w+)", re.I)
+
+
+class ConnectionPool:
+    """
+    Pool of SQLite connections shared by every thread
+
+    Connections are not tied to Flask's `g`, so the downloader workers, jobs
+    and background tasks can use the database outside of a request. The
+    database runs in WAL mode with `synchronous=NORMAL`: readers never block
+    the writer, and a commit does not wait for an fsync. Writes are
+    serialized within the process, as SQLite only allows a single writer.
+    """
+
+    def __init__(self, path: str, size: int = 4, timeout: float = 30.0):
+        self.path = path
+        self.size = max(size, 1)
+        self.timeout = timeout
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Open a new connection
+        """
+        conn = sqlite3.connect(
+            self.path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            timeout=self.timeout,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """
+        Take a connection from the pool, waiting if all of them are in use
+
+        Returns:
+            sqlite3.Connection: The connection, to be given back with `release`
+
+        Raises:
+            sqlite3.OperationalError: If no connection was free within `timeout`
+                seconds, as for a database that stays locked
+        """
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._connect()
+            except sqlite3.Error:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"No free database connection within {self.timeout}s"
+            ) from None
+
+    def release(self, conn: sqlite3.Connection):
+        """
+        Give a connection back to the pool, rolling back any open transaction
+
+        Args:
+            conn (sqlite3.Connection): The connection taken with `acquire`
+        """
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a connection for the duration of a block
+
+        Examples:
+            >>> with pool.connection() as conn:
+            ...     conn.execute("SELECT * FROM aliases").fetchall()
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Run a block of writes as a single transaction
+
+        The transaction is committed when the block ends, and rolled back if
+        it raises.
+
+        Examples:
+            >>> with pool.transaction() as conn:
+            ...     conn.executemany("INSERT INTO aliases VALUES (?, ?)", rows)
+        """
+        with self._write_lock, self.connection() as conn:
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def close(self):
+        """
+        Close the idle connections
+        """
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+_pool: ConnectionPool | None = None
+
+
+def configure(path: str, size: int = 4):
+    """
+    Point the shared connection pool at a database file
+
+    Examples:
+        >>> configure("instance/spottube.sqlite")
+
+    Args:
+        path (str): The path of the database file
+        size (int): The maximum number of open connections
+    """
+    global _pool
+    if _pool is not None:
+        _pool.close()
+    _pool = ConnectionPool(path, size)
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Get the shared connection pool
+
+    Returns:
+        ConnectionPool: The pool
+
+    Raises:
+        RuntimeError: If the database was not configured with `init_app` or `configure`
+    """
+    if _pool is None:
+        raise RuntimeError("The database is not configured")
+    return _pool
 
 
 def get_db() -> sqlite3.Connection:
     """
-    Get the database
+    Get a connection for the current app context
+
+    The connection is borrowed from the shared pool and given back when the
+    app context ends.
 
     Examples:
         >>> get_db()
@@ -17,22 +194,30 @@ def get_db() -> sqlite3.Connection:
         The database
     """
     if "db" not in g:
-        g.db = sqlite3.connect(
-            current_app.config["DATABASE"], detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+        g.db = get_pool().acquire()
 
     return g.db
 
 
 def close_db(e=None):
     """
-    Close the database
+    Give the connection of the app context back to the pool
     """
     db = g.pop("db", None)
 
     if db is not None:
-        db.close()
+        get_pool().release(db)
+
+
+def read_schema() -> str:
+    """
+    Read the statements that create the tables
+
+    Returns:
+        str: The contents of schema.sql
+    """
+    with current_app.open_resource("schema.sql", "r", encoding="utf8") as f:
+        return f.read()
 
 
 def init_db():
@@ -42,10 +227,33 @@ def init_db():
     Examples:
         >>> init_db()
     """
-    db = get_db()
+    with get_pool().transaction() as db:
+        db.executescript(read_schema())
+
+
+def ensure_db():
+    """
+    Initialize the database, unless its tables already exist
 
-    with current_app.open_resource("schema.sql") as f:
-        db.executescript(f.read().decode("utf8"))
+    Unlike `init_db`, existing data is kept, so restarts don't have to rebuild
+    the tables, and tables added to schema.sql in newer versions are created
+    alongside, with their indexes.
+
+    Examples:
+        >>> ensure_db()
+    """
+    tables = {
+        row["name"]
+        for row in query_db("SELECT name FROM sqlite_master WHERE type='table'")
+    }
+    if not {"aliases", "track_queue"} <= tables:
+        init_db()
+        return
+    # Tables added since the database was created, made without a reset
+    for statement in read_schema().split(";"):
+        created = CREATED_TABLE.match(statement.strip())
+        if created and created.group(1) not in tables:
+            exec_db(statement.strip())
 
 
 def query_db(query, args=(), one=False):
@@ -67,8 +275,8 @@ def query_db(query, args=(), one=False):
     Returns:
         The result of the query
     """
-    with current_app.app_context():
-        cur = get_db().execute(query, args)
+    with get_pool().connection() as db:
+        cur = db.execute(query, args)
         rv = cur.fetchall()
         cur.close()
         return (rv[0] if rv else None) if one else rv
@@ -84,18 +292,41 @@ def exec_db(query, args=()) -> bool:
 
     Returns:
         True if the query was executed successfully, False otherwise
+    """
+    try:
+        with get_pool().transaction() as db:
+            db.execute(query, args)
+    except sqlite3.Error as e:
+        logger.error(f"Error executing {query!r}: {e}")
+        return False
+    return True
 
-    Raises:
-        sqlite3.Error: If the query fails
+
+def exec_many(query, args_seq: Iterable[tuple]) -> bool:
     """
+    Execute a query once per set of arguments, in a single transaction
 
+    Either every row is written or none is, and the batch costs one commit.
+
+    Examples:
+        >>> exec_many(
+        ...     "INSERT INTO aliases (alias, artist) VALUES (?, ?)",
+        ...     [("alias1", "artist1"), ("alias2", "artist2")],
+        ... )
+        True
+
+    Args:
+        query (str): The query to execute
+        args_seq (Iterable[tuple]): The arguments of each execution
+
+    Returns:
+        True if the batch was executed successfully, False otherwise
+    """
     try:
-        with current_app.app_context():
-            cur = get_db().execute(query, args)
-            get_db().commit()
-            cur.close()
+        with get_pool().transaction() as db:
+            db.executemany(query, args_seq)
     except sqlite3.Error as e:
-        print(e)
+        logger.error(f"Error executing {query!r} in batch: {e}")
         return False
     return True
 
@@ -123,5 +354,6 @@ def init_app(app: Flask):
     Args:
         app (Flask): The app to initialize
     """
+    configure(app.config["DATABASE"])
     app.teardown_appcontext(close_db)
     app.cli.add_command(init_db_command)
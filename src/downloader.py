@@ -1,21 +1,65 @@
 import concurrent.futures
 import os
-import tempfile
 import threading
+import time
+import uuid
+from collections import Counter, deque
 from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
 
-import yt_dlp  # type: ignore
 from loguru import logger
-from thefuzz import fuzz  # type: ignore
-from ytmusicapi import YTMusic  # type: ignore
 
+from src import history
 from src.aliases import Aliases
-from src.config import Config
+from src.bandwidth import BandwidthBudget, parse_rate, parse_schedule
+from src.cache import SearchCache
+from src.clock import state_clock
+from src.config import Config, get_config
+from src.cookies import CookiePool
+from src.hedging import Hedger, LatencyWindow, SearchBudget
+from src.library import LibraryIndex, video_id
+from src.lookahead import Lookahead
+from src.metrics import (
+    ACTIVE_WORKERS,
+    POSTPROCESS_SECONDS,
+    RESOLUTION_SECONDS,
+    RETRIES_TOTAL,
+    SEARCH_SECONDS,
+    TRACKS_TOTAL,
+    TRANSFER_BYTES_PER_SECOND,
+    TRANSFER_SECONDS,
+)
+from src.pool import WorkerPool
+from src.resolver import ResolutionEngine
+from src.retry import RetryScheduler
 from src.spotify import Track
-from src.status import DownloadStatus
+from src.staging import StagingArea, is_disk_full
+from src.standin import StandInYTMusic
+from src.startup import lazy_import
+from src.status import FINISHED_STATUSES, DownloadStatus
+from src.tracing import Tracer
 from src.utils import string_cleaner
 
-config = Config()
+if TYPE_CHECKING:
+    from ytmusicapi import YTMusic  # type: ignore
+
+# A candidate within this many seconds (or this share of the track duration,
+# whichever is larger) of the Spotify duration counts as the same recording
+DURATION_TOLERANCE_SECONDS = 5
+DURATION_TOLERANCE_RATIO = 0.03
+
+# Finished tracks are moved to the database in batches of at least this many
+SPILL_BATCH = 256
+
+# How often the lookahead window is refilled at least, while workers are busy
+LOOKAHEAD_POLL_SECONDS = 1.0
+
+# Trace stage names of the yt-dlp post-processors we run
+POSTPROCESSOR_STAGES = {
+    "ExtractAudio": "transcode",
+    "EmbedThumbnail": "embed_thumbnail",
+    "Metadata": "metadata",
+}
 
 
 @dataclass
@@ -26,21 +70,90 @@ class Downloader:
     """
 
     aliases: Aliases
-    index: int = 0
+    config: Config
+    _index: int = 0
+    _counted: set[str] = field(default_factory=set)
     _stop_downloading_event: threading.Event = field(default_factory=threading.Event)
     running_flag: bool = False
     futures: list[concurrent.futures.Future] = field(default_factory=list)
     _download_list: list[Track] = field(default_factory=list)
     _status: DownloadStatus = DownloadStatus.UNKNOWN
+    _tracks_by_id: dict[str, Track] = field(default_factory=dict)
+    _run: str = ""
+    _spilled: int = 0
+    structure_version: int = 0
+    version: int = 0
+    lock: threading.RLock = field(default_factory=threading.RLock)
+    tracer: Tracer = field(default_factory=Tracer)
+    engine: ResolutionEngine = field(default_factory=ResolutionEngine)
+    workers: WorkerPool = field(default_factory=lambda: WorkerPool(1))
+    search_cache: SearchCache = field(default_factory=SearchCache)
+    search_budget: SearchBudget = field(init=False, repr=False)
+    hedger: Hedger = field(init=False, repr=False)
+    resolution_latency: LatencyWindow = field(default_factory=LatencyWindow)
+    download_latency: LatencyWindow = field(default_factory=LatencyWindow)
+    lookahead: Lookahead = field(init=False, repr=False)
+    staging: StagingArea = field(init=False, repr=False)
+    library: LibraryIndex = field(init=False, repr=False)
+    bandwidth: BandwidthBudget = field(default_factory=BandwidthBudget)
+    cookies: CookiePool = field(init=False, repr=False)
+    retries: RetryScheduler = field(init=False, repr=False)
 
-    def __init__(self, aliases: Aliases):
+    def __init__(self, aliases: Aliases, engine: ResolutionEngine | None = None):
         super().__init__()
         self.aliases = aliases
+        self.config = get_config()
+        self.engine = engine or ResolutionEngine(self.config.resolve_concurrency)
+        self._index = 0
+        self._counted = set()
+        self._status = DownloadStatus.UNKNOWN
         self._stop_downloading_event = threading.Event()
         self._stop_downloading_event.clear()
         self._download_list: list[Track] = []
         self.running_flag = False
         self.futures: list[concurrent.futures.Future] = []
+        self._tracks_by_id = {}
+        self._run = uuid.uuid4().hex
+        self._spilled = 0
+        self.structure_version = state_clock.tick()
+        self.version = self.structure_version
+        self.lock = threading.RLock()
+        self.tracer = Tracer(export_path=self.config.trace_path or None)
+        self.workers = WorkerPool(self.config.thread_limit, name="download")
+        self.search_cache = SearchCache(
+            self.config.search_cache_size, self.config.search_cache_ttl
+        )
+        # Hedges only use the slots the resolvers leave free
+        self.search_budget = SearchBudget(self.engine.concurrency)
+        self.hedger = Hedger(
+            self.search_budget, self.config.hedge_searches, self.config.hedge_percentile
+        )
+        self.resolution_latency = LatencyWindow()
+        self.download_latency = LatencyWindow()
+        self.lookahead = Lookahead(
+            self.config.prefetch_lookahead,
+            self.resolution_latency,
+            self.download_latency,
+        )
+        self.staging = StagingArea(
+            self.config.staging_folder,
+            self.config.max_staging_bytes,
+            self.config.min_free_bytes,
+            self.config.staging_estimate_bytes,
+        )
+        self.library = LibraryIndex(self.config.download_folder)
+        self.bandwidth = BandwidthBudget(
+            parse_rate(self.config.bandwidth_limit),
+            parse_schedule(self.config.bandwidth_schedule),
+        )
+        self.cookies = CookiePool(self.config.config_folder, self.config.cookie_policy)
+        self.retries = RetryScheduler(
+            self._run_retry,
+            idle=lambda: self.queue_depth == 0 and self.workers.pending == 0,
+            max_attempts=self.config.retry_attempts,
+            base_delay=self.config.retry_base_delay,
+            max_delay=self.config.retry_max_delay,
+        )
 
     def reset(self):
         """
@@ -49,8 +162,62 @@ class Downloader:
         self._stop_downloading_event.clear()
         self.running_flag = False
         self.futures = []
-        self.index = 0
-        self._status = DownloadStatus.UNKNOWN
+        with self.lock:
+            self._counted.clear()
+            self.index = 0
+        self.status = DownloadStatus.UNKNOWN
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Get the number of tracks not yet processed
+
+        Returns:
+            int: The queue depth
+        """
+        return max(self.total - self._index, 0)
+
+    @property
+    def total(self) -> int:
+        """
+        Get the length of the download list, including tracks moved to the database
+
+        Returns:
+            int: The number of tracks
+        """
+        return self._spilled + len(self._download_list)
+
+    def resize_workers(self, thread_limit: int):
+        """
+        Change the number of download workers, without restarting the queue
+
+        New workers pick up queued songs right away; when shrinking, surplus
+        workers finish their current download before they retire.
+
+        Examples:
+            >>> downloader.resize_workers(4)
+
+        Args:
+            thread_limit (int): The new number of download workers
+        """
+        thread_limit = max(int(thread_limit), 1)
+        self.config.thread_limit = thread_limit
+        self.workers.resize(thread_limit)
+
+    @property
+    def index(self) -> int:
+        """
+        Get the index of the next song to finish
+
+        Returns:
+            int: The index
+        """
+        return self._index
+
+    @index.setter
+    def index(self, value: int):
+        self._index = value
+        self.version = state_clock.tick()
 
     @property
     def status(self) -> DownloadStatus:
@@ -65,11 +232,16 @@ class Downloader:
     @status.setter
     def status(self, value: DownloadStatus):
         self._status = value
+        self.version = state_clock.tick()
 
     @property
     def download_list(self) -> list[Track]:
         """
-        Get the download list
+        Get the tracks of the download list kept in memory
+
+        The oldest finished tracks are moved to the database, so this is the
+        end of the list from position `total - len(download_list)` on; use
+        `query_tracks` for pages of the whole list.
 
         Returns:
             list[Track]: The download list
@@ -78,7 +250,185 @@ class Downloader:
 
     @download_list.setter
     def download_list(self, value: list[Track]):
-        self._download_list = value
+        with self.lock:
+            # Keep the finished tracks of the replaced list in the history
+            finished = [
+                (self._spilled + position, track)
+                for position, track in enumerate(self._download_list)
+                if track.status in FINISHED_STATUSES
+            ]
+            if finished:
+                history.spill(self._run, finished)
+            self._run = uuid.uuid4().hex
+            self._spilled = 0
+            self._download_list = value
+            self._tracks_by_id = {track.id: track for track in value}
+            self._counted.clear()
+            self._touch_structure()
+
+    def _touch_structure(self):
+        """
+        Mark the order of the download list as changed
+
+        Positions shift on every insert or removal, so clients need a fresh page
+        rather than a delta of the rows they are showing.
+        """
+        self.structure_version = state_clock.tick()
+        self.version = self.structure_version
+
+    def add_tracks(self, tracks: list[Track]):
+        """
+        Append tracks to the download list
+
+        Tracks are re-versioned on insert, as they may have been created long
+        before they were queued (e.g. during a slow playlist extraction).
+
+        Args:
+            tracks (list[Track]): The tracks to add
+        """
+        with self.lock:
+            for track in tracks:
+                track.version = state_clock.tick()
+                self._tracks_by_id[track.id] = track
+            self._download_list.extend(tracks)
+            self._touch_structure()
+
+    def enqueue(self, tracks: list[Track]):
+        """
+        Queue tracks for download, starting the master queue if it is idle
+
+        A finished download list is cleared first.
+
+        Args:
+            tracks (list[Track]): The tracks to download
+        """
+        with self.lock:
+            self.stop_downloading_event.clear()
+            if self.status == DownloadStatus.COMPLETE:
+                self.download_list = []
+            self.add_tracks(tracks)
+            logger.debug(f"Status: {self.status}")
+
+            if self.status != DownloadStatus.RUNNING:
+                logger.debug("Resetting Downloader")
+                self._counted.clear()
+                self.index = 0
+                self.status = DownloadStatus.RUNNING
+                thread = threading.Thread(target=self.master_queue)
+                thread.daemon = True
+                thread.start()
+
+    def get_track(self, track_id: str) -> Track | None:
+        """
+        Get a queued track by its ID
+
+        Args:
+            track_id (str): The ID of the track
+
+        Returns:
+            Track | None: The track, if it is in the download list
+        """
+        return self._tracks_by_id.get(track_id)
+
+    def remove_track(self, track_id: str) -> Track | None:
+        """
+        Remove a track from the download list
+
+        Args:
+            track_id (str): The ID of the track to remove
+
+        Returns:
+            Track | None: The removed track, if it was in the download list
+        """
+        with self.lock:
+            track = self._tracks_by_id.pop(track_id, None)
+            if track is None:
+                return None
+            # By identity, as tracks compare equal to copies of the same song
+            position = next(
+                i for i, queued in enumerate(self._download_list) if queued is track
+            )
+            del self._download_list[position]
+            # The index counts processed tracks still in the list
+            if track.id in self._counted:
+                self._counted.discard(track.id)
+                self.index -= 1
+            self._touch_structure()
+        return track
+
+    def query_tracks(
+        self, offset: int = 0, limit: int = 100, status: str | None = None
+    ) -> tuple[int, list[Track]]:
+        """
+        Get a page of the download list
+
+        Finished tracks moved out of memory are read back from the database.
+
+        Examples:
+            >>> downloader.query_tracks(offset=200, limit=50, status="Queued")
+
+        Args:
+            offset (int): The position of the first track to return
+            limit (int): The maximum number of tracks to return
+            status (str | None): Only return tracks with this status
+
+        Returns:
+            tuple[int, list[Track]]: The number of matching tracks and the page
+        """
+        offset = max(offset, 0)
+        limit = max(limit, 0)
+        with self.lock:
+            if status is None:
+                tracks = self._download_list
+                spilled = self._spilled
+            else:
+                tracks = [t for t in self._download_list if t.status == status]
+                spilled = 0
+                if self._spilled and status in FINISHED_STATUSES:
+                    spilled = history.count_status(self._run, status)
+
+            page: list[Track] = []
+            if offset < spilled and limit:
+                if status is None:
+                    stop = min(offset + limit, spilled)
+                    page = history.page(self._run, offset, stop)
+                else:
+                    page = history.page_status(self._run, status, offset, limit)
+            start = max(offset - spilled, 0)
+            page += tracks[start : start + limit - len(page)]
+            return spilled + len(tracks), page
+
+    def job_status_counts(self, job_id: str) -> Counter[str]:
+        """
+        Count the tracks of a job by status
+
+        Args:
+            job_id (str): The ID of the job
+
+        Returns:
+            Counter[str]: The number of tracks of each status
+        """
+        with self.lock:
+            counts = Counter(
+                track.status.value
+                for track in self._download_list
+                if track.job_id == job_id
+            )
+        return counts + history.job_status_counts(job_id)
+
+    def job_tracks(self, job_id: str) -> list[Track]:
+        """
+        Get the tracks of a job, finished ones from the history first
+
+        Args:
+            job_id (str): The ID of the job
+
+        Returns:
+            list[Track]: The tracks
+        """
+        with self.lock:
+            tracks = [t for t in self._download_list if t.job_id == job_id]
+        return history.job_tracks(job_id) + tracks
 
     @property
     def stop_downloading_event(self) -> threading.Event:
@@ -94,54 +444,284 @@ class Downloader:
     def stop_downloading_event(self, value: threading.Event):
         self._stop_downloading_event = value
 
-    def find_youtube_link_and_download(self, song: Track):
+    def resolve_song(self, song: Track) -> str | None:
         """
-        Find the YouTube link and download the song
+        Find the YouTube link for the song, setting its status if there is none
 
         Args:
-            song (Track): The song to download
+            song (Track): The song to resolve
+
+        Returns:
+            str | None: The YouTube link
         """
+        self.tracer.start_trace(song.id, artist=song.artist, title=song.title)
+        start = time.perf_counter()
         try:
             found_link = self._find_youtube_link(song)
-            if found_link:
-                self._download_song(song, found_link)
-            else:
+            if not found_link:
                 song.status = DownloadStatus.NO_LINK_FOUND
                 logger.warning(f"No Link Found for: {song.artist} - {song.title}")
+            else:
+                song.video_id = video_id(found_link)
+            return found_link
         except Exception as e:
-            logger.error(f"Error downloading song: {song.title}. Error message: {e}")
+            logger.error(f"Error searching for song: {song.title}. Error message: {e}")
             song.status = DownloadStatus.SEARCH_FAILED
+            self.retries.schedule(song, e)
+            return None
+        finally:
+            elapsed = time.perf_counter() - start
+            RESOLUTION_SECONDS.observe(elapsed)
+            self.resolution_latency.observe(elapsed)
+
+    def download_resolved_song(self, song: Track, found_link: str):
+        """
+        Download a song whose YouTube link has been found
+
+        Args:
+            song (Track): The song to download
+            found_link (str): The YouTube link
+        """
+        if self.get_track(song.id) is None:
+            # Removed while it waited for a worker
+            logger.info(f"Skipping removed track: {song.artist} - {song.title}")
+            self.tracer.finish_trace(song.id, status=song.status.value)
+            return
+        try:
+            self._download_resolved(song, found_link)
+        finally:
+            self._finish_song(song)
+
+    def _download_resolved(self, song: Track, found_link: str):
+        """
+        Download a song, scheduling a retry if it fails
+
+        Args:
+            song (Track): The song to download
+            found_link (str): The YouTube link
+        """
+        ACTIVE_WORKERS.inc()
+        start = time.perf_counter()
+        try:
+            self._download_song(song, found_link)
+            self.download_latency.observe(time.perf_counter() - start)
+        except Exception as e:
+            logger.error(f"Error downloading song: {song.title}. Error message: {e}")
+            song.status = DownloadStatus.DOWNLOAD_FAILED
+            self.retries.schedule(song, e, found_link)
         finally:
-            self.index += 1
+            ACTIVE_WORKERS.dec()
+
+    def _finish_song(self, song: Track):
+        """
+        Record the outcome of a song and move the queue forward
+
+        Args:
+            song (Track): The processed song
+        """
+        TRACKS_TOTAL.inc(status=song.status.value)
+        self.tracer.finish_trace(song.id, status=song.status.value)
+        self._count(song)
+        self._spill_finished()
+
+    def _count(self, song: Track):
+        """
+        Move the queue forward past a song, unless it was removed meanwhile
+
+        Args:
+            song (Track): The processed song
+        """
+        with self.lock:
+            if song.id in self._tracks_by_id and song.id not in self._counted:
+                self._counted.add(song.id)
+                self.index += 1
+
+    def _run_retry(self, song: Track, found_link: str | None):
+        """
+        Retry a failed song on the download workers, waiting until it is done
+
+        Args:
+            song (Track): The failed song
+            found_link (str | None): Its YouTube link, None to search again
+        """
+        self.workers.submit(self._retry_song, song, found_link).result()
+
+    def _retry_song(self, song: Track, found_link: str | None):
+        """
+        Search for and download a failed song again
+
+        The song keeps its place in the download list and the queue index is
+        left alone, as the song was already counted as processed.
+
+        Args:
+            song (Track): The failed song
+            found_link (str | None): Its YouTube link, None to search again
+        """
+        if self.stop_downloading_event.is_set():
+            return
+        logger.warning(f"Retrying: {song.artist} - {song.title}")
+        song.status = DownloadStatus.QUEUED
+        if found_link is None:
+            found_link = self.resolve_song(song)
+        else:
+            self.tracer.start_trace(song.id, artist=song.artist, title=song.title)
+        if found_link:
+            self._download_resolved(song, found_link)
+
+        TRACKS_TOTAL.inc(status=song.status.value)
+        self.tracer.finish_trace(song.id, status=song.status.value)
+        if song.status in (
+            DownloadStatus.PROCESSING_COMPLETE,
+            DownloadStatus.FILE_ALREADY_EXISTS,
+        ):
+            self.retries.forget(song)
+            RETRIES_TOTAL.inc(outcome="recovered")
+        if self.get_track(song.id) is None:
+            # Moved to the history while it was waiting
+            history.update(song)
+
+    def _spill_finished(self):
+        """
+        Move the oldest finished tracks to the database
+
+        Only finished tracks at the start of the list are moved, and positions
+        continue from them, so pages and deltas sent to clients stay valid.
+        The most recent `history_window` finished tracks stay in memory.
+        """
+        with self.lock:
+            finished = 0
+            for track in self._download_list:
+                if track.status not in FINISHED_STATUSES:
+                    break
+                finished += 1
+            excess = finished - self.config.history_window
+            if excess < SPILL_BATCH:
+                return
+            batch = self._download_list[:excess]
+            spilled = enumerate(batch, start=self._spilled)
+            if not history.spill(self._run, list(spilled)):
+                return
+            del self._download_list[:excess]
+            for track in batch:
+                self._tracks_by_id.pop(track.id, None)
+                self._counted.discard(track.id)
+            self._spilled += excess
 
     def _find_youtube_link(self, song: Track) -> str | None:
         """
         Find the YouTube link for the song
 
+        The filtered search is preferred, and the unfiltered one runs if it
+        finds no close enough match. With hedging, the unfiltered search can
+        also run alongside a slow filtered one, and the first link found wins.
+
         Args:
             song (Track): The song to download
 
         Returns:
             str | None: The YouTube link
         """
-        ytmusic = YTMusic()
+        ytmusic = self._ytmusic()
         artist = song.artist
         title = song.title
         cleaned_artist = self._clean_artist_name(artist)
         cleaned_title = string_cleaner(title).lower()
 
-        search_results = ytmusic.search(
-            query=f"{artist} {title}", filter="songs", limit=5
-        )
-        found_link = self._search_for_link_in_results(
-            search_results, cleaned_artist, cleaned_title
-        )
+        # The best filtered result, used if neither search is close enough
+        fallback: list[dict] = []
 
-        if not found_link:
-            found_link = self._search_top_result(ytmusic, cleaned_title, cleaned_artist)
+        def search_songs() -> str | None:
+            search_results = self._search(
+                ytmusic,
+                "songs",
+                song.id,
+                query=f"{artist} {title}",
+                filter="songs",
+                limit=5,
+            )
+            ranked = self._rank_candidates(
+                search_results, cleaned_artist, cleaned_title, song.duration_ms
+            )
+            if not ranked:
+                return None
+            best = ranked[0]
+            if song.duration_ms is None or best["within_tolerance"]:
+                return self._watch_link(best["item"])
+            fallback.append(best)
+            return None
+
+        def search_top_result() -> str | None:
+            return self._search_top_result(
+                ytmusic, cleaned_title, cleaned_artist, song.id, song.duration_ms
+            )
+
+        if self.hedger.enabled:
+            found_link = self.hedger.race(search_songs, search_top_result)
+        else:
+            # The unfiltered search only runs when no candidate is close enough
+            found_link = search_songs() or search_top_result()
+        if not found_link and fallback:
+            found_link = self._watch_link(fallback[0]["item"])
 
         return found_link
 
+    def _ytmusic(self) -> "YTMusic | StandInYTMusic":
+        """
+        Get a YouTube Music client, or the stand-in client if one is configured
+        """
+        if self.config.standin_url:
+            return StandInYTMusic(self.config.standin_url)
+        return lazy_import("ytmusicapi").YTMusic()
+
+    def _search(
+        self,
+        ytmusic: "YTMusic | StandInYTMusic",
+        kind: str,
+        track_id: str = "",
+        **kwargs,
+    ) -> list[dict]:
+        """
+        Search YouTube Music and record the latency
+
+        Results are served from the search cache when the same query, filter
+        and limit were searched recently.
+
+        Args:
+            ytmusic (YTMusic): The YouTube music object
+            kind (str): The kind of search, used as the metric label
+            track_id (str): The ID of the track being searched for, for tracing
+            **kwargs: The arguments passed to YTMusic.search
+
+        Returns:
+            list[dict]: The search results
+        """
+        key = (kwargs["query"], kwargs.get("filter"), kwargs.get("limit"))
+        with self.tracer.span(
+            track_id, f"search_{kind}", query=kwargs["query"]
+        ) as span:
+            results, hit = self.search_cache.get_or_load(
+                key, lambda: self._timed_search(ytmusic, kind, **kwargs)
+            )
+            if span is not None:
+                span.attributes["cache_hit"] = hit
+            return results
+
+    def _timed_search(
+        self, ytmusic: "YTMusic | StandInYTMusic", kind: str, **kwargs
+    ) -> list[dict]:
+        """
+        Send a search to YouTube Music, recording its latency
+        """
+        with self.search_budget.slot():
+            start = time.perf_counter()
+            try:
+                return ytmusic.search(**kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                SEARCH_SECONDS.observe(elapsed, kind=kind)
+                if kind == "songs":
+                    self.hedger.latency.observe(elapsed)
+
     def _clean_artist_name(self, artist: str) -> str:
         """
         Clean the artist name
@@ -152,57 +732,125 @@ class Downloader:
         Returns:
             str: The cleaned artist name
         """
-        return string_cleaner(self.aliases.get_name(artist)).lower()
+        return self.aliases.clean_name(artist)
 
-    def _search_for_link_in_results(
-        self, search_results: list[dict], cleaned_artist: str, cleaned_title: str
-    ) -> str | None:
+    def _rank_candidates(
+        self,
+        search_results: list[dict],
+        cleaned_artist: str,
+        cleaned_title: str,
+        duration_ms: int | None = None,
+    ) -> list[dict]:
         """
-        Search for a link in the search results
+        Rank the search results that match the song, best first
+
+        A result matches if its title contains the song title, or if both its
+        title and artists are close. When the song duration is known, a result
+        within tolerance of it also matches on looser title and artist
+        similarity, and results within tolerance rank first, then close title
+        and artist matches, then the closest durations.
 
         Args:
             search_results (list): The search results
             cleaned_artist (str): The cleaned artist name
             cleaned_title (str): The cleaned title
+            duration_ms (int | None): The duration of the song on Spotify
 
         Returns:
-            str | None: The found link
+            list[dict]: The matching results, with their scores
         """
-        for item in search_results:
+        fuzz = lazy_import("thefuzz.fuzz")
+        candidates = []
+        for position, item in enumerate(search_results):
             cleaned_youtube_title = string_cleaner(item["title"]).lower()
-            if cleaned_title in cleaned_youtube_title:
-                return f"https://www.youtube.com/watch?v={item['videoId']}"
+            cleaned_youtube_artists = ", ".join(
+                string_cleaner(x["name"]).lower() for x in item.get("artists") or []
+            )
+            title_contained = cleaned_title in cleaned_youtube_title
+            title_ratio = fuzz.ratio(cleaned_title, cleaned_youtube_title)
+            artist_ratio = fuzz.ratio(cleaned_artist, cleaned_youtube_artists)
+            delta = self._duration_delta(item, duration_ms)
+            within_tolerance = delta is not None and delta <= self._duration_tolerance(
+                duration_ms
+            )
+            strict = title_contained or (title_ratio >= 90 and artist_ratio >= 90)
+            loose = (title_ratio >= 90 and artist_ratio >= 40) or (
+                title_ratio >= 40 and artist_ratio >= 90
+            )
+            if not (strict or (loose and within_tolerance)):
+                continue
+            candidates.append(
+                {
+                    "item": item,
+                    "within_tolerance": within_tolerance,
+                    "delta": delta if delta is not None else float("inf"),
+                    "strict": strict,
+                    "title_contained": title_contained,
+                    "position": position,
+                }
+            )
+        candidates.sort(
+            key=lambda c: (
+                not c["within_tolerance"],
+                not c["strict"],
+                c["delta"] if c["within_tolerance"] else 0,
+                not c["title_contained"],
+                c["position"],
+            )
+        )
+        return candidates
 
-        for item in search_results:
-            if self._is_matching_artist_and_title(item, cleaned_artist, cleaned_title):
-                return f"https://www.youtube.com/watch?v={item['videoId']}"
+    @staticmethod
+    def _watch_link(item: dict) -> str:
+        """
+        Get the YouTube link of a search result
+        """
+        return f"https://www.youtube.com/watch?v={item['videoId']}"
 
-        return None
+    @staticmethod
+    def _duration_tolerance(duration_ms: int | None) -> float:
+        """
+        Get the allowed duration difference for a song, in seconds
+        """
+        if not duration_ms:
+            return 0.0
+        return max(
+            DURATION_TOLERANCE_SECONDS, duration_ms / 1000 * DURATION_TOLERANCE_RATIO
+        )
 
-    def _is_matching_artist_and_title(
-        self, item: dict, cleaned_artist: str, cleaned_title: str
-    ) -> bool:
+    @staticmethod
+    def _duration_delta(item: dict, duration_ms: int | None) -> float | None:
         """
-        Check if the item is a matching artist and title
+        Get the difference between the duration of a search result and of the song
 
         Args:
-            item (dict): The item to check
-            cleaned_artist (str): The cleaned artist name
-            cleaned_title (str): The cleaned title
+            item (dict): The search result
+            duration_ms (int | None): The duration of the song on Spotify
 
         Returns:
-            bool: True if the item is a matching artist and title, False otherwise
+            float | None: The difference in seconds, or None if either is unknown
         """
-        cleaned_youtube_title = string_cleaner(item["title"]).lower()
-        cleaned_youtube_artists = ", ".join(
-            string_cleaner(x["name"]).lower() for x in item["artists"]
-        )
-        title_ratio = fuzz.ratio(cleaned_title, cleaned_youtube_title)
-        artist_ratio = fuzz.ratio(cleaned_artist, cleaned_youtube_artists)
-        return title_ratio >= 90 and artist_ratio >= 90
+        if not duration_ms:
+            return None
+        seconds = item.get("duration_seconds")
+        if seconds is None and item.get("duration"):
+            try:
+                seconds = 0
+                for part in str(item["duration"]).split(":"):
+                    seconds = seconds * 60 + int(part)
+            except ValueError:
+                return None
+        if seconds is None:
+            return None
+        return abs(seconds - duration_ms / 1000)
 
     def _search_top_result(
-        self, ytmusic: YTMusic, cleaned_title: str, cleaned_artist: str
+        self,
+        ytmusic: "YTMusic | StandInYTMusic",
+        cleaned_title: str,
+        cleaned_artist: str,
+        track_id: str = "",
+        duration_ms: int | None = None,
     ) -> str | None:
         """
         Search for the top result
@@ -211,27 +859,38 @@ class Downloader:
             ytmusic (YTMusic): The YouTube music object
             cleaned_title (str): The cleaned title
             cleaned_artist (str): The cleaned artist name
+            track_id (str): The ID of the track being searched for, for tracing
+            duration_ms (int | None): The duration of the song on Spotify
 
         Returns:
             str | None: The found link
         """
-        top_search_results = ytmusic.search(query=cleaned_title, limit=5)
+        top_search_results = self._search(
+            ytmusic, "top_result", track_id, query=cleaned_title, limit=5
+        )
         if top_search_results:
             return self._evaluate_top_result(
-                top_search_results[0], cleaned_artist, cleaned_title
+                top_search_results[0], cleaned_artist, cleaned_title, duration_ms
             )
         return None
 
     def _evaluate_top_result(
-        self, top_result: dict, cleaned_artist: str, cleaned_title: str
+        self,
+        top_result: dict,
+        cleaned_artist: str,
+        cleaned_title: str,
+        duration_ms: int | None = None,
     ) -> str | None:
         """
         Evaluate the top result
 
+        A top result whose duration is known to be off is rejected.
+
         Args:
             top_result (dict): The top result
             cleaned_artist (str): The cleaned artist name
             cleaned_title (str): The cleaned title
+            duration_ms (int | None): The duration of the song on Spotify
 
         Returns:
             str: The found link
@@ -240,19 +899,26 @@ class Downloader:
         cleaned_youtube_artists = ", ".join(
             string_cleaner(x["name"]).lower() for x in top_result["artists"]
         )
+        fuzz = lazy_import("thefuzz.fuzz")
         title_ratio = fuzz.ratio(cleaned_title, cleaned_youtube_title)
         artist_ratio = fuzz.ratio(cleaned_artist, cleaned_youtube_artists)
 
+        delta = self._duration_delta(top_result, duration_ms)
+        if delta is not None and delta > self._duration_tolerance(duration_ms):
+            return None
         if (title_ratio >= 90 and artist_ratio >= 40) or (
             title_ratio >= 40 and artist_ratio >= 90
         ):
-            return f"https://www.youtube.com/watch?v={top_result['videoId']}"
+            return self._watch_link(top_result)
         return None
 
     def _download_song(self, song: Track, found_link: str):
         """
         Download the song
 
+        A video already downloaded for another track is linked to the new path
+        instead, and tracks of a video being downloaded wait for it.
+
         Args:
             song (Track): The song to download
             found_link (str): The found link
@@ -263,7 +929,7 @@ class Downloader:
             string_cleaner(folder),
             f"{string_cleaner(song.title)} - {string_cleaner(cleaned_artist_name)}",
         )
-        download_folder = config.download_folder
+        download_folder = self.config.download_folder
         full_file_path = os.path.join(download_folder, f"{file_name}.mp3")
 
         if os.path.exists(full_file_path):
@@ -271,37 +937,81 @@ class Downloader:
             logger.warning(f"File Already Exists: {song.artist} - {song.title}")
             return
 
-        self._perform_download(song, found_link, file_name)
+        found_video_id = video_id(found_link)
+        stop_event = self._stop_downloading_event
+        with self.library.claim(found_video_id, stop_event) as existing:
+            if existing is not None:
+                method = self.library.link(existing, f"{file_name}.mp3")
+                song.status = DownloadStatus.PROCESSING_COMPLETE
+                logger.warning(f"Already downloaded, {method}: {found_link}")
+                return
+            self._perform_download(song, found_link, file_name)
+            if song.status == DownloadStatus.PROCESSING_COMPLETE:
+                self.library.record(found_video_id, f"{file_name}.mp3")
+
+        if song.status == DownloadStatus.PROCESSING_COMPLETE:
+            with self.tracer.span(song.id, "sleep_interval"):
+                self._stop_downloading_event.wait(self.config.sleep_interval)
 
     def _perform_download(self, song: Track, found_link: str, file_name: str):
         """
         Perform the actual download of the song
+
+        yt-dlp writes to a private directory in the staging folder, and the
+        finished file is renamed into the download folder. A download waits
+        for disk space before it starts, and one that fills the disk is
+        retried once space is freed rather than failed.
         """
-        temp_dir = None
-        try:
-            temp_dir = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
-            ydl_opts = self._get_ydl_options(file_name, temp_dir, song)
-            yt_downloader = yt_dlp.YoutubeDL(ydl_opts)
-            yt_downloader.download([found_link])
-            song.status = DownloadStatus.PROCESSING_COMPLETE
-            logger.warning(f"yt_dl Complete: {found_link}")
-            self._stop_downloading_event.wait(config.sleep_interval)
-        except Exception as e:
-            logger.error(f"Error downloading song: {found_link}. Error message: {e}")
-            song.status = DownloadStatus.DOWNLOAD_FAILED
-        finally:
-            if temp_dir is not None:
-                temp_dir.cleanup()
+        while True:
+            disk_full = False
+            with self.staging.reserve(self._stop_downloading_event) as staging_dir:
+                if staging_dir is None:
+                    song.status = DownloadStatus.STOPPED
+                    return
+                account = self.cookies.acquire()
+                try:
+                    ydl_opts = self._get_ydl_options(file_name, staging_dir, song)
+                    if account is not None:
+                        ydl_opts["cookiefile"] = account.path
+                    yt_downloader = lazy_import("yt_dlp").YoutubeDL(ydl_opts)
+                    with self.bandwidth.share(song.id, yt_downloader.params):
+                        yt_downloader.download([found_link])
+                    self.cookies.release(account)
+                    account = None
+                    self.staging.finalize(
+                        os.path.join(staging_dir, f"{file_name}.mp3"),
+                        os.path.join(self.config.download_folder, f"{file_name}.mp3"),
+                    )
+                except Exception as e:
+                    if self._stop_downloading_event.is_set():
+                        self.cookies.cancel(account)
+                    else:
+                        self.cookies.release(account, e)
+                    if not is_disk_full(e) or self._stop_downloading_event.is_set():
+                        logger.error(
+                            f"Error downloading song: {found_link}. Error message: {e}"
+                        )
+                        song.status = DownloadStatus.DOWNLOAD_FAILED
+                        if not self._stop_downloading_event.is_set():
+                            self.retries.schedule(song, e, found_link)
+                        return
+                    logger.warning(f"Disk full, retrying later: {found_link}")
+                    disk_full = True
+            if disk_full:
+                self.staging.report_full()
+                continue
+            break
 
-    def _get_ydl_options(
-        self, file_name: str, temp_dir: tempfile.TemporaryDirectory, song: Track
-    ) -> dict:
+        song.status = DownloadStatus.PROCESSING_COMPLETE
+        logger.warning(f"yt_dl Complete: {found_link}")
+
+    def _get_ydl_options(self, file_name: str, staging_dir: str, song: Track) -> dict:
         """
         Get the ydl options
 
         Args:
             file_name (str): The file name
-            temp_dir (TemporaryDirectory): The temporary directory
+            staging_dir (str): The staging directory of the download
             song (dict): The song to download
 
         Returns:
@@ -309,15 +1019,16 @@ class Downloader:
         """
         return {
             "logger": logger,
-            "ffmpeg_location": config.ffmpeg_path,
+            "ffmpeg_location": self.config.ffmpeg_path,
             "format": "bestaudio",
             "outtmpl": f"{file_name}.%(ext)s",
             "paths": {
-                "home": config.download_folder,
-                "temp": temp_dir.name,
+                "home": staging_dir,
+                "temp": staging_dir,
             },
             "quiet": False,
             "progress_hooks": [lambda d: self.progress_callback(d, song)],
+            "postprocessor_hooks": [lambda d: self.postprocessor_callback(d, song)],
             "writethumbnail": True,
             "updatetime": False,
             "postprocessors": [
@@ -343,9 +1054,36 @@ class Downloader:
             raise Exception("Cancelled")
         if d["status"] == "finished":
             logger.warning("Download complete")
+            elapsed = d.get("elapsed")
+            total_bytes = d.get("total_bytes") or d.get("downloaded_bytes")
+            self.tracer.end(song.id, "download", bytes=total_bytes or 0)
+            if elapsed:
+                TRANSFER_SECONDS.observe(elapsed)
+                if total_bytes:
+                    TRANSFER_BYTES_PER_SECOND.observe(total_bytes / elapsed)
         elif d["status"] == "downloading":
+            if not self.tracer.is_open(song.id, "download"):
+                self.tracer.start(song.id, "download")
+            self.bandwidth.report(song.id, d.get("speed"))
             self._log_progress(d, song)
 
+    def postprocessor_callback(self, d: dict, song: Track):
+        """
+        Post-processor callback for the download
+
+        Args:
+            d (dict): The post-processor data
+            song (Track): The song being processed
+        """
+        postprocessor = d["postprocessor"]
+        stage = POSTPROCESSOR_STAGES.get(postprocessor, postprocessor)
+        if d["status"] == "started":
+            self.tracer.start(song.id, stage, postprocessor=postprocessor)
+        elif d["status"] == "finished":
+            span = self.tracer.end(song.id, stage)
+            if span is not None:
+                POSTPROCESS_SECONDS.observe(span.duration, postprocessor=postprocessor)
+
     def _log_progress(self, d: dict, song: Track):
         """
         Log the progress
@@ -374,39 +1112,104 @@ class Downloader:
                 f"Download status: {self.status}, stop downloading event: {self.stop_downloading_event.is_set()}"
             )
             self.running_flag = True
-            while not self.stop_downloading_event.is_set() and self.index < len(
-                self.download_list
-            ):
-                self._status = DownloadStatus.RUNNING
+            # Pick up cookie files added since the last run
+            self.cookies.load()
+            while True:
+                # Checked and finished together, so tracks enqueued meanwhile
+                # either are seen here or start a new master queue
+                with self.lock:
+                    stopped = self.stop_downloading_event.is_set()
+                    if stopped or self.index >= self.total:
+                        self.running_flag = False
+                        self.status = (
+                            DownloadStatus.STOPPED
+                            if stopped
+                            else DownloadStatus.COMPLETE
+                        )
+                        break
+                    self.status = DownloadStatus.RUNNING
                 self._process_downloads()
-            self.running_flag = False
-            self._status = (
-                DownloadStatus.COMPLETE
-                if not self.stop_downloading_event.is_set()
-                else DownloadStatus.STOPPED
-            )
-            logger.warning(
-                "Finished" if not self.stop_downloading_event.is_set() else "Stopped"
-            )
+            logger.warning("Stopped" if stopped else "Finished")
         except Exception as e:
             logger.error(f"Error in Master Queue: {str(e)}")
-            self._status = DownloadStatus.ERROR
+            self.status = DownloadStatus.ERROR
             self.running_flag = False
 
     def _process_downloads(self):
         """
         Process the downloads
+
+        Links of the next queued songs are resolved on the resolution engine,
+        within the lookahead window, and each song is handed to the download
+        workers as soon as its link is found, so a free worker starts its
+        transfer right away. Stopping cancels the outstanding resolutions.
         """
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=config.thread_limit
-        ) as executor:
-            self.futures = []
-            start_position = self.index
-            for song in self.download_list[start_position:]:
-                if self.stop_downloading_event.is_set():
-                    break
+        self.futures = []
+        resolutions: dict[concurrent.futures.Future, Track] = {}
+        downloads: set[concurrent.futures.Future] = set()
+        with self.lock:
+            # Every track before the index is finished, and only finished
+            # tracks are moved out of memory
+            pending = deque(self._download_list[max(self.index - self._spilled, 0) :])
+        while pending or resolutions:
+            stopped = self.stop_downloading_event.is_set()
+            if stopped:
+                for future in resolutions:
+                    future.cancel()
+            window = self.lookahead.window(self.workers.size)
+            while (
+                pending
+                and not stopped
+                and len(resolutions) + self.workers.pending < window
+            ):
+                song = pending.popleft()
+                if self.get_track(song.id) is None:
+                    # Removed since the list was read
+                    continue
                 logger.warning(f"Searching for Song: {song.title} - {song.artist}")
-                self.futures.append(
-                    executor.submit(self.find_youtube_link_and_download, song)
+                future = self.engine.submit(self.resolve_song, song)
+                resolutions[future] = song
+                self.futures.append(future)
+            if stopped and not resolutions:
+                break
+
+            waiting = [*resolutions, *downloads]
+            if waiting:
+                concurrent.futures.wait(
+                    waiting,
+                    timeout=LOOKAHEAD_POLL_SECONDS,
+                    return_when=concurrent.futures.FIRST_COMPLETED,
                 )
-            concurrent.futures.wait(self.futures)
+            else:
+                # Only retries are queued on the workers
+                self.stop_downloading_event.wait(LOOKAHEAD_POLL_SECONDS)
+            for future in [future for future in resolutions if future.done()]:
+                song = resolutions.pop(future)
+                if future.cancelled():
+                    self._count(song)
+                    continue
+                found_link = future.result()
+                if not found_link:
+                    self._finish_song(song)
+                elif self.stop_downloading_event.is_set():
+                    song.status = DownloadStatus.STOPPED
+                    self._finish_song(song)
+                else:
+                    downloads.add(self._hand_off(song, found_link))
+            downloads = {future for future in downloads if not future.done()}
+        concurrent.futures.wait(self.futures)
+
+    def _hand_off(self, song: Track, found_link: str) -> concurrent.futures.Future:
+        """
+        Queue a resolved song on the download workers
+
+        Args:
+            song (Track): The song
+            found_link (str): Its YouTube link
+
+        Returns:
+            concurrent.futures.Future: The future of the download
+        """
+        future = self.workers.submit(self.download_resolved_song, song, found_link)
+        self.futures.append(future)
+        return future
@@ -0,0 +1,275 @@
+"""Hedged YouTube Music searches, within a search budget shared by every lookup"""
+
+import concurrent.futures
+import threading
+from collections import deque
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+from src.metrics import HEDGES_TOTAL
+
+HEDGE_MODES = ("off", "parallel", "deadline")
+# Latencies observed before the deadline mode starts hedging
+MIN_SAMPLES = 20
+
+
+class LatencyWindow:
+    """
+    The most recent latencies of an operation, for percentiles
+    """
+
+    def __init__(self, size: int = 1024):
+        self._samples: deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def observe(self, seconds: float):
+        """
+        Record a latency
+        """
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        """
+        Get a percentile of the recent latencies
+
+        Examples:
+            >>> window.percentile(0.99)
+            1.84
+
+        Args:
+            q (float): The percentile, between 0 and 1
+
+        Returns:
+            float | None: The latency in seconds, None if nothing was observed
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+class SearchBudget:
+    """
+    Caps the YouTube Music searches in flight, shared by resolvers and hedges
+
+    Hedges waiting for a slot get the next free one before any other search,
+    so a stuck track is helped even when every resolver is searching.
+    """
+
+    def __init__(self, size: int):
+        self.size = max(int(size), 1)
+        self._free = self.size
+        self._hedges_waiting = 0
+        self._changed = threading.Condition()
+        self._local = threading.local()
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """
+        Hold a slot while sending a search, waiting for one if needed
+
+        A thread that already holds a slot, i.e. a hedge, doesn't take another.
+        """
+        if getattr(self._local, "held", False):
+            yield
+            return
+        with self._changed:
+            self._changed.wait_for(lambda: self._free > 0 and not self._hedges_waiting)
+            self._free -= 1
+        sent = getattr(self._local, "sent", None)
+        if sent is not None and not sent.done():
+            sent.set_result(None)
+        self._local.held = True
+        try:
+            yield
+        finally:
+            self._local.held = False
+            self._release()
+
+    def run_watched(
+        self, fn: Callable[[], str | None], sent: concurrent.futures.Future
+    ) -> str | None:
+        """
+        Run a lookup, resolving `sent` once its first search gets a slot
+
+        Args:
+            fn (Callable[[], str | None]): The lookup
+            sent (concurrent.futures.Future): Resolved when a search is sent
+        """
+        self._local.sent = sent
+        try:
+            return fn()
+        finally:
+            self._local.sent = None
+
+    def run_hedge(
+        self, fn: Callable[[], str | None], abandoned: threading.Event
+    ) -> str | None:
+        """
+        Run a hedge in the next free slot, unless it is abandoned first
+
+        Args:
+            fn (Callable[[], str | None]): The hedged search
+            abandoned (threading.Event): Set once the hedge isn't needed
+
+        Returns:
+            str | None: The result of the search, None if abandoned
+        """
+        with self._changed:
+            self._hedges_waiting += 1
+            try:
+                self._changed.wait_for(lambda: self._free > 0 or abandoned.is_set())
+            finally:
+                self._hedges_waiting -= 1
+                self._changed.notify_all()
+            if abandoned.is_set():
+                HEDGES_TOTAL.inc(outcome="abandoned")
+                return None
+            self._free -= 1
+        HEDGES_TOTAL.inc(outcome="issued")
+        self._local.held = True
+        try:
+            return fn()
+        finally:
+            self._local.held = False
+            self._release()
+
+    def abandon(self, abandoned: threading.Event):
+        """
+        Stop a hedge from waiting for a slot
+        """
+        with self._changed:
+            abandoned.set()
+            self._changed.notify_all()
+
+    def _release(self):
+        """
+        Give back a slot
+        """
+        with self._changed:
+            self._free += 1
+            self._changed.notify_all()
+
+
+class Hedger:
+    """
+    Races a second search against a slow first one
+
+    With the `parallel` mode the hedge is sent with the first search; with
+    `deadline` it is sent once the first search takes longer than a
+    percentile of recent search latencies. The first link found wins; a hedge
+    still waiting for a slot of the search budget is abandoned, and a running
+    search is ignored. Hedges never take more slots than the budget has.
+    """
+
+    def __init__(
+        self,
+        budget: SearchBudget,
+        mode: str = "off",
+        percentile: float = 0.95,
+    ):
+        if mode not in HEDGE_MODES:
+            raise ValueError(f"Unknown hedge mode {mode!r}, expected {HEDGE_MODES}")
+        self.budget = budget
+        self.mode = mode
+        self.percentile = percentile
+        self.latency = LatencyWindow()
+        self._executor: concurrent.futures.ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Check if searches are hedged
+        """
+        return self.mode != "off"
+
+    def deadline(self) -> float | None:
+        """
+        Get how long the first search runs alone before the hedge is sent
+
+        Returns:
+            float | None: The delay in seconds, None to never hedge
+        """
+        if self.mode == "parallel":
+            return 0.0
+        if len(self.latency) < MIN_SAMPLES:
+            return None
+        return self.latency.percentile(self.percentile)
+
+    def _submit(self, fn: Callable, *args) -> concurrent.futures.Future:
+        """
+        Run a search off the resolver, starting the executor on first use
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=2 * self.budget.size, thread_name_prefix="hedge"
+                )
+        return self._executor.submit(fn, *args)
+
+    def race(
+        self, primary: Callable[[], str | None], hedge: Callable[[], str | None]
+    ) -> str | None:
+        """
+        Find a link with the primary search, hedged by the second one
+
+        Examples:
+            >>> hedger.race(search_songs, search_top_result)
+            'https://www.youtube.com/watch?v=...'
+
+        Args:
+            primary (Callable[[], str | None]): The preferred search
+            hedge (Callable[[], str | None]): The search run if the primary
+                one is slow or finds nothing
+
+        Returns:
+            str | None: The first link found, None if neither found one
+        """
+        sent: concurrent.futures.Future = concurrent.futures.Future()
+        first = self._submit(self.budget.run_watched, primary, sent)
+        deadline = self.deadline()
+        if deadline != 0.0:
+            # The deadline runs from when the search is sent, as a hedge can't
+            # help a search waiting for a slot
+            concurrent.futures.wait(
+                [first, sent], return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            try:
+                result = first.result(timeout=deadline)
+            except concurrent.futures.TimeoutError:
+                pass
+            else:
+                return result or hedge()
+        abandoned = threading.Event()
+        second = self._submit(self.budget.run_hedge, hedge, abandoned)
+
+        pending = {first, second}
+        errors = []
+        try:
+            while pending:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+                    if result:
+                        if future is second:
+                            HEDGES_TOTAL.inc(outcome="won")
+                        return result
+        finally:
+            # A hedge still waiting for a slot gives up, a running one is ignored
+            if second in pending:
+                self.budget.abandon(abandoned)
+        if errors:
+            raise errors[0]
+        return None
@@ -0,0 +1,168 @@
+"""Finished tracks moved out of memory, kept in the database"""
+
+from collections import Counter
+
+from src.db import exec_db, exec_many, query_db
+from src.spotify import Track
+
+COLUMNS = (
+    "id",
+    "job_id",
+    "artist",
+    "title",
+    "folder",
+    "status",
+    "release_date",
+    "album",
+    "duration_ms",
+    "version",
+)
+SELECT = f"SELECT {', '.join(COLUMNS)} FROM track_history"
+
+
+def _track(row) -> Track:
+    """
+    Rebuild a track from a history row, keeping its version
+    """
+    track = Track(**{key: row[key] for key in COLUMNS if key != "version"})
+    # Set last, as any other change ticks the version
+    track.version = row["version"]
+    return track
+
+
+def spill(run: str, tracks: list[tuple[int, Track]]) -> bool:
+    """
+    Write finished tracks to the history
+
+    Examples:
+        >>> spill(run, [(0, first_track), (1, second_track)])
+        True
+
+    Args:
+        run (str): The download list the tracks belong to
+        tracks (list[tuple[int, Track]]): The tracks and their positions in the list
+
+    Returns:
+        bool: True if every track was written, False if none was
+    """
+    return exec_many(
+        "INSERT OR REPLACE INTO track_history (run, position, "
+        f"{', '.join(COLUMNS)}) VALUES ({', '.join('?' * (len(COLUMNS) + 2))})",
+        [
+            (run, position, *(getattr(track, key) for key in COLUMNS))
+            for position, track in tracks
+        ],
+    )
+
+
+def update(track: Track) -> bool:
+    """
+    Write the new status of a track already in the history, e.g. after a retry
+
+    Args:
+        track (Track): The track
+
+    Returns:
+        bool: True if the update was executed
+    """
+    return exec_db(
+        "UPDATE track_history SET status = ?, version = ? WHERE id = ?",
+        (track.status.value, track.version, track.id),
+    )
+
+
+def page(run: str, start: int, stop: int) -> list[Track]:
+    """
+    Get the tracks of a download list between two positions
+
+    Args:
+        run (str): The download list
+        start (int): The first position
+        stop (int): The position after the last one
+
+    Returns:
+        list[Track]: The tracks, in list order
+    """
+    rows = query_db(
+        f"{SELECT} WHERE run = ? AND position >= ? AND position < ? ORDER BY position",
+        (run, start, stop),
+    )
+    return [_track(row) for row in rows]
+
+
+def count_status(run: str, status: str) -> int:
+    """
+    Count the tracks of a download list with a status
+    """
+    row = query_db(
+        "SELECT COUNT(*) AS n FROM track_history WHERE run = ? AND status = ?",
+        (run, status),
+        one=True,
+    )
+    return row["n"] if row else 0
+
+
+def page_status(run: str, status: str, offset: int, limit: int) -> list[Track]:
+    """
+    Get a page of the tracks of a download list with a status
+
+    Args:
+        run (str): The download list
+        status (str): The status
+        offset (int): The number of matching tracks to skip
+        limit (int): The maximum number of tracks
+
+    Returns:
+        list[Track]: The tracks, in list order
+    """
+    rows = query_db(
+        f"{SELECT} WHERE run = ? AND status = ? ORDER BY position LIMIT ? OFFSET ?",
+        (run, status, limit, offset),
+    )
+    return [_track(row) for row in rows]
+
+
+def job_status_counts(job_id: str) -> Counter[str]:
+    """
+    Count the finished tracks of a job by status
+    """
+    rows = query_db(
+        "SELECT status, COUNT(*) AS n FROM track_history WHERE job_id = ? "
+        "GROUP BY status",
+        (job_id,),
+    )
+    return Counter({row["status"]: row["n"] for row in rows})
+
+
+def job_tracks(job_id: str) -> list[Track]:
+    """
+    Get the finished tracks of a job
+    """
+    rows = query_db(f"{SELECT} WHERE job_id = ? ORDER BY finished, position", (job_id,))
+    return [_track(row) for row in rows]
+
+
+def recent(
+    offset: int = 0, limit: int = 100, status: str | None = None
+) -> tuple[int, list[Track]]:
+    """
+    Get finished tracks of every download list, most recent first
+
+    Examples:
+        >>> total, tracks = recent(limit=50, status="Download Failed")
+
+    Args:
+        offset (int): The number of tracks to skip
+        limit (int): The maximum number of tracks
+        status (str | None): Only return tracks with this status
+
+    Returns:
+        tuple[int, list[Track]]: The number of matching tracks and the page
+    """
+    where, args = ("WHERE status = ?", (status,)) if status else ("", ())
+    row = query_db(f"SELECT COUNT(*) AS n FROM track_history {where}", args, one=True)
+    rows = query_db(
+        f"{SELECT} {where} ORDER BY finished DESC, position DESC LIMIT ? OFFSET ?",
+        (*args, limit, offset),
+    )
+    return (row["n"] if row else 0), [_track(row) for row in rows]
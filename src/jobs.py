@@ -0,0 +1,169 @@
+"""Background jobs extracting Spotify links into the download queue"""
+
+import concurrent.futures
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+from loguru import logger
+
+from src.downloader import Downloader
+from src.spotify import SpotifyHandler, Track
+from src.status import JobStatus
+
+
+@dataclass
+class Job:
+    """
+    A Spotify link submitted for download
+    """
+
+    link: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: JobStatus = JobStatus.PENDING
+    created: float = field(default_factory=time.time)
+    finished: float | None = None
+    error: str | None = None
+    track_count: int = 0
+
+    def summary(self, track_status: Counter[str] | None = None) -> dict:
+        """
+        Get the status of the job and of its tracks
+
+        Args:
+            track_status (Counter[str] | None): The number of tracks of each status
+
+        Returns:
+            dict: The job summary
+        """
+        return {
+            "id": self.id,
+            "link": self.link,
+            "status": self.status.value,
+            "created": self.created,
+            "finished": self.finished,
+            "error": self.error,
+            "track_count": self.track_count,
+            "track_status": dict(track_status or {}),
+        }
+
+
+class JobManager:
+    """
+    Runs Spotify extractions in the background and queues their tracks
+
+    Extraction runs on its own small pool, as each extraction fans out its
+    Spotify lookups to the shared resolution engine and waits for them.
+    """
+
+    def __init__(
+        self,
+        spotify_handler: SpotifyHandler,
+        downloader: Downloader,
+        concurrency: int = 4,
+        max_jobs: int = 1000,
+    ):
+        self.spotify_handler = spotify_handler
+        self.downloader = downloader
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(concurrency, 1), thread_name_prefix="job"
+        )
+
+    def submit(self, link: str, on_done: Callable[[Job], None] | None = None) -> Job:
+        """
+        Submit a Spotify link for extraction and download
+
+        Examples:
+            >>> job = jobs.submit("https://open.spotify.com/playlist/1234567890")
+            >>> job.id
+
+        Args:
+            link (str): The Spotify link
+            on_done (Callable[[Job], None] | None): Called once the job is queued or failed
+
+        Returns:
+            Job: The submitted job
+        """
+        job = Job(link=link)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, job, on_done)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        """
+        Get a job by its ID
+
+        Args:
+            job_id (str): The ID of the job
+
+        Returns:
+            Job | None: The job, if it is known
+        """
+        return self._jobs.get(job_id)
+
+    def summary(self, job: Job) -> dict:
+        """
+        Get the status of a job and of its tracks
+
+        Tracks are not kept on the job, they are counted in the download list
+        and its history.
+
+        Args:
+            job (Job): The job
+
+        Returns:
+            dict: The job summary
+        """
+        return job.summary(self.downloader.job_status_counts(job.id))
+
+    def tracks(self, job: Job) -> list[Track]:
+        """
+        Get the tracks of a job
+
+        Args:
+            job (Job): The job
+
+        Returns:
+            list[Track]: The tracks, from the download list and its history
+        """
+        return self.downloader.job_tracks(job.id)
+
+    def list(self) -> list[Job]:
+        """
+        Get the known jobs, most recent first
+
+        Returns:
+            list[Job]: The jobs
+        """
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def _run(self, job: Job, on_done: Callable[[Job], None] | None):
+        """
+        Extract the tracks of a job and queue them for download
+        """
+        job.status = JobStatus.EXTRACTING
+        try:
+            tracks = self.spotify_handler.spotify_extractor(job.link)
+            for track in tracks:
+                track.job_id = job.id
+            job.track_count = len(tracks)
+            self.downloader.enqueue(tracks)
+            job.status = JobStatus.QUEUED
+        except Exception as e:
+            logger.error(f"Error extracting {job.link}: {str(e)}")
+            job.error = str(e)
+            job.status = JobStatus.FAILED
+        finally:
+            job.finished = time.time()
+        if on_done is not None:
+            on_done(job)
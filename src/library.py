@@ -0,0 +1,221 @@
+"""Index of downloaded YouTube videos, so each video is downloaded once"""
+
+import errno
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlparse
+
+from loguru import logger
+
+from src.db import exec_db, query_db
+from src.metrics import LIBRARY_LINKS_TOTAL
+
+# ioctl asking the filesystem to share the blocks of a file (btrfs, XFS)
+FICLONE = 0x40049409
+# Waiters for an in-flight download check the stop event at this interval
+WAIT_SECONDS = 1.0
+
+
+def video_id(link: str) -> str | None:
+    """
+    Get the video ID of a YouTube watch link
+
+    Examples:
+        >>> video_id("https://www.youtube.com/watch?v=dQw4w9WgXcQ")
+        'dQw4w9WgXcQ'
+
+    Args:
+        link (str): The watch link
+
+    Returns:
+        str | None: The video ID, or None if the link has none
+    """
+    url = urlparse(link)
+    if url.netloc.endswith("youtu.be"):
+        return url.path.strip("/") or None
+    return parse_qs(url.query).get("v", [None])[0]
+
+
+def _reflink(source: str, destination: str):
+    """
+    Clone a file without copying its data, where the filesystem supports it
+    """
+    if not sys.platform.startswith("linux"):
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are only supported on Linux")
+    import fcntl
+
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def link_file(source: str, destination: str) -> str:
+    """
+    Make a file appear at another path, sharing its data where possible
+
+    A hardlink is tried first, then a reflink, then a plain copy. The file is
+    created under a temporary name and renamed, so it appears whole.
+
+    Args:
+        source (str): The existing file
+        destination (str): The new path
+
+    Returns:
+        str: "hardlink", "reflink" or "copy"
+    """
+    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+    partial = f"{destination}.part"
+    try:
+        try:
+            os.link(source, partial)
+            method = "hardlink"
+        except OSError:
+            try:
+                _reflink(source, partial)
+                method = "reflink"
+            except OSError:
+                shutil.copyfile(source, partial)
+                method = "copy"
+        os.replace(partial, destination)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return method
+
+
+class LibraryIndex:
+    """
+    Maps YouTube video IDs to the file they were downloaded to
+
+    The index is kept in the `downloads` table, with paths relative to the
+    download folder, and loaded into memory on first use. Only one download
+    per video ID runs at a time; other tracks of the same video wait for it
+    and then link its file.
+    """
+
+    def __init__(self, download_folder: str):
+        self.download_folder = download_folder
+        self._paths: dict[str, str] = {}
+        self._loaded = False
+        self._in_flight: dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def _load(self):
+        """
+        Load the index from the database, with the lock held
+        """
+        self._loaded = True
+        try:
+            rows = query_db("SELECT video_id, path FROM downloads")
+        except (RuntimeError, sqlite3.Error) as e:
+            logger.warning(f"Download index not loaded: {e}")
+            return
+        self._paths.update((row["video_id"], row["path"]) for row in rows)
+
+    def _existing(self, video_id: str) -> str | None:
+        """
+        Get the file of a video, if it is still there, with the lock held
+        """
+        path = self._paths.get(video_id)
+        if path is None:
+            return None
+        full_path = os.path.join(self.download_folder, path)
+        if os.path.exists(full_path):
+            return full_path
+        # Deleted or moved since, so it has to be downloaded again
+        del self._paths[video_id]
+        return None
+
+    @contextmanager
+    def claim(
+        self, video_id: str | None, stop_event: threading.Event
+    ) -> Iterator[str | None]:
+        """
+        Get the file of a video, or the right to download it
+
+        When another track is downloading the same video, this waits for it to
+        finish. If that download fails, the next waiter gets to download it.
+
+        Examples:
+            >>> with library.claim(video_id, stop_event) as existing:
+            ...     if existing is None:
+            ...         download(video_id, path)
+            ...         library.record(video_id, path)
+            ...     else:
+            ...         link_file(existing, path)
+
+        Args:
+            video_id (str | None): The video ID, None if it is not known
+            stop_event (threading.Event): Stops waiting for another download
+
+        Returns:
+            Iterator[str | None]: The full path of the file, or None to download it
+        """
+        if video_id is None:
+            yield None
+            return
+        while True:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+                existing = self._existing(video_id)
+                in_flight = self._in_flight.get(video_id)
+                if existing is None and in_flight is None:
+                    done = threading.Event()
+                    self._in_flight[video_id] = done
+                    break
+            # Without a download in flight, the file exists
+            if existing is not None or in_flight is None:
+                yield existing
+                return
+            while not in_flight.wait(WAIT_SECONDS):
+                if stop_event.is_set():
+                    # Let the caller see the stop instead of waiting on
+                    yield None
+                    return
+
+        try:
+            yield None
+        finally:
+            with self._lock:
+                self._in_flight.pop(video_id, None)
+            done.set()
+
+    def record(self, video_id: str | None, path: str):
+        """
+        Remember the file a video was downloaded to
+
+        Args:
+            video_id (str | None): The video ID, nothing is recorded if None
+            path (str): The path of the file, relative to the download folder
+        """
+        if video_id is None:
+            return
+        with self._lock:
+            self._paths[video_id] = path
+        exec_db(
+            "INSERT OR REPLACE INTO downloads (video_id, path) VALUES (?, ?)",
+            (video_id, path),
+        )
+
+    def link(self, existing: str, path: str) -> str:
+        """
+        Make a downloaded video appear at another path in the download folder
+
+        Args:
+            existing (str): The full path of the downloaded file
+            path (str): The new path, relative to the download folder
+
+        Returns:
+            str: "hardlink", "reflink" or "copy"
+        """
+        method = link_file(existing, os.path.join(self.download_folder, path))
+        LIBRARY_LINKS_TOTAL.inc(method=method)
+        return method
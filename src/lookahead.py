@@ -0,0 +1,81 @@
+"""Size of the window of tracks resolved ahead of the download workers"""
+
+import math
+import time
+
+from src.hedging import LatencyWindow
+from src.metrics import PREFETCH_WINDOW
+
+# Searches and downloads measured before the window adapts
+MIN_SAMPLES = 5
+# How long a computed window is used before it is measured again
+REFRESH_SECONDS = 1.0
+# Search time the window is sized for, against the median download time
+SEARCH_PERCENTILE = 0.9
+
+
+class Lookahead:
+    """
+    Decides how many tracks are resolved ahead of the download workers
+
+    The window counts the tracks being searched for and those waiting for a
+    worker with their link found. To keep every worker fed, the searches in
+    flight have to cover the time a search takes at the rate workers finish
+    downloads (Little's law), plus one ready track per worker:
+
+        window = workers + ceil(workers * search_time / download_time)
+
+    with the 90th percentile of search times and the median download time.
+    Until enough searches and downloads are measured, or if that is more,
+    the configured maximum is used. The window never drops below the number
+    of workers.
+    """
+
+    def __init__(
+        self,
+        max_window: int,
+        search_latency: LatencyWindow,
+        download_latency: LatencyWindow,
+    ):
+        self.max_window = max_window
+        self.search_latency = search_latency
+        self.download_latency = download_latency
+        self._cached: tuple[int, int] | None = None
+        self._computed = 0.0
+
+    def window(self, workers: int) -> int:
+        """
+        Get the number of tracks to resolve ahead
+
+        Examples:
+            >>> lookahead.window(4)
+            6
+
+        Args:
+            workers (int): The number of download workers
+
+        Returns:
+            int: The window, between `workers` and the maximum
+        """
+        now = time.monotonic()
+        if (
+            self._cached is not None
+            and self._cached[0] == workers
+            and now - self._computed < REFRESH_SECONDS
+        ):
+            return self._cached[1]
+        window = max(self.max_window, workers)
+        if (
+            len(self.search_latency) >= MIN_SAMPLES
+            and len(self.download_latency) >= MIN_SAMPLES
+        ):
+            # Slow searches would starve the workers, not average ones
+            search = self.search_latency.percentile(SEARCH_PERCENTILE) or 0.0
+            download = self.download_latency.percentile(0.5) or 0.0
+            if download > 0:
+                needed = workers + math.ceil(workers * search / download)
+                window = max(min(needed, window), workers)
+        PREFETCH_WINDOW.set(window)
+        self._cached = (workers, window)
+        self._computed = now
+        return window
@@ -0,0 +1,365 @@
+"""Prometheus-style metrics for the download pipeline"""
+
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from typing import TypeVar
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelValues = tuple[str, ...]
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, **extra) -> str:
+    """
+    Format label pairs in the exposition format
+
+    Examples:
+        >>> _format_labels(("status",), ("Queued",))
+        '{status="Queued"}'
+    """
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    body = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return "{" + body + "}"
+
+
+def _escape(value) -> str:
+    """
+    Escape a label value
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric(ABC):
+    """
+    Base class for a metric family
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        """
+        Get the label values in declaration order
+        """
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    @abstractmethod
+    def samples(self) -> list[str]:
+        """
+        Get the sample lines of the metric
+        """
+
+    def render(self) -> str:
+        """
+        Render the metric in the Prometheus text exposition format
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing counter
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        """
+        Increment the counter
+
+        Examples:
+            >>> TRACKS_TOTAL.inc(status="Processing Complete")
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        """
+        Get the current value of the counter
+        """
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {value}"
+            for key, value in items
+        ]
+
+
+class Gauge(Metric):
+    """
+    Value that can go up and down, or be read from a callback at scrape time
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[LabelValues, float] = {}
+        self._function: Callable[[], float] | None = None
+
+    def set(self, value: float, **labels: str):
+        """
+        Set the gauge
+        """
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        """
+        Increment the gauge
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        """
+        Decrement the gauge
+        """
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]):
+        """
+        Read the gauge from a callback whenever it is scraped
+        """
+        self._function = function
+
+    def value(self, **labels: str) -> float:
+        """
+        Get the current value of the gauge
+        """
+        if self._function is not None:
+            return float(self._function())
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list[str]:
+        if self._function is not None:
+            return [f"{self.name} {float(self._function())}"]
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {value}"
+            for key, value in items
+        ]
+
+
+class Histogram(Metric):
+    """
+    Distribution of observations in cumulative buckets
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str):
+        """
+        Record an observation
+
+        Examples:
+            >>> SEARCH_SECONDS.observe(0.42, kind="songs")
+        """
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels: str) -> int:
+        """
+        Get the number of observations
+        """
+        return sum(self._counts.get(self._key(labels), []))
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = [(key, list(counts)) for key, counts in self._counts.items()]
+            sums = dict(self._sums)
+        lines = []
+        for key, counts in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, le=bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            cumulative += counts[-1]
+            labels = _format_labels(self.label_names, key, le="+Inf")
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {sums[key]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+MetricT = TypeVar("MetricT", bound=Metric)
+
+
+class Registry:
+    """
+    Collection of metrics exposed on the /metrics endpoint
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: MetricT) -> MetricT:
+        """
+        Add a metric to the registry
+        """
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format
+        """
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+SEARCH_SECONDS = REGISTRY.register(
+    Histogram(
+        "spottube_search_seconds",
+        "Latency of YouTube Music searches",
+        labels=("kind",),
+    )
+)
+SEARCH_CACHE_TOTAL = REGISTRY.register(
+    Counter(
+        "spottube_search_cache_total",
+        "YouTube Music search cache lookups",
+        labels=("result",),
+    )
+)
+TRANSFER_SECONDS = REGISTRY.register(
+    Histogram("spottube_transfer_seconds", "Time spent downloading with yt-dlp")
+)
+TRANSFER_BYTES_PER_SECOND = REGISTRY.register(
+    Histogram(
+        "spottube_transfer_bytes_per_second",
+        "Average transfer rate of yt-dlp downloads",
+        buckets=(32e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 5e6, 10e6, 50e6),
+    )
+)
+POSTPROCESS_SECONDS = REGISTRY.register(
+    Histogram(
+        "spottube_postprocess_seconds",
+        "Time spent in yt-dlp post-processors",
+        labels=("postprocessor",),
+    )
+)
+RESOLUTION_SECONDS = REGISTRY.register(
+    Histogram(
+        "spottube_resolution_seconds",
+        "Time to find the YouTube link of a track, searches included",
+    )
+)
+RESOLUTION_P99_SECONDS = REGISTRY.register(
+    Gauge(
+        "spottube_resolution_p99_seconds",
+        "99th percentile of recent link resolution times",
+    )
+)
+PREFETCH_WINDOW = REGISTRY.register(
+    Gauge(
+        "spottube_prefetch_window",
+        "Tracks resolved ahead of the download workers, at most",
+    )
+)
+TRACKS_TOTAL = REGISTRY.register(
+    Counter(
+        "spottube_tracks_total",
+        "Tracks processed by final download status",
+        labels=("status",),
+    )
+)
+SPOTIFY_API_CALLS_TOTAL = REGISTRY.register(
+    Counter(
+        "spottube_spotify_api_calls_total",
+        "Requests sent to the Spotify Web API",
+        labels=("endpoint",),
+    )
+)
+QUEUE_DEPTH = REGISTRY.register(
+    Gauge("spottube_queue_depth", "Tracks waiting to be processed")
+)
+ACTIVE_WORKERS = REGISTRY.register(
+    Gauge("spottube_active_workers", "Download workers processing a track")
+)
+STAGING_RESERVED_BYTES = REGISTRY.register(
+    Gauge(
+        "spottube_staging_reserved_bytes",
+        "Disk space reserved by downloads in the staging folder",
+    )
+)
+ADMISSION_PAUSED = REGISTRY.register(
+    Gauge("spottube_admission_paused", "Download workers waiting for disk space")
+)
+LIBRARY_LINKS_TOTAL = REGISTRY.register(
+    Counter(
+        "spottube_library_links_total",
+        "Tracks served from an already downloaded video, by link method",
+        labels=("method",),
+    )
+)
+BANDWIDTH_LIMIT = REGISTRY.register(
+    Gauge(
+        "spottube_bandwidth_limit_bytes_per_second",
+        "Global download rate limit in force, 0 if unlimited",
+    )
+)
+COOKIE_DOWNLOADS_TOTAL = REGISTRY.register(
+    Counter(
+        "spottube_cookie_downloads_total",
+        "Downloads by cookie account and outcome",
+        labels=("account", "outcome"),
+    )
+)
+RETRIES_TOTAL = REGISTRY.register(
+    Counter(
+        "spottube_retries_total",
+        "Failed tracks by retry decision",
+        labels=("outcome",),
+    )
+)
+HEDGES_TOTAL = REGISTRY.register(
+    Counter(
+        "spottube_hedges_total",
+        "Hedged searches by outcome",
+        labels=("outcome",),
+    )
+)
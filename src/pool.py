@@ -0,0 +1,154 @@
+"""Worker pool that can be resized while it runs"""
+
+import concurrent.futures
+import threading
+from collections import deque
+from collections.abc import Callable
+
+from loguru import logger
+
+
+class WorkerPool:
+    """
+    Thread pool whose size can be changed at runtime
+
+    Growing the pool starts workers immediately. Shrinking it lets surplus
+    workers finish the task they are running, then retire, so in-flight
+    downloads are never interrupted.
+    """
+
+    def __init__(self, size: int, name: str = "worker"):
+        self.name = name
+        self._size = max(int(size), 1)
+        self._cond = threading.Condition()
+        self._tasks: deque = deque()
+        self._workers = 0
+        self._busy = 0
+        self._started = False
+        self._shutdown = False
+        self._spawned = 0
+
+    @property
+    def size(self) -> int:
+        """
+        Get the target number of workers
+        """
+        return self._size
+
+    @property
+    def workers(self) -> int:
+        """
+        Get the number of running workers, including those about to retire
+        """
+        return self._workers
+
+    @property
+    def busy(self) -> int:
+        """
+        Get the number of workers running a task
+        """
+        return self._busy
+
+    @property
+    def pending(self) -> int:
+        """
+        Get the number of tasks waiting for a worker
+        """
+        return len(self._tasks)
+
+    def resize(self, size: int):
+        """
+        Change the number of workers
+
+        Examples:
+            >>> pool.resize(8)
+
+        Args:
+            size (int): The new number of workers, at least 1
+        """
+        with self._cond:
+            previous = self._size
+            self._size = max(int(size), 1)
+            if self._started:
+                self._spawn()
+            # Wake idle workers, so surplus ones retire
+            self._cond.notify_all()
+        logger.info(f"Resized {self.name} pool from {previous} to {self._size} workers")
+
+    def submit(self, fn: Callable, *args, **kwargs) -> concurrent.futures.Future:
+        """
+        Schedule a task on the pool
+
+        Args:
+            fn (Callable): The task to run
+            *args: Positional arguments of the task
+            **kwargs: Keyword arguments of the task
+
+        Returns:
+            concurrent.futures.Future: The future result of the task
+        """
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError(f"The {self.name} pool is shut down")
+            self._tasks.append((future, fn, args, kwargs))
+            self._started = True
+            self._spawn()
+            self._cond.notify()
+        return future
+
+    def shutdown(self):
+        """
+        Stop every worker once the queued tasks are done
+        """
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+
+    def _spawn(self):
+        """
+        Start workers up to the target size, with the lock held
+        """
+        while self._workers < self._size:
+            self._workers += 1
+            self._spawned += 1
+            thread = threading.Thread(
+                target=self._work, name=f"{self.name}-{self._spawned}", daemon=True
+            )
+            thread.start()
+
+    def _next_task(self) -> tuple | None:
+        """
+        Wait for the next task, or None if the worker has to retire
+        """
+        with self._cond:
+            while True:
+                if self._workers > self._size:
+                    self._workers -= 1
+                    return None
+                if self._tasks:
+                    self._busy += 1
+                    return self._tasks.popleft()
+                if self._shutdown:
+                    self._workers -= 1
+                    return None
+                self._cond.wait()
+
+    def _work(self):
+        """
+        Run tasks until the worker is retired
+        """
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            future, fn, args, kwargs = task
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._busy -= 1
@@ -0,0 +1,154 @@
+"""Bounded-concurrency engine for Spotify extraction and YouTube Music searches"""
+
+import asyncio
+import concurrent.futures
+import inspect
+import threading
+from collections.abc import Callable, Iterable
+from typing import Any
+
+from loguru import logger
+
+
+def gevent_active() -> bool:
+    """
+    Check if the process runs under gevent (e.g. the gunicorn gevent worker)
+
+    Returns:
+        bool: True if sockets are monkey-patched by gevent
+    """
+    try:
+        from gevent import monkey  # type: ignore
+    except ImportError:
+        return False
+    return monkey.is_module_patched("socket")
+
+
+class ResolutionEngine:
+    """
+    Runs lookups with bounded concurrency, off the download workers
+
+    Under gevent, every lookup is a greenlet on the hub, so hundreds can be in
+    flight on one thread while the patched sockets wait. Otherwise lookups are
+    coroutines on a dedicated asyncio loop; as `spotipy` and `ytmusicapi` are
+    blocking, plain callables are offloaded to a thread pool of the same size,
+    while coroutine functions are awaited on the loop directly.
+
+    Every submission returns a `concurrent.futures.Future`, so callers can mix
+    lookups with the download executor.
+    """
+
+    def __init__(self, concurrency: int = 16, backend: str | None = None):
+        self.concurrency = max(int(concurrency), 1)
+        self.backend = backend or ("gevent" if gevent_active() else "asyncio")
+        self._lock = threading.Lock()
+        self._started = False
+        logger.info(
+            f"Resolution engine: {self.backend} backend, concurrency {self.concurrency}"
+        )
+
+    def _start(self):
+        """
+        Start the backend on first use
+        """
+        with self._lock:
+            if self._started:
+                return
+            if self.backend == "gevent":
+                import gevent  # type: ignore
+                import gevent.pool  # type: ignore
+                import gevent.queue  # type: ignore
+
+                self._pool = gevent.pool.Pool(self.concurrency)
+                self._jobs = gevent.queue.Queue()
+                gevent.spawn(self._dispatch)
+            else:
+                self._loop = asyncio.new_event_loop()
+                self._semaphore = asyncio.Semaphore(self.concurrency)
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.concurrency, thread_name_prefix="resolver"
+                )
+                self._loop.set_default_executor(self._executor)
+                thread = threading.Thread(
+                    target=self._loop.run_forever, name="resolver-loop", daemon=True
+                )
+                thread.start()
+            self._started = True
+
+    def _dispatch(self):
+        """
+        Feed queued jobs to the greenlet pool, waiting whenever it is full
+        """
+        while True:
+            job = self._jobs.get()
+            self._pool.spawn(job)
+
+    async def _run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run a lookup on the event loop, within the concurrency limit
+        """
+        async with self._semaphore:
+            if inspect.iscoroutinefunction(fn):
+                return await fn(*args, **kwargs)
+            return await self._loop.run_in_executor(None, lambda: fn(*args, **kwargs))
+
+    def submit(self, fn: Callable, *args, **kwargs) -> concurrent.futures.Future:
+        """
+        Schedule a lookup
+
+        Examples:
+            >>> future = engine.submit(ytmusic.search, query="Artist Title")
+            >>> future.result()
+
+        Args:
+            fn (Callable): The lookup to run
+            *args: Positional arguments of the lookup
+            **kwargs: Keyword arguments of the lookup
+
+        Returns:
+            concurrent.futures.Future: The future result of the lookup
+        """
+        self._start()
+        if self.backend == "asyncio":
+            return asyncio.run_coroutine_threadsafe(
+                self._run(fn, *args, **kwargs), self._loop
+            )
+
+        future: concurrent.futures.Future = concurrent.futures.Future()
+
+        def job():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+        self._jobs.put(job)
+        return future
+
+    def gather(self, fn: Callable, items: Iterable) -> list[Any]:
+        """
+        Run a lookup for every item concurrently, returning the results in order
+
+        If a lookup raises, the lookups not started yet are cancelled and the
+        error is raised, so a failed page is never silently left out.
+
+        Examples:
+            >>> engine.gather(get_album_tracks, album_ids)
+            [[...], [...]]
+
+        Args:
+            fn (Callable): The lookup to run on each item
+            items (Iterable): The items to look up
+
+        Returns:
+            list[Any]: The result of each item, in the order of the items
+        """
+        futures = [self.submit(fn, item) for item in items]
+        try:
+            return [future.result() for future in futures]
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
@@ -0,0 +1,198 @@
+"""Retries of failed tracks, with failure classification and backoff"""
+
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections.abc import Callable
+
+from loguru import logger
+
+from src.metrics import RETRIES_TOTAL
+from src.spotify import Track
+
+# Error messages of failures a retry can't fix: the video is gone, private,
+# age-gated or blocked where we are
+PERMANENT_MARKERS = (
+    "video unavailable",
+    "private video",
+    "this video is private",
+    "has been removed",
+    "removed by the uploader",
+    "account associated with this video has been terminated",
+    "copyright claim",
+    "confirm your age",
+    "age-restricted",
+    "inappropriate for some users",
+    "not available in your country",
+    "blocked it in your country",
+    "available to this channel's members",
+    "members-only",
+    "requires payment",
+    "unsupported url",
+)
+# Due retries wait this long for the download workers to run dry
+IDLE_CHECK_SECONDS = 5.0
+
+
+def is_permanent(error: BaseException) -> bool:
+    """
+    Check if a failure can't be fixed by trying again
+
+    Anything not known to be permanent, e.g. timeouts, connection resets,
+    HTTP 5xx and 429 responses, is treated as transient.
+
+    Args:
+        error (BaseException): The error the track failed with
+
+    Returns:
+        bool: True if the failure is permanent
+    """
+    message = str(error).lower()
+    return any(marker in message for marker in PERMANENT_MARKERS)
+
+
+class RetryScheduler:
+    """
+    Tries transient failures again, with exponential backoff and jitter
+
+    The n-th retry of a track waits `base_delay * 2 ** (n - 1)`, capped at
+    `max_delay`, then between half and all of that at random, so tracks
+    failing together don't retry together. Due retries only start when
+    `idle()` says the download workers have no backlog, so they never hold
+    up fresh tracks.
+    """
+
+    def __init__(
+        self,
+        run: Callable[[Track, str | None], None],
+        idle: Callable[[], bool] = lambda: True,
+        max_attempts: int = 5,
+        base_delay: float = 60.0,
+        max_delay: float = 3600.0,
+    ):
+        self.run = run
+        self.idle = idle
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._attempts: dict[str, int] = {}
+        self._queue: list[tuple[float, int, Track, str | None]] = []
+        self._sequence = itertools.count()
+        self._running = 0
+        self._changed = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def pending(self) -> int:
+        """
+        Get the number of retries waiting or running
+        """
+        with self._changed:
+            return len(self._queue) + self._running
+
+    def delay(self, attempt: int) -> float:
+        """
+        Get the backoff before a retry
+
+        Args:
+            attempt (int): The number of the retry, from 1
+
+        Returns:
+            float: The delay in seconds, with jitter
+        """
+        backoff = min(self.base_delay * 2 ** (attempt - 1), self.max_delay)
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+    def schedule(
+        self, track: Track, error: BaseException, found_link: str | None = None
+    ) -> bool:
+        """
+        Schedule a retry of a failed track, if its failure is transient
+
+        Examples:
+            >>> retries.schedule(song, error, found_link)
+            True
+
+        Args:
+            track (Track): The failed track
+            error (BaseException): The error it failed with
+            found_link (str | None): Its YouTube link, None to search again
+
+        Returns:
+            bool: True if a retry was scheduled
+        """
+        if self.max_attempts <= 0:
+            return False
+        if is_permanent(error):
+            RETRIES_TOTAL.inc(outcome="permanent")
+            logger.info(f"Not retrying {track.artist} - {track.title}: {error}")
+            self.forget(track)
+            return False
+        with self._changed:
+            attempt = self._attempts.get(track.id, 0) + 1
+            if attempt > self.max_attempts:
+                self._attempts.pop(track.id, None)
+                RETRIES_TOTAL.inc(outcome="exhausted")
+                logger.warning(f"Giving up on {track.artist} - {track.title}")
+                return False
+            self._attempts[track.id] = attempt
+            delay = self.delay(attempt)
+            heapq.heappush(
+                self._queue,
+                (time.monotonic() + delay, next(self._sequence), track, found_link),
+            )
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._dispatch, name="retry", daemon=True
+                )
+                self._thread.start()
+            self._changed.notify_all()
+        RETRIES_TOTAL.inc(outcome="scheduled")
+        logger.warning(
+            f"Retry {attempt}/{self.max_attempts} of {track.artist} - {track.title} "
+            f"in {delay:.0f}s"
+        )
+        return True
+
+    def forget(self, track: Track):
+        """
+        Drop the attempts of a track that succeeded or won't be retried
+        """
+        with self._changed:
+            self._attempts.pop(track.id, None)
+
+    def clear(self):
+        """
+        Drop every scheduled retry, e.g. when the download list is cleared
+        """
+        with self._changed:
+            self._queue.clear()
+            self._attempts.clear()
+            self._changed.notify_all()
+
+    def _dispatch(self):
+        """
+        Hand due retries to `run`, one at a time, while the workers are idle
+
+        `run` blocks until the retry is done, so at most one retry is in
+        flight.
+        """
+        while True:
+            with self._changed:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    due = self._queue[0][0] if self._queue else None
+                    self._changed.wait(None if due is None else due - time.monotonic())
+                if not self.idle():
+                    self._changed.wait(IDLE_CHECK_SECONDS)
+                    continue
+                _, _, track, found_link = heapq.heappop(self._queue)
+                self._running += 1
+            try:
+                self.run(track, found_link)
+            except Exception as e:
+                logger.error(f"Error retrying {track.title}: {e}")
+            finally:
+                with self._changed:
+                    self._running -= 1
@@ -1,5 +1,7 @@
 DROP TABLE IF EXISTS track_queue;
 DROP TABLE IF EXISTS aliases;
+DROP TABLE IF EXISTS downloads;
+DROP TABLE IF EXISTS track_history;
 CREATE TABLE track_queue (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   track_id TEXT NOT NULL,
@@ -11,3 +13,27 @@ CREATE TABLE aliases (
   artist TEXT NOT NULL,
   PRIMARY KEY (alias)
 );
+CREATE TABLE downloads (
+  video_id TEXT NOT NULL,
+  path TEXT NOT NULL,
+  PRIMARY KEY (video_id)
+);
+CREATE TABLE track_history (
+  run TEXT NOT NULL,
+  position INTEGER NOT NULL,
+  id TEXT NOT NULL,
+  job_id TEXT,
+  artist TEXT NOT NULL,
+  title TEXT NOT NULL,
+  folder TEXT NOT NULL,
+  status TEXT NOT NULL,
+  release_date TEXT,
+  album TEXT,
+  duration_ms INTEGER,
+  version INTEGER NOT NULL,
+  finished TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (run, position)
+);
+CREATE INDEX track_history_status ON track_history (run, status, position);
+CREATE INDEX track_history_job ON track_history (job_id);
+CREATE INDEX track_history_finished ON track_history (finished);
@@ -1,15 +1,23 @@
 """Module to work with the Spotify API"""
 
-import spotipy  # type: ignore
+import functools
+import uuid
+from typing import TYPE_CHECKING
+
 from loguru import logger
-from pydantic import BaseModel
-from spotipy.oauth2 import SpotifyClientCredentials  # type: ignore
-from spotipy_anon import SpotifyAnon  # type: ignore
+from pydantic import BaseModel, Field
 
-from src.config import Config
+from src.clock import state_clock
+from src.config import get_config
+from src.metrics import SPOTIFY_API_CALLS_TOTAL
+from src.resolver import ResolutionEngine
+from src.startup import lazy_import
 from src.status import DownloadStatus
 from src.utils import contains_ignored_keywords
 
+if TYPE_CHECKING:
+    import spotipy  # type: ignore
+
 
 class Track(BaseModel):
     """
@@ -21,29 +29,116 @@ class Track(BaseModel):
     folder: str
     status: DownloadStatus = DownloadStatus.UNKNOWN
     release_date: str | None = None
+    album: str | None = None
+    duration_ms: int | None = None
     percent_downloaded: float = 0.0
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    job_id: str | None = None
+    video_id: str | None = None
+    version: int = 0
+
+    def model_post_init(self, __context) -> None:
+        self.version = state_clock.tick()
+
+    def __setattr__(self, name: str, value) -> None:
+        super().__setattr__(name, value)
+        if name != "version":
+            # Any change to a track makes it part of the next delta broadcast
+            super().__setattr__("version", state_clock.tick())
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, Track):
             return False
         return self.artist == other.artist and self.title == other.title
 
+    def __hash__(self) -> int:
+        return hash((self.artist, self.title))
+
+
+@functools.cache
+def instrumented_spotify_class() -> type:
+    """
+    Get a Spotify client class that counts the API calls it makes
+
+    The class is built on first use, so spotipy is only imported when the
+    Spotify API is needed.
+
+    Returns:
+        type: The client class
+    """
+    spotify: type[spotipy.Spotify] = lazy_import("spotipy").Spotify
+
+    class InstrumentedSpotify(spotify):
+        def _internal_call(self, method, url, payload, params):
+            # e.g. "albums/{id}/tracks" is counted as "albums"
+            endpoint = url.removeprefix(self.prefix).split("/", 1)[0].split("?", 1)[0]
+            SPOTIFY_API_CALLS_TOTAL.inc(endpoint=endpoint)
+            return super()._internal_call(method, url, payload, params)
+
+    return InstrumentedSpotify
+
+
+def standin_spotify(base_url: str):
+    """
+    Get a Spotify client that sends every request to the local stand-in server
+
+    Args:
+        base_url (str): The URL of the stand-in server
+
+    Returns:
+        spotipy.Spotify: The client
+    """
+    client = instrumented_spotify_class()(auth="standin")
+    client.prefix = f"{base_url}/spotify/v1/"
+    return client
+
 
 class SpotifyHandler:
     """
     Handles the Spotify API
+
+    The clients are built on first use, and rebuilt when the credentials are
+    changed from the settings.
     """
 
-    def __init__(self):
-        self.config = Config()
-        self.sp = spotipy.Spotify(
-            auth_manager=SpotifyClientCredentials(
-                client_id=self.config.spotify_client_id,
-                client_secret=self.config.spotify_client_secret,
+    def __init__(self, engine: ResolutionEngine | None = None):
+        self.config = get_config()
+        self.engine = engine or ResolutionEngine(self.config.resolve_concurrency)
+        self._sp = None
+        self._sp_credentials: tuple[str, str] | None = None
+        self._sp_anon = None
+
+    @property
+    def sp(self):
+        """
+        Get the Spotify client authenticated with the configured credentials
+        """
+        if self.config.standin_url:
+            if self._sp is None:
+                self._sp = standin_spotify(self.config.standin_url)
+            return self._sp
+        credentials = (self.config.spotify_client_id, self.config.spotify_client_secret)
+        if self._sp is None or credentials != self._sp_credentials:
+            oauth2 = lazy_import("spotipy.oauth2")
+            self._sp = instrumented_spotify_class()(
+                auth_manager=oauth2.SpotifyClientCredentials(
+                    client_id=credentials[0], client_secret=credentials[1]
+                )
             )
-        )
-        self.sp_anon = spotipy.Spotify(auth_manager=SpotifyAnon())
-        self.unique_tracks: set[Track] = set()
+            self._sp_credentials = credentials
+        return self._sp
+
+    @property
+    def sp_anon(self):
+        """
+        Get the Spotify client using anonymous authentication
+        """
+        if self._sp_anon is None and self.config.standin_url:
+            self._sp_anon = standin_spotify(self.config.standin_url)
+        if self._sp_anon is None:
+            spotify_anon = lazy_import("spotipy_anon").SpotifyAnon
+            self._sp_anon = instrumented_spotify_class()(auth_manager=spotify_anon())
+        return self._sp_anon
 
     def spotify_extractor(self, link):
         """
@@ -83,22 +178,26 @@ class SpotifyHandler:
 
         return tracks
 
-    def append_if_unique(self, track_info: Track) -> bool:
+    def append_if_unique(self, track_info: Track, seen: set[Track]) -> bool:
         """
-        Appends the track info to the track list if it is unique
+        Appends the track info to the tracks seen if it is unique
+
+        The set is scoped to one extraction, so tracks aren't kept in memory
+        after they are queued.
 
         Examples:
-            >>> SpotifyHandler().append_if_unique(Track(artist="Artist", title="Title"))
+            >>> SpotifyHandler().append_if_unique(Track(artist="Artist", title="Title"), set())
 
         Args:
             track_info (dict): The track info to append
+            seen (set[Track]): The tracks of the extraction so far
 
         Returns:
             bool: True if the track info was appended, False otherwise
         """
         print(f"{track_info=}")
-        if track_info not in self.unique_tracks:
-            self.unique_tracks.add(track_info)
+        if track_info not in seen:
+            seen.add(track_info)
             return True
         return False
 
@@ -114,6 +213,7 @@ class SpotifyHandler:
         """
         artist_albums: list[dict] = []
         track_list: list[Track] = []
+        seen: set[Track] = set()
         offset = 0
         limit = 50
 
@@ -136,8 +236,10 @@ class SpotifyHandler:
                         status=DownloadStatus.QUEUED,
                         folder=artist_name,
                         release_date=release_date,
+                        album=item.get("album", {}).get("name"),
+                        duration_ms=item.get("duration_ms"),
                     )
-                    if self.append_if_unique(track_info):
+                    if self.append_if_unique(track_info, seen):
                         track_list.append(track_info)
                 sorted_tracks = sorted(
                     track_list, key=lambda x: x.release_date if x.release_date else ""
@@ -165,9 +267,17 @@ class SpotifyHandler:
                 logger.error(f"Error fetching artist's albums: {str(e)}")
                 break
 
-        for album in artist_albums:
-            album_id = album["id"]
-            self.extract_tracks_from_artist_albums(album_id, artist_name)
+        # Albums are independent lookups, fetch them concurrently, then keep
+        # the first copy of each track in album order
+        for album_tracks in self.engine.gather(
+            lambda album: self.extract_tracks_from_artist_albums(
+                album["id"], artist_name
+            ),
+            artist_albums,
+        ):
+            for track_info in album_tracks:
+                if self.append_if_unique(track_info, seen):
+                    track_list.append(track_info)
 
         sorted_tracks = sorted(
             track_list, key=lambda x: x.release_date if x.release_date else ""
@@ -206,11 +316,10 @@ class SpotifyHandler:
                     status=DownloadStatus.QUEUED,
                     folder=artist_name,
                     release_date=release_date,
+                    album=album_name,
+                    duration_ms=item.get("duration_ms"),
                 )
-                if self.append_if_unique(track_info):
-                    track_list.append(track_info)
-                else:
-                    pass
+                track_list.append(track_info)
 
         except Exception as e:
             logger.error(f"Error parsing track from album {album_name}: {str(e)}")
@@ -222,7 +331,6 @@ class SpotifyHandler:
         """
         track_list: list[Track] = []
         track_info = self.sp.track(link)
-        # album_name = track_info["album"]["name"]
         track_title = track_info["name"]
         artists = [artist["name"] for artist in track_info["artists"]]
         artists_str = ", ".join(artists)
@@ -232,6 +340,8 @@ class SpotifyHandler:
                 title=track_title,
                 status=DownloadStatus.QUEUED,
                 folder="",
+                album=track_info.get("album", {}).get("name"),
+                duration_ms=track_info.get("duration_ms"),
             )
         )
         return track_list
@@ -255,6 +365,8 @@ class SpotifyHandler:
                         title=track_title,
                         status=DownloadStatus.QUEUED,
                         folder=album_name,
+                        album=album_name,
+                        duration_ms=item.get("duration_ms"),
                     )
                 )
 
@@ -278,29 +390,17 @@ class SpotifyHandler:
 
         playlist_name = playlist["name"]
         number_of_tracks = playlist["tracks"]["total"]
-        fields = "items(track(name,artists(name)),added_at)"
+        fields = "items(track(name,duration_ms,album(name),artists(name)),added_at)"
 
-        offset = 0
         limit = 100
-        all_items = []
-        while offset < number_of_tracks:
-
-            try:
-                results = self.sp.playlist_items(
-                    link, fields=fields, limit=limit, offset=offset
-                )
-
-            except Exception as e:
-                logger.error(
-                    f"Error using authenticated account to get playlist: {str(e)}"
-                )
-                logger.info("Attempting to use anonymous authentication...")
-                results = self.sp_anon.playlist_items(
-                    link, fields=fields, limit=limit, offset=offset
-                )
-
-            all_items.extend(results["items"])
-            offset += limit
+        # The number of pages is known upfront, fetch them concurrently
+        pages = self.engine.gather(
+            lambda offset: self._fetch_playlist_page(link, fields, limit, offset),
+            range(0, number_of_tracks, limit),
+        )
+        all_items: list[dict] = []
+        for page in pages:
+            all_items.extend(page)
 
         all_items_sorted = sorted(all_items, key=lambda x: x["added_at"], reverse=False)
         for item in all_items_sorted:
@@ -315,6 +415,8 @@ class SpotifyHandler:
                         title=track_title,
                         status=DownloadStatus.QUEUED,
                         folder=playlist_name,
+                        album=(track.get("album") or {}).get("name"),
+                        duration_ms=track.get("duration_ms"),
                     )
                 )
 
@@ -322,3 +424,32 @@ class SpotifyHandler:
                 logger.error(f"Error Parsing Item in Playlist: {str(item)} - {str(e)}")
 
         return track_list
+
+    def _fetch_playlist_page(
+        self, link: str, fields: str, limit: int, offset: int
+    ) -> list[dict]:
+        """
+        Fetches a page of playlist items, falling back to anonymous authentication
+
+        Args:
+            link (str): The link to the playlist
+            fields (str): The fields to return
+            limit (int): The number of items in a page
+            offset (int): The position of the first item
+
+        Returns:
+            list[dict]: The playlist items
+        """
+        try:
+            results = self.sp.playlist_items(
+                link, fields=fields, limit=limit, offset=offset
+            )
+
+        except Exception as e:
+            logger.error(f"Error using authenticated account to get playlist: {str(e)}")
+            logger.info("Attempting to use anonymous authentication...")
+            results = self.sp_anon.playlist_items(
+                link, fields=fields, limit=limit, offset=offset
+            )
+
+        return results["items"]
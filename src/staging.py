@@ -0,0 +1,237 @@
+"""Staging area for downloads in progress, with disk-space admission control"""
+
+import errno
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import TextIO
+
+from loguru import logger
+
+from src.metrics import ADMISSION_PAUSED, STAGING_RESERVED_BYTES
+
+STAGING_PREFIX = "spottube-"
+# Held by the process owning a staging directory, for as long as it runs
+OWNER_LOCK = ".owner"
+# Held while directories are swept or created, so neither sees the other half done
+SWEEP_LOCK = ".sweep"
+# Free space is re-checked at this interval while admission is paused, as it
+# is usually freed by something else than a finishing download
+RECHECK_SECONDS = 5.0
+
+
+def is_disk_full(error: BaseException) -> bool:
+    """
+    Check if an error was caused by a full disk
+
+    yt-dlp wraps OS errors in its own exceptions, so the message is checked too.
+
+    Args:
+        error (BaseException): The error
+
+    Returns:
+        bool: True if the disk is full
+    """
+    if isinstance(error, OSError) and error.errno in (errno.ENOSPC, errno.EDQUOT):
+        return True
+    return "No space left on device" in str(error)
+
+
+class StagingArea:
+    """
+    Directory for downloads in progress, on the same filesystem as the library
+
+    Every download reserves an estimate of the bytes it will need before it
+    starts. Reservations wait, rather than fail, while the reserved bytes
+    would exceed `max_bytes` or would leave less than `min_free_bytes` free
+    on the disk. Finished files are moved into the library with a rename,
+    which is atomic on a single filesystem. Each process downloads into its
+    own directory within the staging folder.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int,
+        min_free_bytes: int,
+        estimate_bytes: int,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.min_free_bytes = min_free_bytes
+        self.estimate_bytes = estimate_bytes
+        self._reserved = 0
+        self._free_floor = 0
+        self._own: str | None = None
+        self._owner_lock: TextIO | None = None
+        self._changed = threading.Condition()
+
+    @property
+    def reserved(self) -> int:
+        """
+        Get the bytes reserved by downloads in progress
+        """
+        return self._reserved
+
+    def free_bytes(self) -> int:
+        """
+        Get the free space on the staging filesystem
+        """
+        return shutil.disk_usage(self.path).free
+
+    def _admissible(self) -> bool:
+        """
+        Check if one more download fits, with the lock held
+        """
+        needed = self._reserved + self.estimate_bytes
+        if self._reserved and needed > self.max_bytes:
+            return False
+        free = self.free_bytes()
+        if free < self._free_floor:
+            return False
+        self._free_floor = 0
+        # The reserved bytes are not necessarily written yet
+        return free - needed >= self.min_free_bytes
+
+    def wait_for_space(self, stop_event: threading.Event) -> bool:
+        """
+        Block until one more download fits, or the downloads are stopped
+
+        A single download is always admitted when nothing else is reserved
+        and the disk has room, so a low `max_bytes` can't stall the queue.
+
+        Args:
+            stop_event (threading.Event): Set when the downloads are stopped
+
+        Returns:
+            bool: True if there is space, False if the downloads were stopped
+        """
+        with self._changed:
+            paused = False
+            while not self._admissible():
+                if stop_event.is_set():
+                    break
+                if not paused:
+                    paused = True
+                    ADMISSION_PAUSED.inc()
+                    logger.warning(
+                        f"Pausing downloads: {self._reserved} bytes staged, "
+                        f"{self.free_bytes()} bytes free"
+                    )
+                self._changed.wait(RECHECK_SECONDS)
+            if paused:
+                ADMISSION_PAUSED.dec()
+                logger.info("Resuming downloads")
+            return not stop_event.is_set()
+
+    @contextmanager
+    def reserve(self, stop_event: threading.Event) -> Iterator[str | None]:
+        """
+        Reserve space for a download and give it a private staging directory
+
+        The directory and everything left in it is removed on exit.
+
+        Examples:
+            >>> with staging.reserve(stop_event) as path:
+            ...     download_to(path)
+            ...     staging.finalize(os.path.join(path, "song.mp3"), destination)
+
+        Args:
+            stop_event (threading.Event): Set when the downloads are stopped
+
+        Returns:
+            Iterator[str | None]: The directory, or None if the downloads were stopped
+        """
+        with self._changed:
+            if self._own is None:
+                self._prepare()
+            admitted = self.wait_for_space(stop_event)
+            if admitted:
+                self._reserved += self.estimate_bytes
+                STAGING_RESERVED_BYTES.set(self._reserved)
+        if not admitted:
+            yield None
+            return
+        path = None
+        try:
+            path = tempfile.mkdtemp(dir=self._own)
+            yield path
+        finally:
+            if path is not None:
+                shutil.rmtree(path, ignore_errors=True)
+            with self._changed:
+                self._reserved -= self.estimate_bytes
+                STAGING_RESERVED_BYTES.set(self._reserved)
+                self._changed.notify_all()
+
+    def report_full(self):
+        """
+        Hold back new downloads after one ran out of disk space
+
+        Call it once the failed download's files are removed. Downloads resume
+        when the free space has grown by another download's estimate, so the
+        same download doesn't fail again right away.
+        """
+        with self._changed:
+            self._free_floor = self.free_bytes() + self.estimate_bytes
+
+    def wake(self):
+        """
+        Make paused downloads check the stop event and free space right away
+        """
+        with self._changed:
+            self._changed.notify_all()
+
+    def finalize(self, source: str, destination: str):
+        """
+        Move a finished file into the library
+
+        Args:
+            source (str): The file in the staging directory
+            destination (str): The path in the library
+        """
+        os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+        try:
+            os.replace(source, destination)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # The staging directory was configured on another filesystem
+            logger.warning(f"Staging folder {self.path} is not on the library disk")
+            shutil.move(source, destination)
+
+    def _prepare(self):
+        """
+        Create this process's staging directory, and remove those of processes
+        that are gone
+
+        Other processes, e.g. a `flask sync` run next to the web server, may
+        be downloading into the same folder, so only directories whose owner
+        lock can be taken are removed. Without `fcntl`, nothing is removed.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        if not sys.platform.startswith(("linux", "darwin")):
+            self._own = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=self.path)
+            return
+        import fcntl
+
+        with open(os.path.join(self.path, SWEEP_LOCK), "a") as sweep:
+            fcntl.flock(sweep, fcntl.LOCK_EX)
+            for entry in os.scandir(self.path):
+                if entry.is_dir() and entry.name.startswith(STAGING_PREFIX):
+                    try:
+                        with open(os.path.join(entry.path, OWNER_LOCK), "a") as owner:
+                            fcntl.flock(owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except (BlockingIOError, FileNotFoundError):
+                        # Still in use, or removed meanwhile
+                        continue
+                    logger.info(f"Removing {entry.path}, left behind by a previous run")
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            own = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=self.path)
+            self._owner_lock = open(os.path.join(own, OWNER_LOCK), "a")
+            fcntl.flock(self._owner_lock, fcntl.LOCK_EX)
+            self._own = own
@@ -0,0 +1,43 @@
+"""Client for the local YouTube Music stand-in used in load tests"""
+
+from src.startup import lazy_import
+
+
+class StandInYTMusic:
+    """
+    YouTube Music search client for the stand-in server
+
+    Offers the `search` method of `ytmusicapi.YTMusic` that the downloader
+    uses, backed by the stand-in's `/ytmusic/search` endpoint.
+    """
+
+    def __init__(self, base_url: str, timeout: float = 30.0):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.session = lazy_import("requests").Session()
+
+    def search(
+        self, query: str, filter: str | None = None, limit: int = 20, **kwargs
+    ) -> list[dict]:
+        """
+        Search the stand-in
+
+        Args:
+            query (str): The search query
+            filter (str | None): The result type filter, e.g. "songs"
+            limit (int): The maximum number of results
+
+        Returns:
+            list[dict]: The search results
+
+        Raises:
+            requests.HTTPError: If the stand-in answers with an error or 429
+        """
+        params: dict[str, str | int] = {"query": query, "limit": limit}
+        if filter:
+            params["filter"] = filter
+        response = self.session.get(
+            f"{self.base_url}/ytmusic/search", params=params, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
@@ -0,0 +1,126 @@
+"""Startup timing report and deferred imports"""
+
+import importlib
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from types import ModuleType
+
+from loguru import logger
+
+import src
+
+
+class StartupTimer:
+    """
+    Records how long each component takes to import and initialize
+
+    Heavy dependencies are imported on first use through `lazy_import`, their
+    import time is recorded separately as it is paid by the first request.
+    """
+
+    def __init__(self, started: float):
+        self.started = started
+        self.ready: float | None = None
+        self.phases: dict[str, float] = {}
+        self.deferred: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._imported: set[str] = set()
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Time a startup phase
+
+        Examples:
+            >>> with startup_timer.phase("database"):
+            ...     db.init_db()
+
+        Args:
+            name (str): The name of the phase
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+
+    def mark_imports(self):
+        """
+        Record the time spent importing the application, up to now
+        """
+        self.phases["imports"] = time.perf_counter() - self.started
+
+    def finish(self):
+        """
+        Mark the application as ready and log the report
+        """
+        self.ready = time.perf_counter()
+        logger.info(self.report())
+
+    def import_module(self, name: str) -> ModuleType:
+        """
+        Import a module, recording the import time on first use
+
+        Args:
+            name (str): The name of the module
+
+        Returns:
+            ModuleType: The module
+        """
+        # A module is in sys.modules while it is still being initialized, so
+        # only modules imported through here are safe to return without the lock
+        if name in self._imported:
+            return sys.modules[name]
+        with self._lock:
+            if name in self._imported:
+                return sys.modules[name]
+            loaded = name in sys.modules
+            start = time.perf_counter()
+            module = importlib.import_module(name)
+            elapsed = time.perf_counter() - start
+            self._imported.add(name)
+            if not loaded:
+                self.deferred.setdefault(name, elapsed)
+        if not loaded:
+            logger.debug(f"Deferred import of {name} took {elapsed:.3f}s")
+        return module
+
+    def as_dict(self) -> dict:
+        """
+        Get the report as a dictionary
+        """
+        return {
+            "total": (self.ready or time.perf_counter()) - self.started,
+            "phases": dict(self.phases),
+            "deferred_imports": dict(self.deferred),
+        }
+
+    def report(self) -> str:
+        """
+        Get the report as a table
+        """
+        report = self.as_dict()
+        lines = [f"Startup took {report['total']:.3f}s"]
+        lines += [f"  {name:<20} {secs:.3f}s" for name, secs in self.phases.items()]
+        return "\n".join(lines)
+
+
+startup_timer = StartupTimer(src.STARTED)
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Import a heavy dependency on first use
+
+    Examples:
+        >>> yt_dlp = lazy_import("yt_dlp")
+
+    Args:
+        name (str): The name of the module
+
+    Returns:
+        ModuleType: The module
+    """
+    return startup_timer.import_module(name)
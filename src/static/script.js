@@ -8,6 +8,7 @@ var save_changes_button = document.getElementById("save-changes-button");
 var spotify_client_id = document.getElementById("spotify_client_id");
 var spotify_client_secret = document.getElementById("spotify_client_secret");
 var sleep_interval = document.getElementById("sleep_interval");
+var thread_limit = document.getElementById("thread_limit");
 var progress_bar = document.getElementById("progress-status-bar");
 var progress_table = document
   .getElementById("progress-table")
@@ -79,6 +80,7 @@ config_modal.addEventListener("show.bs.modal", function (event) {
     spotify_client_id.value = settings.spotify_client_id;
     spotify_client_secret.value = settings.spotify_client_secret;
     sleep_interval.value = settings.sleep_interval;
+    thread_limit.value = settings.thread_limit;
     ignored_keywords.value = settings.ignored_keywords;
     socket.off("settingsLoaded", handleSettingsLoaded);
   }
@@ -90,6 +92,7 @@ save_changes_button.addEventListener("click", () => {
     spotify_client_id: spotify_client_id.value,
     spotify_client_secret: spotify_client_secret.value,
     sleep_interval: sleep_interval.value,
+    thread_limit: thread_limit.value,
     ignored_keywords: ignored_keywords.value,
   });
   save_message.style.display = "block";
@@ -98,32 +101,181 @@ save_changes_button.addEventListener("click", () => {
   }, 1000);
 });
 
-socket.on("progress_status", (response) => {
-  progress_table.innerHTML = "";
-  response.data.forEach((item, index) => {
-    const row = progress_table.insertRow();
-    const cells = ["artist", "title", "status"].map((key) => {
-      const cell = row.insertCell();
-      if (key === "status" && item[key] === "Running") {
-        cell.textContent = `${item[key]} (${item.percent_downloaded}%)`;
-      } else {
-        cell.textContent = item[key];
+const ROW_HEIGHT = 56;
+const OVERSCAN = 20;
+var table_box = document.getElementById("table-box");
+var status_filter = document.getElementById("status-filter");
+var progress_version = 0;
+var track_rows = new Map();
+var track_window = { offset: 0, limit: 0, status: null };
+var trace_modal = document.getElementById("trace-modal");
+var trace_title = document.getElementById("trace-modal-label");
+var trace_waterfall = document.getElementById("trace-waterfall");
+
+/**
+ * Ask the server for the tracks visible in the table
+ * @param {boolean} force - Request the window even if it did not move
+ */
+function requestWindow(force = false) {
+  const first = Math.floor(table_box.scrollTop / ROW_HEIGHT);
+  const visible = Math.ceil(table_box.clientHeight / ROW_HEIGHT);
+  const offset = Math.max(0, first - OVERSCAN);
+  const limit = visible + 2 * OVERSCAN;
+  const status = status_filter.value || null;
+  if (
+    !force &&
+    offset === track_window.offset &&
+    limit === track_window.limit &&
+    status === track_window.status
+  ) {
+    return;
+  }
+  track_window = { offset, limit, status };
+  socket.emit("set_window", track_window);
+}
+
+/**
+ * Create a spacer row standing in for tracks outside the window
+ * @param {number} count - The number of tracks the spacer replaces
+ * @returns {HTMLTableRowElement} The spacer row
+ */
+function createSpacerRow(count) {
+  const row = document.createElement("tr");
+  const cell = row.insertCell();
+  cell.colSpan = 4;
+  cell.className = "p-0 border-0";
+  cell.style.height = `${count * ROW_HEIGHT}px`;
+  return row;
+}
+
+/**
+ * Render a track into its table row
+ * @param {HTMLTableRowElement} row - The row to render into
+ * @param {Object} item - The track
+ */
+function renderTrackRow(row, item) {
+  row.innerHTML = "";
+  ["artist", "title", "status"].forEach((key) => {
+    const cell = row.insertCell();
+    if (key === "status" && item[key] === "Running") {
+      cell.textContent = `${item[key]} (${item.percent_downloaded}%)`;
+    } else {
+      cell.textContent = item[key];
+    }
+  });
+
+  const actionsCell = row.insertCell();
+  const removeButton = document.createElement("button");
+  removeButton.className = "btn btn-danger btn-sm";
+  removeButton.textContent = "Remove";
+  removeButton.setAttribute("aria-label", `Remove ${item.title}`);
+  removeButton.addEventListener("click", () => {
+    socket.emit("remove_track", item.id);
+  });
+  actionsCell.appendChild(removeButton);
+
+  const traceButton = document.createElement("button");
+  traceButton.className = "btn btn-secondary btn-sm ms-1";
+  traceButton.textContent = "Trace";
+  traceButton.setAttribute("aria-label", `Trace ${item.title}`);
+  traceButton.addEventListener("click", () => showTrace(item));
+  actionsCell.appendChild(traceButton);
+}
+
+/**
+ * Show the stage waterfall of a track
+ * @param {Object} item - The track
+ */
+function showTrace(item) {
+  trace_title.textContent = `${item.artist} - ${item.title}`;
+  trace_waterfall.textContent = "Loading...";
+  bootstrap.Modal.getOrCreateInstance(trace_modal).show();
+
+  fetch(`/api/tracks/${item.id}/trace`)
+    .then((response) => (response.ok ? response.json() : { spans: [] }))
+    .then(({ spans }) => {
+      trace_waterfall.replaceChildren();
+      if (!spans.length) {
+        trace_waterfall.textContent = "No trace recorded for this track yet.";
+        return;
       }
-      return cell;
+      const start = Math.min(...spans.map((span) => span.start));
+      const total = Math.max(
+        ...spans.map((span) => span.start - start + span.duration)
+      );
+      spans.forEach((span) => {
+        const row = document.createElement("div");
+        row.className = "row align-items-center mb-1";
+        const label = document.createElement("div");
+        label.className = "col-4 small text-truncate";
+        label.textContent = `${span.name} (${span.duration.toFixed(2)}s)`;
+        const track = document.createElement("div");
+        track.className = "col-8 trace-bar-track";
+        const bar = document.createElement("div");
+        bar.className = `trace-bar rounded ${span.error ? "bg-danger" : "bg-primary"}`;
+        bar.style.left = `${(100 * (span.start - start)) / (total || 1)}%`;
+        bar.style.width = `${(100 * span.duration) / (total || 1)}%`;
+        bar.title = span.error || span.name;
+        track.appendChild(bar);
+        row.append(label, track);
+        trace_waterfall.appendChild(row);
+      });
     });
+}
 
-    const actionsCell = row.insertCell();
-    actionsCell.innerHTML = `
-      <button 
-        class="btn btn-danger" 
-        onclick="socket.emit('remove_track', ${index})"
-        aria-label="Remove ${item.title}"
-      >
-        Remove
-      </button>
-    `;
+/**
+ * Replace the table with a page of tracks
+ * @param {Object} response - The snapshot payload
+ */
+function renderPage(response) {
+  const fragment = document.createDocumentFragment();
+  track_rows.clear();
+  fragment.appendChild(createSpacerRow(response.offset));
+  response.data.forEach((item) => {
+    const row = document.createElement("tr");
+    row.className = "track-row";
+    renderTrackRow(row, item);
+    track_rows.set(item.id, row);
+    fragment.appendChild(row);
   });
+  const after = Math.max(
+    0,
+    response.total - response.offset - response.data.length
+  );
+  fragment.appendChild(createSpacerRow(after));
+  progress_table.replaceChildren(fragment);
+}
+
+socket.on("connect", () => {
+  requestWindow(true);
+});
+
+table_box.addEventListener("scroll", () => {
+  window.requestAnimationFrame(() => requestWindow());
+});
+
+status_filter.addEventListener("change", () => {
+  table_box.scrollTop = 0;
+  requestWindow();
+});
+
+socket.on("progress_status", (response) => {
+  if (response.type === "snapshot") {
+    renderPage(response);
+  } else if (response.base > progress_version) {
+    // Missed an update, ask for the full page again
+    socket.emit("progress_resync");
+    return;
+  } else {
+    response.data.forEach((item) => {
+      const row = track_rows.get(item.id);
+      if (row) {
+        renderTrackRow(row, item);
+      }
+    });
+  }
 
+  progress_version = response.version;
   updateProgressBar(response.percent_completion, response.status);
 });
 
@@ -24,3 +24,33 @@ class DownloadStatus(str, Enum):
 
     def __repr__(self):
         return self.value
+
+
+# Statuses a track keeps once it has been processed
+FINISHED_STATUSES = frozenset(
+    {
+        DownloadStatus.FILE_ALREADY_EXISTS,
+        DownloadStatus.SEARCH_FAILED,
+        DownloadStatus.DOWNLOAD_FAILED,
+        DownloadStatus.PROCESSING_COMPLETE,
+        DownloadStatus.NO_LINK_FOUND,
+        DownloadStatus.STOPPED,
+    }
+)
+
+
+class JobStatus(str, Enum):
+    """
+    Enum for the status of a submitted job
+    """
+
+    PENDING = "Pending"
+    EXTRACTING = "Extracting"
+    QUEUED = "Queued"
+    FAILED = "Failed"
+
+    def __str__(self):
+        return self.value
+
+    def __repr__(self):
+        return self.value
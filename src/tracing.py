@@ -0,0 +1,278 @@
+"""Per-track stage tracing of the download pipeline"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from loguru import logger
+
+SERVICE_NAME = "spottube"
+
+
+@dataclass
+class Span:
+    """
+    A timed stage in the processing of a track
+    """
+
+    trace_id: str
+    name: str
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    parent_id: str | None = None
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int | None = None
+    error: str | None = None
+    attributes: dict[str, str | int | float | bool] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        """
+        Get the duration of the span in seconds, up to now if it is still open
+        """
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e9
+
+    def to_dict(self) -> dict:
+        """
+        Get the span as a plain dictionary for the UI
+        """
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start_ns / 1e9,
+            "end": self.end_ns / 1e9 if self.end_ns is not None else None,
+            "duration": self.duration,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+    def to_otlp(self) -> dict:
+        """
+        Get the span in the OTLP JSON encoding
+        """
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+            "status": (
+                {"code": 2, "message": self.error} if self.error else {"code": 1}
+            ),
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value: str | int | float | bool) -> dict:
+    """
+    Encode an attribute value as an OTLP AnyValue
+    """
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Tracer:
+    """
+    Records the stages of each track and exports finished traces
+
+    Spans of the most recent tracks are kept in memory for the UI. Finished
+    traces are appended to `export_path` as OTLP JSON, one trace per line.
+    """
+
+    def __init__(self, export_path: str | None = None, max_tracks: int = 1000):
+        self.export_path = export_path
+        self.max_tracks = max_tracks
+        self._lock = threading.Lock()
+        self._spans: OrderedDict[str, list[Span]] = OrderedDict()
+        self._trace_ids: dict[str, str] = {}
+        self._roots: dict[str, Span] = {}
+        self._open: dict[tuple[str, str], Span] = {}
+
+    def start_trace(self, track_id: str, **attributes) -> Span:
+        """
+        Start the root span of a track, discarding any previous trace
+
+        Args:
+            track_id (str): The ID of the track
+            **attributes: Attributes of the track
+
+        Returns:
+            Span: The root span
+        """
+        trace_id = uuid.uuid4().hex
+        root = Span(trace_id=trace_id, name="track", attributes=attributes)
+        with self._lock:
+            self._trace_ids[track_id] = trace_id
+            self._roots[track_id] = root
+            self._spans[track_id] = [root]
+            self._spans.move_to_end(track_id)
+            while len(self._spans) > self.max_tracks:
+                evicted, _ = self._spans.popitem(last=False)
+                self._trace_ids.pop(evicted, None)
+                self._roots.pop(evicted, None)
+        return root
+
+    def start(self, track_id: str, name: str, **attributes) -> Span | None:
+        """
+        Start a stage of a track
+
+        Args:
+            track_id (str): The ID of the track
+            name (str): The name of the stage
+            **attributes: Attributes of the stage
+
+        Returns:
+            Span | None: The span, or None if the track is not being traced
+        """
+        with self._lock:
+            root = self._roots.get(track_id)
+            if root is None:
+                return None
+            span = Span(
+                trace_id=root.trace_id,
+                name=name,
+                parent_id=root.span_id,
+                attributes=attributes,
+            )
+            self._spans[track_id].append(span)
+            self._open[(track_id, name)] = span
+        return span
+
+    def end(self, track_id: str, name: str, error: str | None = None, **attributes):
+        """
+        End a stage of a track
+
+        Args:
+            track_id (str): The ID of the track
+            name (str): The name of the stage
+            error (str | None): The error the stage failed with
+            **attributes: Attributes to add to the stage
+
+        Returns:
+            Span | None: The ended span, or None if the stage was not started
+        """
+        with self._lock:
+            span = self._open.pop((track_id, name), None)
+        if span is not None:
+            span.end_ns = time.time_ns()
+            span.error = error
+            span.attributes.update(attributes)
+        return span
+
+    def is_open(self, track_id: str, name: str) -> bool:
+        """
+        Check if a stage of a track has started but not ended
+        """
+        return (track_id, name) in self._open
+
+    @contextmanager
+    def span(self, track_id: str, name: str, **attributes):
+        """
+        Trace a block of code as a stage of a track
+
+        Examples:
+            >>> with tracer.span(song.id, "search", query=query):
+            ...     ytmusic.search(query)
+
+        Args:
+            track_id (str): The ID of the track
+            name (str): The name of the stage
+            **attributes: Attributes of the stage
+        """
+        span = self.start(track_id, name, **attributes)
+        try:
+            yield span
+        except Exception as e:
+            self.end(track_id, name, error=str(e))
+            raise
+        else:
+            self.end(track_id, name)
+
+    def finish_trace(self, track_id: str, **attributes):
+        """
+        End the root span of a track and export the trace
+
+        Args:
+            track_id (str): The ID of the track
+            **attributes: Attributes to add to the root span
+        """
+        with self._lock:
+            root = self._roots.pop(track_id, None)
+            spans = list(self._spans.get(track_id, []))
+            # Stages left open (e.g. a cancelled download) end with the track
+            for key in [key for key in self._open if key[0] == track_id]:
+                self._open.pop(key).error = "Not finished"
+        if root is None:
+            return
+        root.end_ns = time.time_ns()
+        root.attributes.update(attributes)
+        for span in spans:
+            if span.end_ns is None:
+                span.end_ns = root.end_ns
+        if self.export_path:
+            self._export(spans)
+
+    def get_spans(self, track_id: str) -> list[Span]:
+        """
+        Get the spans recorded for a track
+
+        Args:
+            track_id (str): The ID of the track
+
+        Returns:
+            list[Span]: The spans, in start order
+        """
+        with self._lock:
+            spans = list(self._spans.get(track_id, []))
+        return sorted(spans, key=lambda span: span.start_ns)
+
+    def _export(self, spans: list[Span]):
+        """
+        Append a trace to the export file as an OTLP JSON line
+        """
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": SERVICE_NAME},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": SERVICE_NAME},
+                            "spans": [span.to_otlp() for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        try:
+            directory = os.path.dirname(self.export_path or "")
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._lock, open(self.export_path or "", "a", encoding="utf-8") as f:
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.error(f"Error exporting trace to {self.export_path}: {e}")
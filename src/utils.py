@@ -1,18 +1,21 @@
 """Utils for the application"""
 
+import functools
 import re
+import unicodedata
 
-from stringpod import stringpod
-
-from src.config import Config
-
-config = Config()
+from src.config import get_config
+from src.startup import lazy_import
 
 
+@functools.lru_cache(maxsize=16384)
 def string_cleaner(input_string: str) -> str:
     """
     Cleans the input string to be used in the file name
 
+    Results are memoized, as the same artist and title strings are cleaned by
+    the matcher and again by the file name builder.
+
     Examples:
         >>> string_cleaner("Hello World")
         "Hello World"
@@ -31,6 +34,25 @@ def string_cleaner(input_string: str) -> str:
     return cleaned_string
 
 
+@functools.lru_cache(maxsize=16384)
+def normalize_name(name: str) -> str:
+    """
+    Normalizes a name for lookups, so that differently encoded or cased
+    spellings of the same name compare equal
+
+    Examples:
+        >>> normalize_name("Ｂｊöｒｋ ")
+        "björk"
+
+    Args:
+        name (str): The name to normalize
+
+    Returns:
+        str: The NFKC-normalized, casefolded name
+    """
+    return " ".join(unicodedata.normalize("NFKC", name).casefold().split())
+
+
 def contains_ignored_keywords(input_string: str, ignore_case: bool = True) -> bool:
     """
     Checks if the input string contains any of the ignored keywords
@@ -48,7 +70,11 @@ def contains_ignored_keywords(input_string: str, ignore_case: bool = True) -> bo
     Returns:
         bool: True if the input string contains any of the ignored keywords, False otherwise
     """
+    keywords = get_config().ignored_keywords
+    if not keywords:
+        return False
+    stringpod = lazy_import("stringpod").stringpod
     return any(
         stringpod.contains_substring(input_string, keyword, ignore_case)
-        for keyword in config.ignored_keywords
+        for keyword in keywords
     )
@@ -0,0 +1,48 @@
+import pathlib
+
+import pytest
+
+import src
+from src import db
+from src.aliases import Aliases
+from src.config import get_config
+from src.downloader import Downloader
+
+SCHEMA = pathlib.Path(src.__file__).parent / "schema.sql"
+
+
+@pytest.fixture
+def database(tmp_path):
+    """
+    Point the connection pool at a fresh database with the current schema
+    """
+    db.configure(str(tmp_path / "spottube.sqlite"))
+    with db.get_pool().transaction() as conn:
+        conn.executescript(SCHEMA.read_text(encoding="utf-8"))
+    yield db.get_pool()
+    db.get_pool().close()
+
+
+@pytest.fixture
+def config(tmp_path):
+    """
+    Get the shared configuration, with throwaway folders and no delays
+    """
+    config = get_config()
+    paths = dict(config.paths)
+    sleep_interval, thread_limit = config.sleep_interval, config.thread_limit
+    config.download_folder = str(tmp_path / "downloads")
+    config.config_folder = str(tmp_path / "config")
+    config.sleep_interval = 0
+    config.thread_limit = 1
+    yield config
+    config.paths = paths
+    config.sleep_interval, config.thread_limit = sleep_interval, thread_limit
+
+
+@pytest.fixture
+def downloader(database, config):
+    """
+    Get a downloader backed by the test database
+    """
+    return Downloader(Aliases())
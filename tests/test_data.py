@@ -0,0 +1,96 @@
+import pytest
+
+from src.clock import state_clock
+from src.data import MAX_PAGE_SIZE, DataHandler
+from src.spotify import Track
+from src.status import DownloadStatus
+
+
+class RecordingSocketIO:
+    """
+    Records emitted payloads instead of sending them
+    """
+
+    def __init__(self):
+        self.emitted: list[tuple[dict, str]] = []
+
+    def emit(self, event: str, payload: dict, to: str):
+        self.emitted.append((payload, to))
+
+    def take(self) -> list[tuple[dict, str]]:
+        emitted, self.emitted = self.emitted, []
+        return emitted
+
+
+@pytest.fixture
+def tracks(downloader):
+    tracks = [Track(artist="Artist", title=f"Song {i}", folder="F") for i in range(3)]
+    downloader.download_list = tracks
+    return tracks
+
+
+@pytest.fixture
+def handler(downloader, tracks):
+    handler = DataHandler(downloader, coalesce_interval=0)
+    socketio = RecordingSocketIO()
+    room = handler.set_window("client", 0, 1)
+    handler.broadcast(socketio, state_clock.current)
+    assert [payload["type"] for payload, _ in socketio.take()] == ["snapshot"]
+    return handler, socketio, room
+
+
+def test_change_outside_the_page_is_not_emitted(handler, tracks):
+    handler, socketio, room = handler
+    client_version = room.sent
+
+    tracks[2].status = DownloadStatus.RUNNING
+    handler.broadcast(socketio, state_clock.current)
+
+    assert socketio.take() == []
+    assert room.sent == client_version
+
+    tracks[0].status = DownloadStatus.RUNNING
+    handler.broadcast(socketio, state_clock.current)
+
+    # Based on the version the client has, so it isn't taken for a gap
+    [(payload, _)] = socketio.take()
+    assert payload["base"] == client_version
+    assert [row["id"] for row in payload["data"]] == [tracks[0].id]
+
+
+def test_change_inside_the_page_is_emitted_as_delta(handler, tracks):
+    handler, socketio, room = handler
+
+    tracks[0].status = DownloadStatus.RUNNING
+    handler.broadcast(socketio, state_clock.current)
+
+    [(payload, to)] = socketio.take()
+    assert to == room.name
+    assert payload["type"] == "delta"
+    assert [row["id"] for row in payload["data"]] == [tracks[0].id]
+
+
+def test_progress_change_is_emitted_without_rows(handler, downloader):
+    handler, socketio, room = handler
+
+    downloader.index = 1
+    handler.broadcast(socketio, state_clock.current)
+
+    [(payload, _)] = socketio.take()
+    assert payload["type"] == "delta"
+    assert payload["data"] == []
+    assert payload["percent_completion"] == pytest.approx(100 / 3)
+
+
+@pytest.mark.parametrize(
+    "offset, limit, window",
+    [
+        (-5, 10, (0, 10, None)),
+        (0, 0, (0, 1, None)),
+        (0, 10_000, (0, MAX_PAGE_SIZE, None)),
+    ],
+)
+def test_window_is_clamped(downloader, offset, limit, window):
+    handler = DataHandler(downloader, coalesce_interval=0)
+
+    assert handler.set_window("client", offset, limit).window == window
@@ -0,0 +1,80 @@
+import sqlite3
+import threading
+
+import pytest
+
+from src import db
+from src.db import ConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.sqlite"), size=2, timeout=0.5)
+    with pool.transaction() as conn:
+        conn.execute("CREATE TABLE items (name TEXT PRIMARY KEY)")
+    yield pool
+    pool.close()
+
+
+def test_connections_are_reused(pool):
+    first = pool.acquire()
+    pool.release(first)
+
+    assert pool.acquire() is first
+
+
+def test_acquire_waits_for_a_free_connection(pool):
+    held = [pool.acquire(), pool.acquire()]
+
+    with pytest.raises(sqlite3.OperationalError):
+        pool.acquire()
+
+    threading.Timer(0.01, pool.release, (held[0],)).start()
+    assert pool.acquire() is held[0]
+
+
+def test_transaction_commits(pool):
+    with pool.transaction() as conn:
+        conn.execute("INSERT INTO items VALUES ('a')")
+
+    with pool.connection() as conn:
+        assert conn.execute("SELECT count(*) FROM items").fetchone()[0] == 1
+
+
+def test_transaction_rolls_back_on_error(pool):
+    with pytest.raises(RuntimeError):
+        with pool.transaction() as conn:
+            conn.execute("INSERT INTO items VALUES ('a')")
+            raise RuntimeError
+
+    with pool.connection() as conn:
+        assert conn.execute("SELECT count(*) FROM items").fetchone()[0] == 0
+
+
+def test_release_rolls_back_an_open_transaction(pool):
+    conn = pool.acquire()
+    conn.execute("INSERT INTO items VALUES ('a')")
+    pool.release(conn)
+
+    with pool.connection() as conn:
+        assert conn.execute("SELECT count(*) FROM items").fetchone()[0] == 0
+
+
+def test_exec_many_writes_all_rows_or_none(database):
+    query = "INSERT INTO aliases (alias, artist) VALUES (?, ?)"
+
+    assert db.exec_many(query, [("a", "Artist"), ("b", "Artist")])
+    assert not db.exec_many(query, [("c", "Artist"), ("a", "Artist")])
+
+    rows = db.query_db("SELECT alias FROM aliases ORDER BY alias")
+    assert [row["alias"] for row in rows] == ["a", "b"]
+
+
+def test_exec_db_reports_an_exhausted_pool(database, monkeypatch):
+    monkeypatch.setattr(database, "timeout", 0.01)
+    held = [database.acquire() for _ in range(database.size)]
+
+    assert not db.exec_db("INSERT INTO aliases VALUES ('a', 'Artist')")
+
+    for conn in held:
+        database.release(conn)
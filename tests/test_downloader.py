@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+
+from src.downloader import Downloader
+from src.spotify import Track
+from src.status import DownloadStatus
+
+LINK = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out")
+        time.sleep(0.01)
+
+
+def make_tracks(count: int, start: int = 0) -> list[Track]:
+    return [
+        Track(artist="Artist", title=f"Song {i}", folder="F")
+        for i in range(start, start + count)
+    ]
+
+
+@pytest.fixture
+def gated(downloader, monkeypatch):
+    """
+    Replace searches and downloads; downloads after the first wait for the gate
+
+    Tracks are resolved one at a time, so they download in list order.
+    """
+    gate = threading.Event()
+    started: list[str] = []
+
+    def download(song, found_link):
+        started.append(song.title)
+        if len(started) > 1:
+            gate.wait(5)
+        song.status = DownloadStatus.PROCESSING_COMPLETE
+
+    monkeypatch.setattr(downloader.lookahead, "max_window", 1)
+    monkeypatch.setattr(downloader, "_find_youtube_link", lambda song: LINK)
+    monkeypatch.setattr(downloader, "_download_song", download)
+    return gate, started
+
+
+def test_remove_finished_track_then_enqueue(downloader, gated):
+    gate, _ = gated
+    tracks = make_tracks(3)
+    downloader.enqueue(tracks)
+    wait_until(lambda: tracks[0].status == DownloadStatus.PROCESSING_COMPLETE)
+
+    downloader.remove_track(tracks[0].id)
+    [fourth] = make_tracks(1, start=3)
+    downloader.enqueue([fourth])
+    gate.set()
+
+    wait_until(lambda: downloader.status == DownloadStatus.COMPLETE)
+    assert fourth.status == DownloadStatus.PROCESSING_COMPLETE
+    assert downloader.index == downloader.total == 3
+
+
+def test_remove_queued_track(downloader, gated):
+    gate, started = gated
+    tracks = make_tracks(4)
+    downloader.enqueue(tracks)
+    wait_until(lambda: len(started) == 2)
+
+    downloader.remove_track(tracks[3].id)
+    gate.set()
+
+    wait_until(lambda: downloader.status == DownloadStatus.COMPLETE)
+    assert "Song 3" not in started
+    assert downloader.index == downloader.total == 3
+
+
+def test_remove_track_being_downloaded(downloader, gated):
+    gate, started = gated
+    tracks = make_tracks(3)
+    downloader.enqueue(tracks)
+    wait_until(lambda: len(started) == 2)
+
+    downloader.remove_track(tracks[1].id)
+    [fourth] = make_tracks(1, start=3)
+    downloader.enqueue([fourth])
+    gate.set()
+
+    wait_until(lambda: downloader.status == DownloadStatus.COMPLETE)
+    assert fourth.status == DownloadStatus.PROCESSING_COMPLETE
+    assert downloader.index == downloader.total == 3
+
+
+def test_remove_second_copy_of_a_song(downloader):
+    first, second = make_tracks(1) + make_tracks(1)
+    downloader.download_list = [first, second]
+
+    assert downloader.remove_track(second.id) is second
+
+    assert downloader.download_list[0] is first
+    assert downloader.get_track(first.id) is first
+    assert downloader.get_track(second.id) is None
+
+
+def test_track_enqueued_as_the_queue_finishes_is_downloaded(
+    downloader, gated, monkeypatch
+):
+    gate, _ = gated
+    gate.set()
+    [first, late] = make_tracks(2)
+    total = Downloader.total
+
+    def last_check(self):
+        # A job enqueues right as the master queue sees it has nothing left
+        value = total.fget(self)
+        if self.index >= value and not late_enqueue.ident:
+            late_enqueue.start()
+            late_enqueue.join(0.1)
+        return value
+
+    late_enqueue = threading.Thread(target=downloader.enqueue, args=([late],))
+    monkeypatch.setattr(Downloader, "total", property(last_check))
+    downloader.enqueue([first])
+
+    wait_until(lambda: late.status == DownloadStatus.PROCESSING_COMPLETE)
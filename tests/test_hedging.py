@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+
+from src.hedging import MIN_SAMPLES, Hedger, LatencyWindow, SearchBudget
+from src.metrics import HEDGES_TOTAL
+
+
+@pytest.fixture
+def release():
+    """
+    Get an event that unblocks slow searches when the test ends
+    """
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def search(budget: SearchBudget, result, release=None, calls=None):
+    """
+    Make a search that holds a budget slot, optionally until released
+    """
+
+    def run():
+        with budget.slot():
+            if calls is not None:
+                calls.append(result)
+            if release is not None:
+                release.wait(5)
+            return result
+
+    return run
+
+
+def test_percentiles_of_recent_latencies():
+    window = LatencyWindow(size=100)
+    assert window.percentile(0.5) is None
+
+    for seconds in range(200):
+        window.observe(seconds)
+
+    assert len(window) == 100
+    assert window.percentile(0) == 100
+    assert window.percentile(0.5) == 150
+    assert window.percentile(0.99) == 199
+    assert window.percentile(1) == 199
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        Hedger(SearchBudget(1), mode="always")
+
+
+def test_deadline_waits_for_enough_samples():
+    hedger = Hedger(SearchBudget(1), mode="deadline", percentile=0.5)
+    for _ in range(MIN_SAMPLES - 1):
+        hedger.latency.observe(2.0)
+    assert hedger.deadline() is None
+
+    hedger.latency.observe(2.0)
+    assert hedger.deadline() == 2.0
+    assert Hedger(SearchBudget(1), mode="parallel").deadline() == 0.0
+
+
+def test_hedge_wins_against_slow_search(release):
+    budget = SearchBudget(2)
+    hedger = Hedger(budget, mode="parallel")
+    issued = HEDGES_TOTAL.value(outcome="issued")
+    won = HEDGES_TOTAL.value(outcome="won")
+
+    result = hedger.race(search(budget, "primary", release), search(budget, "hedge"))
+
+    assert result == "hedge"
+    assert HEDGES_TOTAL.value(outcome="issued") == issued + 1
+    assert HEDGES_TOTAL.value(outcome="won") == won + 1
+
+
+def test_hedge_runs_when_primary_finds_nothing():
+    budget = SearchBudget(2)
+    hedger = Hedger(budget, mode="deadline")
+
+    assert hedger.race(search(budget, None), search(budget, "hedge")) == "hedge"
+
+
+def test_fast_search_is_not_hedged():
+    budget = SearchBudget(2)
+    hedger = Hedger(budget, mode="deadline")
+    for _ in range(MIN_SAMPLES):
+        hedger.latency.observe(1.0)
+    calls: list[str] = []
+
+    result = hedger.race(
+        search(budget, "primary", calls=calls), search(budget, "hedge", calls=calls)
+    )
+
+    assert result == "primary"
+    assert calls == ["primary"]
+
+
+def test_hedge_waiting_for_a_slot_is_abandoned():
+    budget = SearchBudget(1)
+    hedger = Hedger(budget, mode="parallel")
+    calls: list[str] = []
+    issued = HEDGES_TOTAL.value(outcome="issued")
+    abandoned = HEDGES_TOTAL.value(outcome="abandoned")
+
+    def primary():
+        # e.g. served from the search cache, without a slot
+        time.sleep(0.1)
+        return "primary"
+
+    # Another lookup holds the only slot
+    with budget.slot():
+        result = hedger.race(primary, search(budget, "hedge", calls=calls))
+
+    assert result == "primary"
+    time.sleep(0.1)
+    assert calls == []
+    # Only hedges that were sent count as issued
+    assert HEDGES_TOTAL.value(outcome="issued") == issued
+    assert HEDGES_TOTAL.value(outcome="abandoned") == abandoned + 1
+
+
+def test_error_is_raised_when_both_searches_fail():
+    budget = SearchBudget(2)
+    hedger = Hedger(budget, mode="parallel")
+
+    def fail():
+        raise RuntimeError("search failed")
+
+    with pytest.raises(RuntimeError, match="search failed"):
+        hedger.race(fail, fail)
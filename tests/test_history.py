@@ -0,0 +1,91 @@
+import pytest
+from flask import Flask
+
+from src import db
+from src.downloader import SPILL_BATCH
+from src.spotify import Track
+from src.status import DownloadStatus
+
+
+def make_tracks(count: int, job_id: str | None = None) -> list[Track]:
+    return [
+        Track(artist="Artist", title=f"Title {i}", folder="", job_id=job_id)
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def spilled(downloader, monkeypatch):
+    """
+    Get a downloader whose first SPILL_BATCH tracks were moved to the history
+    """
+    monkeypatch.setattr(downloader.config, "history_window", 0)
+    tracks = make_tracks(SPILL_BATCH + 10, job_id="job")
+    for track in tracks[:SPILL_BATCH]:
+        track.status = DownloadStatus.PROCESSING_COMPLETE
+    for track in tracks[SPILL_BATCH:]:
+        track.status = DownloadStatus.QUEUED
+    tracks[1].status = DownloadStatus.DOWNLOAD_FAILED
+    downloader.download_list = list(tracks)
+    downloader._spill_finished()
+    return downloader, tracks
+
+
+def test_oldest_finished_tracks_leave_memory(spilled):
+    downloader, tracks = spilled
+
+    assert downloader.download_list == tracks[SPILL_BATCH:]
+    assert downloader.get_track(tracks[0].id) is None
+
+
+def test_pages_span_history_and_memory(spilled):
+    downloader, tracks = spilled
+
+    total, page = downloader.query_tracks(offset=SPILL_BATCH - 5, limit=10)
+
+    assert total == len(tracks)
+    assert [track.id for track in page] == [
+        track.id for track in tracks[SPILL_BATCH - 5 : SPILL_BATCH + 5]
+    ]
+
+
+def test_status_pages_read_the_history(spilled):
+    downloader, tracks = spilled
+
+    total, page = downloader.query_tracks(status="Download Failed")
+
+    assert total == 1
+    assert [track.id for track in page] == [tracks[1].id]
+
+
+def test_job_counts_include_the_history(spilled):
+    downloader, tracks = spilled
+
+    counts = downloader.job_status_counts("job")
+
+    assert counts["Processing Complete"] == SPILL_BATCH - 1
+    assert counts["Download Failed"] == 1
+    assert counts["Queued"] == 10
+    assert len(downloader.job_tracks("job")) == len(tracks)
+
+
+def test_ensure_db_adds_missing_tables_and_keeps_data(tmp_path):
+    app = Flask("src")
+    db.configure(str(tmp_path / "old.sqlite"))
+    with app.app_context():
+        with db.get_pool().transaction() as conn:
+            conn.execute(
+                "CREATE TABLE track_queue (id INTEGER PRIMARY KEY, "
+                "track_id TEXT NOT NULL, status TEXT NOT NULL, created TIMESTAMP)"
+            )
+            conn.execute("CREATE TABLE aliases (alias TEXT PRIMARY KEY, artist TEXT)")
+            conn.execute("INSERT INTO aliases VALUES ('alias', 'Artist')")
+
+        db.ensure_db()
+
+        names = {row["name"] for row in db.query_db("SELECT name FROM sqlite_master")}
+        assert {"downloads", "track_history", "track_history_job"} <= names
+        assert db.query_db("SELECT artist FROM aliases", one=True)["artist"] == (
+            "Artist"
+        )
+    db.get_pool().close()
@@ -0,0 +1,61 @@
+import pytest
+
+from src import lookahead
+from src.hedging import LatencyWindow
+from src.lookahead import MIN_SAMPLES, Lookahead
+
+
+def latencies(seconds: float, count: int = MIN_SAMPLES) -> LatencyWindow:
+    window = LatencyWindow()
+    for _ in range(count):
+        window.observe(seconds)
+    return window
+
+
+@pytest.fixture(autouse=True)
+def no_caching(monkeypatch):
+    monkeypatch.setattr(lookahead, "REFRESH_SECONDS", 0)
+
+
+def test_maximum_until_enough_samples():
+    window = Lookahead(16, latencies(1.0, MIN_SAMPLES - 1), latencies(10.0))
+
+    assert window.window(4) == 16
+
+
+def test_window_covers_searches_at_the_download_rate():
+    # One ready track per worker, plus ceil(4 * 2 / 10) searches in flight
+    window = Lookahead(16, latencies(2.0), latencies(10.0))
+
+    assert window.window(4) == 5
+
+
+def test_slow_searches_widen_the_window_up_to_the_maximum():
+    assert Lookahead(16, latencies(5.0), latencies(10.0)).window(4) == 6
+    assert Lookahead(16, latencies(60.0), latencies(10.0)).window(4) == 16
+
+
+def test_window_never_drops_below_the_workers():
+    assert Lookahead(2, latencies(1.0), latencies(10.0)).window(4) == 4
+
+
+def test_window_is_sized_for_slow_searches():
+    searches = latencies(1.0, 90)
+    for _ in range(10):
+        searches.observe(10.0)
+
+    # The 90th percentile, not the median, of the search times
+    assert Lookahead(64, searches, latencies(10.0)).window(4) == 8
+
+
+def test_window_is_cached_for_the_same_workers(monkeypatch):
+    monkeypatch.setattr(lookahead, "REFRESH_SECONDS", 60)
+    searches = latencies(2.0)
+    window = Lookahead(16, searches, latencies(10.0))
+    assert window.window(4) == 5
+
+    for _ in range(100):
+        searches.observe(50.0)
+
+    assert window.window(4) == 5
+    assert window.window(2) == 12
@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+from src.pool import WorkerPool
+
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(2, name="test")
+    yield pool
+    pool.shutdown()
+
+
+def blocking_tasks(pool: WorkerPool, count: int):
+    gate = threading.Event()
+    futures = [pool.submit(gate.wait) for _ in range(count)]
+    return gate, futures
+
+
+def test_tasks_run_on_at_most_size_workers(pool):
+    gate, futures = blocking_tasks(pool, 4)
+
+    wait_until(lambda: pool.busy == 2)
+    assert pool.pending == 2
+
+    gate.set()
+    assert all(future.result(timeout=5) for future in futures)
+
+
+def test_growing_starts_workers_for_pending_tasks(pool):
+    gate, futures = blocking_tasks(pool, 4)
+    wait_until(lambda: pool.busy == 2)
+
+    pool.resize(4)
+
+    wait_until(lambda: pool.busy == 4)
+    assert pool.pending == 0
+    gate.set()
+
+
+def test_shrinking_lets_running_tasks_finish(pool):
+    gate, futures = blocking_tasks(pool, 2)
+    wait_until(lambda: pool.busy == 2)
+
+    pool.resize(1)
+
+    assert not any(future.done() for future in futures)
+    gate.set()
+    assert all(future.result(timeout=5) for future in futures)
+    wait_until(lambda: pool.workers == 1)
+
+
+def test_exceptions_are_set_on_the_future(pool):
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        pool.submit(fail).result(timeout=5)
+    assert pool.submit(lambda: 1).result(timeout=5) == 1
+
+
+def test_submit_after_shutdown_raises(pool):
+    pool.shutdown()
+
+    with pytest.raises(RuntimeError):
+        pool.submit(lambda: None)
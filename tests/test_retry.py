@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from src import retry
+from src.retry import RetryScheduler, is_permanent
+from src.spotify import Track
+
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def track():
+    return Track(artist="Artist", title="Title", folder="")
+
+
+@pytest.fixture
+def runs():
+    """
+    Record the retries run by a scheduler
+    """
+    return []
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "ERROR: [youtube] abc: Video unavailable",
+        "ERROR: [youtube] abc: Private video. Sign in if you've been granted access",
+        "ERROR: [youtube] abc: Sign in to confirm your age",
+        "ERROR: [youtube] abc: This video is not available in your country",
+    ],
+)
+def test_permanent_failures(message):
+    assert is_permanent(Exception(message))
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "HTTP Error 429: Too Many Requests",
+        "HTTP Error 503: Service Unavailable",
+        "The read operation timed out",
+        "[Errno 104] Connection reset by peer",
+    ],
+)
+def test_transient_failures(message):
+    assert not is_permanent(Exception(message))
+
+
+def test_backoff_doubles_up_to_the_cap(monkeypatch):
+    scheduler = RetryScheduler(lambda *_: None, base_delay=1, max_delay=10)
+
+    monkeypatch.setattr(retry.random, "uniform", lambda low, high: high)
+    assert [scheduler.delay(n) for n in range(1, 6)] == [1, 2, 4, 8, 10]
+
+    monkeypatch.setattr(retry.random, "uniform", lambda low, high: low)
+    assert [scheduler.delay(n) for n in range(1, 6)] == [0.5, 1, 2, 4, 5]
+
+
+def test_transient_failure_is_retried_after_the_backoff(track, runs):
+    scheduler = RetryScheduler(lambda *args: runs.append(args), base_delay=0.2)
+
+    scheduled = time.monotonic()
+    assert scheduler.schedule(track, Exception("HTTP Error 503"), "link")
+
+    wait_until(lambda: runs)
+    assert time.monotonic() - scheduled >= 0.1
+    assert runs == [(track, "link")]
+
+
+def test_permanent_failure_is_not_retried(track, runs):
+    scheduler = RetryScheduler(lambda *args: runs.append(args), base_delay=0)
+
+    assert not scheduler.schedule(track, Exception("Video unavailable"))
+    assert scheduler.pending == 0
+
+
+def test_gives_up_after_the_last_attempt(track, runs):
+    scheduler = RetryScheduler(
+        lambda *args: runs.append(args), max_attempts=2, base_delay=60
+    )
+    error = Exception("HTTP Error 503")
+
+    assert scheduler.schedule(track, error)
+    assert scheduler.schedule(track, error)
+    assert not scheduler.schedule(track, error)
+    assert not runs
+
+
+def test_due_retries_wait_for_idle_workers(monkeypatch, track, runs):
+    monkeypatch.setattr(retry, "IDLE_CHECK_SECONDS", 0.01)
+    idle = threading.Event()
+    scheduler = RetryScheduler(
+        lambda *args: runs.append(args), idle=idle.is_set, base_delay=0
+    )
+
+    scheduler.schedule(track, Exception("HTTP Error 503"))
+    time.sleep(0.1)
+    assert not runs
+
+    idle.set()
+    wait_until(lambda: runs)
+
+
+def test_clear_drops_scheduled_retries(track, runs):
+    scheduler = RetryScheduler(lambda *args: runs.append(args), base_delay=60)
+    scheduler.schedule(track, Exception("HTTP Error 503"))
+
+    scheduler.clear()
+
+    assert scheduler.pending == 0
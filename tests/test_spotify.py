@@ -0,0 +1,103 @@
+import pytest
+
+from src.resolver import ResolutionEngine
+from src.spotify import SpotifyHandler
+
+
+class FakeSpotify:
+    """
+    Serves a playlist of numbered tracks, failing the pages asked for
+    """
+
+    def __init__(self, total: int, failing: tuple[int, ...] = ()):
+        self.total = total
+        self.failing = failing
+
+    def playlist(self, link):
+        return {"name": "Playlist", "tracks": {"total": self.total}}
+
+    def playlist_items(self, link, fields, limit, offset):
+        if offset in self.failing:
+            raise RuntimeError(f"Page at {offset} failed")
+        return {
+            "items": [
+                {
+                    "added_at": f"2024-01-01T00:00:{position:05d}",
+                    "track": {"name": f"Title {position}", "artists": [{"name": "A"}]},
+                }
+                for position in range(offset, min(offset + limit, self.total))
+            ]
+        }
+
+
+@pytest.fixture
+def handler(monkeypatch, config):
+    clients = {}
+    monkeypatch.setattr(SpotifyHandler, "sp", property(lambda self: clients["sp"]))
+    monkeypatch.setattr(
+        SpotifyHandler, "sp_anon", property(lambda self: clients["anon"])
+    )
+    handler = SpotifyHandler(ResolutionEngine(4, backend="asyncio"))
+    handler.clients = clients
+    return handler
+
+
+def test_playlist_pages_are_joined_in_order(handler):
+    handler.clients["sp"] = FakeSpotify(250)
+    handler.clients["anon"] = FakeSpotify(250)
+
+    tracks = handler._extract_tracks_from_playlist("link")
+
+    assert [track.title for track in tracks] == [f"Title {i}" for i in range(250)]
+
+
+def test_page_fetched_anonymously_when_authenticated_fetch_fails(handler):
+    handler.clients["sp"] = FakeSpotify(250, failing=(100,))
+    handler.clients["anon"] = FakeSpotify(250)
+
+    tracks = handler._extract_tracks_from_playlist("link")
+
+    assert len(tracks) == 250
+
+
+def test_failed_playlist_page_is_raised(handler):
+    handler.clients["sp"] = FakeSpotify(250, failing=(100,))
+    handler.clients["anon"] = FakeSpotify(250, failing=(100,))
+
+    with pytest.raises(RuntimeError, match="Page at 100 failed"):
+        handler._extract_tracks_from_playlist("link")
+
+
+class FakeArtist:
+    """
+    Serves an artist whose single is also on their album
+    """
+
+    albums = {
+        "album": ("Album", ["Song", "Other Song"]),
+        "single": ("Single", ["Song"]),
+    }
+
+    def artist(self, link):
+        return {"name": "Artist"}
+
+    def artist_albums(self, link, include_groups, limit, offset):
+        return {"items": [{"id": album_id} for album_id in self.albums], "next": None}
+
+    def album(self, album_id):
+        return {"name": self.albums[album_id][0], "release_date": "2024"}
+
+    def album_tracks(self, album_id):
+        titles = self.albums[album_id][1]
+        return {"items": [{"name": t, "artists": [{"name": "A"}]} for t in titles]}
+
+
+def test_artist_tracks_are_deduplicated_per_extraction(handler, monkeypatch):
+    monkeypatch.setattr(handler.config, "artist_track_selection", "all")
+    handler.clients["sp"] = FakeArtist()
+
+    first = handler._extract_tracks_from_artist("link")
+    again = handler._extract_tracks_from_artist("link")
+
+    assert sorted(track.title for track in first) == ["Other Song", "Song"]
+    assert sorted(track.title for track in again) == ["Other Song", "Song"]
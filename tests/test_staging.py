@@ -0,0 +1,50 @@
+import os
+import threading
+
+import pytest
+
+from src.staging import STAGING_PREFIX, StagingArea
+
+MIB = 1024 * 1024
+
+
+def staging_area(path) -> StagingArea:
+    return StagingArea(
+        str(path), max_bytes=64 * MIB, min_free_bytes=0, estimate_bytes=MIB
+    )
+
+
+@pytest.fixture
+def running():
+    return threading.Event()
+
+
+def test_download_directory_is_removed_on_exit(tmp_path, running):
+    staging = staging_area(tmp_path)
+
+    with staging.reserve(running) as path:
+        assert os.path.isdir(path)
+        assert staging.reserved == MIB
+
+    assert not os.path.exists(path)
+    assert staging.reserved == 0
+
+
+def test_leftovers_of_a_previous_run_are_removed(tmp_path, running):
+    leftover = tmp_path / f"{STAGING_PREFIX}crashed"
+    leftover.mkdir()
+    (leftover / "song.webm.part").write_bytes(b"partial")
+
+    with staging_area(tmp_path).reserve(running):
+        assert not leftover.exists()
+
+
+def test_directories_of_running_processes_are_kept(tmp_path, running):
+    # Owner locks are per open file, so another area stands in for a process
+    web = staging_area(tmp_path)
+    sync = staging_area(tmp_path)
+
+    with web.reserve(running) as web_download:
+        with sync.reserve(running) as sync_download:
+            assert os.path.isdir(web_download)
+            assert os.path.isdir(sync_download)